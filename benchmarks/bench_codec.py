@@ -0,0 +1,174 @@
+"""
+Encode/decode throughput and peak allocated memory of the entity codec.
+
+Compares the hand-written codec in `entities/codec.py` and the command
+(de)serialization in `entities/commands.py` against the previous
+`dataclasses_json`/`dataclasses.asdict` based implementation.
+
+Run from the repository root: `python -m benchmarks.bench_codec`
+"""
+
+import argparse
+import json
+import timeit
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict
+from typing import Any
+
+from custom_components.casambi_mqtt.entities.codec import (
+    decode_scene,
+    decode_unit,
+    decode_unit_status,
+    encode_scene,
+    encode_unit,
+    encode_unit_status,
+)
+from custom_components.casambi_mqtt.entities.commands import (
+    BaseCommand,
+    Batch,
+    SetLevel,
+)
+from custom_components.casambi_mqtt.entities.entities import (
+    Scene,
+    Unit,
+    UnitControl,
+    UnitControlType,
+    UnitState,
+    UnitType,
+)
+
+
+def sample_unit() -> Unit:
+    return Unit(
+        "aa:bb:cc:dd:ee:01",
+        12,
+        is_on=True,
+        name="Kitchen spot 1",
+        online=True,
+        state=UnitState(180),
+        uuid="0123456789abcdef",
+        unit_type=UnitType(
+            4711,
+            "Casambi",
+            "Dim + Tunable white",
+            "CBU-TED",
+            3,
+            [
+                UnitControl(0, 8, 0, readonly=False, type=UnitControlType("DIMMER", 0)),
+                UnitControl(
+                    0, 8, 8, readonly=False, type=UnitControlType("TEMPERATURE", 3)
+                ),
+                UnitControl(0, 1, 16, readonly=True, type=UnitControlType("ONOFF", 7)),
+            ],
+        ),
+    )
+
+
+def legacy_command_to_json(command: BaseCommand) -> str:
+    data = asdict(command)
+    data.update({"action": command._action()})  # noqa: SLF001
+    return json.dumps(data)
+
+
+def legacy_command_from_json(cls: type[BaseCommand], json_str: str) -> BaseCommand:
+    data = json.loads(json_str)
+    fields = {f.name for f in cls.__dataclass_fields__.values()}
+    return cls(**{key: value for key, value in data.items() if key in fields})
+
+
+def measure(fn: Callable[[], Any], number: int) -> tuple[float, int]:
+    """Return (operations per second, peak bytes allocated by one operation)."""
+    seconds = min(timeit.repeat(fn, number=number, repeat=3))
+    tracemalloc.start()
+    fn()
+    tracemalloc.reset_peak()
+    current, _ = tracemalloc.get_traced_memory()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return number / seconds, peak - current
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--number", type=int, default=20_000)
+    args = parser.parse_args()
+
+    unit = sample_unit()
+    unit_json = unit.to_json()
+    status_json = encode_unit_status(unit.status())
+    scene = Scene(3, "Evening")
+    scene_json = scene.to_json()
+    set_level = SetLevel("aa:bb:cc:dd:ee:01", 128)
+    batch = Batch(values={f"aa:bb:cc:dd:ee:{i:02x}": i for i in range(40)})
+
+    # The codec must not change the wire format.
+    assert encode_unit(unit) == unit_json  # noqa: S101
+    assert decode_unit(unit_json) == Unit.from_json(unit_json)  # noqa: S101
+    assert encode_scene(scene) == scene_json  # noqa: S101
+    # Unset optional command fields are left out of the payload.
+    for command in (set_level, batch):
+        legacy = json.loads(legacy_command_to_json(command))
+        current = json.loads(command.to_json())
+        assert current == {k: v for k, v in legacy.items() if k in current}  # noqa: S101
+        assert all(legacy[k] is None for k in legacy.keys() - current.keys())  # noqa: S101
+
+    print(  # noqa: T201
+        f"State event payload: {len(unit_json)} bytes as full unit, "
+        f"{len(status_json)} bytes as status\n"
+    )
+
+    cases: list[tuple[str, Callable[[], Any], Callable[[], Any]]] = [
+        ("Unit encode", unit.to_json, lambda: encode_unit(unit)),
+        (
+            "Unit decode",
+            lambda: Unit.from_json(unit_json),
+            lambda: decode_unit(unit_json),
+        ),
+        ("Scene encode", scene.to_json, lambda: encode_scene(scene)),
+        (
+            "Scene decode",
+            lambda: Scene.from_json(scene_json),
+            lambda: decode_scene(scene_json),
+        ),
+        (
+            "SetLevel encode",
+            lambda: legacy_command_to_json(set_level),
+            set_level.to_json,
+        ),
+        (
+            "SetLevel decode",
+            lambda: legacy_command_from_json(SetLevel, set_level.to_json()),
+            lambda: SetLevel.from_json(set_level.to_json()),
+        ),
+        ("Batch(40) encode", lambda: legacy_command_to_json(batch), batch.to_json),
+        # A state change used to carry the full unit, now only its status.
+        (
+            "State event enc.",
+            lambda: encode_unit(unit),
+            lambda: encode_unit_status(unit.status()),
+        ),
+        (
+            "State event dec.",
+            lambda: decode_unit(unit_json),
+            lambda: decode_unit_status(status_json),
+        ),
+    ]
+
+    print(  # noqa: T201
+        f"{'case':<18}{'before ops/s':>14}{'after ops/s':>14}{'speedup':>9}"
+        f"{'before bytes':>14}{'after bytes':>13}"
+    )
+    for name, before, after in cases:
+        before_ops, before_bytes = measure(before, args.number)
+        after_ops, after_bytes = measure(after, args.number)
+        print(  # noqa: T201
+            f"{name:<18}{before_ops:>14,.0f}{after_ops:>14,.0f}"
+            f"{after_ops / before_ops:>8.1f}x"
+            f"{before_bytes:>14,}{after_bytes:>13,}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Payload size and encode/decode throughput of JSON versus MessagePack.
+
+Covers the status published on every unit change, the metadata and type
+topics, the full unit and the commands.
+
+Run from the repository root: `python -m benchmarks.bench_encoding`
+"""
+
+import argparse
+import timeit
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+from benchmarks.bench_codec import sample_unit
+from custom_components.casambi_mqtt.entities.codec import (
+    decode_unit,
+    decode_unit_metadata,
+    decode_unit_status,
+    decode_unit_type,
+    encode_unit,
+    encode_unit_metadata,
+    encode_unit_status,
+    encode_unit_type,
+    pack_unit,
+    pack_unit_metadata,
+    pack_unit_status,
+    pack_unit_type,
+)
+from custom_components.casambi_mqtt.entities.commands import (
+    Batch,
+    SetLevel,
+)
+
+
+def ops_per_second(fn: Callable[[], Any], number: int) -> float:
+    return number / min(timeit.repeat(fn, number=number, repeat=3))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", "--number", type=int, default=20_000)
+    args = parser.parse_args()
+
+    unit = sample_unit()
+    set_level = SetLevel("aa:bb:cc:dd:ee:01", 128, correlation_id="c0ffee01")
+    batch = Batch(values={f"aa:bb:cc:dd:ee:{i:02x}": i for i in range(40)})
+
+    cases: list[tuple[str, Callable[[], Any], Callable[[], Any], Callable]] = [
+        (
+            "Unit status",
+            lambda: encode_unit_status(unit.status()),
+            lambda: pack_unit_status(unit.status()),
+            decode_unit_status,
+        ),
+        (
+            "Unit metadata",
+            lambda: encode_unit_metadata(unit.metadata()),
+            lambda: pack_unit_metadata(unit.metadata()),
+            decode_unit_metadata,
+        ),
+        (
+            "Unit type",
+            lambda: encode_unit_type(unit.unit_type),
+            lambda: pack_unit_type(unit.unit_type),
+            decode_unit_type,
+        ),
+        ("Full unit", lambda: encode_unit(unit), lambda: pack_unit(unit), decode_unit),
+        ("SetLevel", set_level.to_json, set_level.to_msgpack, SetLevel.from_json),
+        ("Batch(40)", batch.to_json, batch.to_msgpack, Batch.from_json),
+    ]
+
+    print(  # noqa: T201
+        f"{'payload':<15}{'json B':>8}{'msgpack B':>11}{'saved':>7}"
+        f"{'json enc/s':>13}{'msgpack enc/s':>15}"
+        f"{'json dec/s':>13}{'msgpack dec/s':>15}"
+    )
+    for name, encode_json, encode_msgpack, decode in cases:
+        as_json = encode_json()
+        as_msgpack = encode_msgpack()
+        # Both encodings must decode to the same value.
+        assert decode(as_json) == decode(as_msgpack)  # noqa: S101
+        json_size = len(as_json.encode())
+        print(  # noqa: T201
+            f"{name:<15}{json_size:>8}{len(as_msgpack):>11}"
+            f"{1 - len(as_msgpack) / json_size:>7.0%}"
+            f"{ops_per_second(encode_json, args.number):>13,.0f}"
+            f"{ops_per_second(encode_msgpack, args.number):>15,.0f}"
+            f"{ops_per_second(partial(decode, as_json), args.number):>13,.0f}"
+            f"{ops_per_second(partial(decode, as_msgpack), args.number):>15,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Minimal MQTT 3.1.1 broker, a stand-in for a real broker in load tests.
+
+It supports what the server and the load test client use: CONNECT,
+SUBSCRIBE/UNSUBSCRIBE with `+` and `#` wildcards, retained messages and
+PUBLISH at QoS 0 and 1. Messages are delivered to subscribers at QoS 0.
+There is no authentication, persistence or session state.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import struct
+from dataclasses import dataclass, field
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or level not in ("+", topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body
+
+
+def _string(data: bytes, offset: int) -> tuple[str, int]:
+    (length,) = struct.unpack_from("!H", data, offset)
+    end = offset + 2 + length
+    return data[offset + 2 : end].decode(), end
+
+
+@dataclass(eq=False)
+class _Session:
+    writer: asyncio.StreamWriter
+    filters: set[str] = field(default_factory=set)
+
+
+class Broker:
+    """Routes messages between the clients connected to it."""
+
+    def __init__(self) -> None:
+        self._sessions: set[_Session] = set()
+        self._retained: dict[str, bytes] = {}
+        self._server: asyncio.Server | None = None
+        self.port = 0
+        self.received = 0
+        self.delivered = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._serve, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for session in list(self._sessions):
+            session.writer.close()
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        session = _Session(writer)
+        self._sessions.add(session)
+        try:
+            while True:
+                header = await reader.readexactly(1)
+                length = 0
+                for shift in range(0, 28, 7):
+                    byte = (await reader.readexactly(1))[0]
+                    length |= (byte & 0x7F) << shift
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                if not self._handle(session, header[0] >> 4, header[0] & 0x0F, body):
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._sessions.discard(session)
+            writer.close()
+
+    def _handle(
+        self, session: _Session, packet_type: int, flags: int, body: bytes
+    ) -> bool:
+        if packet_type == CONNECT:
+            session.writer.write(_packet(CONNACK, 0, b"\x00\x00"))
+        elif packet_type == PUBLISH:
+            topic, offset = _string(body, 0)
+            if (flags >> 1) & 0x03:
+                session.writer.write(_packet(PUBACK, 0, body[offset : offset + 2]))
+                offset += 2
+            self._publish(topic, body[offset:], retain=bool(flags & 0x01))
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, bytearray()
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                offset += 1  # Requested QoS, always granted as 0.
+                session.filters.add(topic_filter)
+                granted.append(0)
+            session.writer.write(_packet(SUBACK, 0, packet_id + granted))
+            for topic, payload in self._retained.items():
+                if any(topic_matches(f, topic) for f in session.filters):
+                    self._deliver(session, topic, payload, retain=True)
+        elif packet_type == UNSUBSCRIBE:
+            offset = 2
+            while offset < len(body):
+                topic_filter, offset = _string(body, offset)
+                session.filters.discard(topic_filter)
+            session.writer.write(_packet(UNSUBACK, 0, body[:2]))
+        elif packet_type == PINGREQ:
+            session.writer.write(_packet(PINGRESP, 0, b""))
+        elif packet_type == DISCONNECT:
+            return False
+        return True
+
+    def _publish(self, topic: str, payload: bytes, *, retain: bool) -> None:
+        self.received += 1
+        if retain:
+            if payload:
+                self._retained[topic] = payload
+            else:
+                self._retained.pop(topic, None)
+        for session in self._sessions:
+            if any(topic_matches(f, topic) for f in session.filters):
+                self._deliver(session, topic, payload, retain=False)
+
+    def _deliver(
+        self, session: _Session, topic: str, payload: bytes, *, retain: bool
+    ) -> None:
+        self.delivered += 1
+        encoded = topic.encode()
+        body = struct.pack("!H", len(encoded)) + encoded + payload
+        session.writer.write(_packet(PUBLISH, int(retain), body))
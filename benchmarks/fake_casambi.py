@@ -0,0 +1,162 @@
+"""
+Simulated Casambi network for load tests, no Bluetooth needed.
+
+`FakeCasambi` has the parts of the `CasambiBt.Casambi` API the server uses
+and holds real `CasambiBt` units, groups and scenes. Every operation takes a
+configurable latency with random jitter, and operations are serialized like
+writes over a single Bluetooth link. Once an operation completes the units
+it changed report their new state to the unit changed handlers, like the
+library does when the network sends its state notifications.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+from typing import TYPE_CHECKING
+
+from CasambiBt import Group, Scene, Unit, UnitControl, UnitControlType, UnitType
+from CasambiBt import UnitState as BtUnitState
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
+
+DIMMABLE = UnitType(
+    1,
+    "Fake dimmer",
+    "Casambi",
+    "Dimmer",
+    1,
+    [UnitControl(UnitControlType.DIMMER, 0, 8, 0, readonly=False)],
+)
+
+
+class FakeCasambi:
+    """
+    A network of `units` dimmable units and `scenes` scenes.
+
+    An operation takes `latency` seconds, plus or minus up to `jitter`, and
+    its state notifications arrive `notify_delay` seconds after it completes.
+    Each scene sets a random quarter of the units to a random level.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        units: int = 50,
+        scenes: int = 10,
+        *,
+        latency: float = 0.03,
+        jitter: float = 0.01,
+        notify_delay: float = 0.005,
+        seed: int = 0,
+    ) -> None:
+        self._random = random.Random(seed)  # noqa: S311
+        self._latency = latency
+        self._jitter = jitter
+        self._notify_delay = notify_delay
+        self._units = [self._unit(i) for i in range(units)]
+        self._by_address = {unit.address: unit for unit in self._units}
+        self._groups = [Group(1, "All units", list(self._units))]
+        self._scenes = [Scene(i, f"Scene {i}") for i in range(scenes)]
+        self._scene_levels = {
+            scene.sceneId: {
+                unit.address: self._random.randrange(256)
+                for unit in self._random.sample(self._units, max(1, units // 4))
+            }
+            for scene in self._scenes
+        }
+        self._last_level = {unit.address: 255 for unit in self._units}
+        self._handlers: list[Callable[[Unit], None]] = []
+        self._disconnect_callbacks: list[Callable[[], None]] = []
+        self._link = asyncio.Lock()
+        self._connected = False
+        self.operations = 0
+
+    @staticmethod
+    def _unit(i: int) -> Unit:
+        # Like real units, there is no state until the first notification.
+        return Unit(
+            DIMMABLE.id,
+            i + 1,
+            f"{i:032x}",
+            f"fa:ce:00:00:{i // 256:02x}:{i % 256:02x}",
+            f"Fake light {i}",
+            "1.0",
+            DIMMABLE,
+            _on=True,
+            _online=True,
+        )
+
+    @property
+    def units(self) -> list[Unit]:
+        return self._units
+
+    @property
+    def groups(self) -> list[Group]:
+        return self._groups
+
+    @property
+    def scenes(self) -> list[Scene]:
+        return self._scenes
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    async def connect(self, addr_or_device: object, password: str) -> None:
+        await asyncio.sleep(self._latency)
+        self._connected = True
+
+    async def disconnect(self) -> None:
+        if self._connected:
+            self._connected = False
+            for callback in self._disconnect_callbacks:
+                callback()
+
+    def registerUnitChangedHandler(self, handler: Callable[[Unit], None]) -> None:  # noqa: N802
+        self._handlers.append(handler)
+
+    def unregisterUnitChangedHandler(  # noqa: N802
+        self, handler: Callable[[Unit], None]
+    ) -> None:
+        self._handlers.remove(handler)
+
+    def registerDisconnectCallback(self, callback: Callable[[], None]) -> None:  # noqa: N802
+        self._disconnect_callbacks.append(callback)
+
+    async def setLevel(self, target: Unit | Group | None, level: int) -> None:  # noqa: N802
+        await self._operate({u.address: level for u in self._targets(target)})
+
+    async def turnOn(self, target: Unit | Group | None) -> None:  # noqa: N802
+        await self._operate(
+            {u.address: self._last_level[u.address] for u in self._targets(target)}
+        )
+
+    async def switchToScene(self, target: Scene, level: int = 0xFF) -> None:  # noqa: N802
+        levels = self._scene_levels[target.sceneId]
+        await self._operate({a: v * level // 0xFF for a, v in levels.items()})
+
+    def _targets(self, target: Unit | Group | None) -> Iterable[Unit]:
+        if target is None:
+            return self._units
+        if isinstance(target, Group):
+            return target.units
+        return [target]
+
+    async def _operate(self, levels: dict[str, int]) -> None:
+        delay = self._latency + self._random.uniform(-self._jitter, self._jitter)
+        async with self._link:
+            await asyncio.sleep(max(0.0, delay))
+            self.operations += 1
+        asyncio.get_running_loop().call_later(self._notify_delay, self._notify, levels)
+
+    def _notify(self, levels: dict[str, int]) -> None:
+        for address, level in levels.items():
+            unit = self._by_address[address]
+            if unit.state is None:
+                unit._state = BtUnitState()  # noqa: SLF001
+            unit.state.dimmer = level
+            if level > 0:
+                self._last_level[address] = level
+            for handler in list(self._handlers):
+                handler(unit)
@@ -0,0 +1,247 @@
+"""
+Load test of the bridge server against a simulated Casambi network.
+
+The server's command handling runs unchanged, connected to a fake Casambi
+network (`fake_casambi.py`) and a local MQTT broker stand-in (`broker.py`),
+so it runs offline without Bluetooth hardware. A client plays the part of
+Home Assistant and sends one of these workloads:
+
+- `slider`: several lights dragged at the same time, a level per step
+- `scenes`: scenes switched in quick succession
+- `reload`: the reload button pressed repeatedly, each a full snapshot
+
+Every command carries a correlation id. The latency is measured from sending
+a command to receiving its ack, which the server sends once the targeted
+units reported their change.
+
+Run from the repository root: `python -m benchmarks.load_test --workload slider`
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import resource
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+
+import aiomqtt
+import CasambiBt
+
+import server
+from custom_components.casambi_mqtt.entities.commands import (
+    BaseCommand,
+    PublishEntities,
+    SetLevel,
+    SetScene,
+)
+
+from .broker import Broker
+from .fake_casambi import FakeCasambi
+
+BASE_TOPIC = f"{server.TOPIC_PREFIX}/{server.NETWORK_NAME}"
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class LoadClient:
+    """Sends commands like Home Assistant does and matches their acks."""
+
+    def __init__(self, client: aiomqtt.Client) -> None:
+        self._client = client
+        self._ids = itertools.count()
+        self._sent: dict[str, float] = {}
+        self._done = asyncio.Event()
+        self.latencies: list[float] = []
+        self.statuses: Counter[str] = Counter()
+        self.events = 0
+        self.first_sent = 0.0
+        self.last_acked = 0.0
+
+    async def send(self, command: BaseCommand) -> None:
+        command.correlation_id = str(next(self._ids))
+        now = time.perf_counter()
+        self.first_sent = self.first_sent or now
+        self._sent[command.correlation_id] = now
+        self._done.clear()
+        await self._client.publish(f"{BASE_TOPIC}/commands", command.to_json(), qos=1)
+
+    async def receive(self) -> None:
+        async for message in self._client.messages:
+            if message.topic.matches(f"{BASE_TOPIC}/acks"):
+                self._ack(json.loads(message.payload))
+            else:
+                self.events += 1
+
+    def _ack(self, ack: dict) -> None:
+        sent = self._sent.pop(ack["correlation_id"], None)
+        if sent is None:
+            return
+        self.last_acked = time.perf_counter()
+        self.statuses[ack["status"]] += 1
+        if ack["status"] == "OK":
+            self.latencies.append(self.last_acked - sent)
+        if not self._sent:
+            self._done.set()
+
+    async def wait_for_acks(self, limit: float) -> None:
+        try:
+            await asyncio.wait_for(self._done.wait(), limit)
+        except TimeoutError:
+            self.statuses["NO ACK"] += len(self._sent)
+
+
+async def slider(load: LoadClient, casa: FakeCasambi, args: argparse.Namespace) -> None:
+    async def drag(unit: CasambiBt.Unit) -> None:
+        for step in range(1, args.steps + 1):
+            await load.send(SetLevel(unit.address, 255 * step // args.steps))
+            await asyncio.sleep(args.interval)
+
+    units = casa.units[: args.concurrency]
+    for _ in range(args.repeat):
+        await asyncio.gather(*(drag(unit) for unit in units))
+
+
+async def scenes(load: LoadClient, casa: FakeCasambi, args: argparse.Namespace) -> None:
+    for i in range(args.commands):
+        await load.send(SetScene(casa.scenes[i % len(casa.scenes)].sceneId))
+        await asyncio.sleep(args.interval)
+
+
+async def reload(load: LoadClient, casa: FakeCasambi, args: argparse.Namespace) -> None:
+    for _ in range(args.commands):
+        await load.send(PublishEntities(snapshot=True))
+        await asyncio.sleep(args.interval)
+
+
+WORKLOADS: dict[
+    str, Callable[[LoadClient, FakeCasambi, argparse.Namespace], Awaitable[None]]
+] = {
+    "slider": slider,
+    "scenes": scenes,
+    "reload": reload,
+}
+
+
+async def run_server(
+    ctx: server.Context, client: aiomqtt.Client, ready: asyncio.Event
+) -> None:
+    """Run the command loop of `server.main`, without discovery and reconnects."""
+    ctx.load()
+    commands = asyncio.create_task(server.serve_commands(ctx))
+    try:
+        async with client:
+            await client.subscribe(ctx.topic("commands"))
+            ctx.casa.registerUnitChangedHandler(ctx.on_unit_changed)
+            ready.set()
+            async for message in client.messages:
+                server.route_command({ctx.name: ctx}, message)
+    finally:
+        ctx.casa.unregisterUnitChangedHandler(ctx.on_unit_changed)
+        commands.cancel()
+        ctx.tracer.close()
+        await ctx.dispatcher.close()
+        await ctx.publisher.close()
+
+
+async def run(args: argparse.Namespace) -> None:
+    broker = Broker()
+    await broker.start()
+    casa = FakeCasambi(
+        args.units, args.scenes, latency=args.latency, jitter=args.jitter
+    )
+    await casa.connect("fake", "")
+
+    server_client = aiomqtt.Client("127.0.0.1", port=broker.port)
+    publisher = server.create_publisher(server_client, server.create_process_metrics())
+    config = server.NetworkConfig(server.NETWORK_NAME, None, None)
+    ctx = server.create_context(config, casa, publisher)
+    ready = asyncio.Event()
+    server_task = asyncio.create_task(run_server(ctx, server_client, ready))
+    await ready.wait()
+
+    async with aiomqtt.Client("127.0.0.1", port=broker.port) as client:
+        await client.subscribe(f"{BASE_TOPIC}/acks")
+        await client.subscribe(f"{BASE_TOPIC}/state/#")
+        load = LoadClient(client)
+        receiver = asyncio.create_task(load.receive())
+        await WORKLOADS[args.workload](load, casa, args)
+        await load.wait_for_acks(args.timeout)
+        receiver.cancel()
+
+    server_task.cancel()
+    await asyncio.gather(server_task, return_exceptions=True)
+    await broker.close()
+    report(args, load, casa, ctx)
+
+
+def report(
+    args: argparse.Namespace,
+    load: LoadClient,
+    casa: FakeCasambi,
+    ctx: server.Context,
+) -> None:
+    acked = sum(n for status, n in load.statuses.items() if status != "NO ACK")
+    elapsed = max(load.last_acked - load.first_sent, 1e-9)
+    # ru_maxrss is in kilobytes on Linux.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    lines = [
+        (
+            f"Workload {args.workload}: {args.units} units, {args.scenes} scenes, "
+            f"{args.latency * 1000:.0f}±{args.jitter * 1000:.0f} ms per operation"
+        ),
+        f"  commands sent      {acked + load.statuses['NO ACK']}",
+        f"  acks               {dict(load.statuses)}",
+        f"  throughput         {acked / elapsed:.1f} commands/s",
+    ]
+    if load.latencies:
+        lines.append(
+            f"  latency p50/p99    {percentile(load.latencies, 0.5) * 1000:.1f} / "
+            f"{percentile(load.latencies, 0.99) * 1000:.1f} ms"
+        )
+    lines += [
+        f"  state events       {load.events}",
+        f"  BLE operations     {casa.operations}",
+        f"  coalesced/dropped  {ctx.dispatcher.coalesced}/{ctx.dispatcher.dropped}",
+        f"  peak memory (RSS)  {peak:.1f} MB",
+    ]
+    print("\n".join(lines))  # noqa: T201
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workload", choices=WORKLOADS, default="slider")
+    parser.add_argument("--units", type=int, default=50)
+    parser.add_argument("--scenes", type=int, default=10)
+    parser.add_argument(
+        "--latency", type=float, default=0.03, help="seconds per operation"
+    )
+    parser.add_argument("--jitter", type=float, default=0.01, help="seconds")
+    parser.add_argument(
+        "--concurrency", type=int, default=10, help="lights dragged at once"
+    )
+    parser.add_argument("--steps", type=int, default=20, help="levels per drag")
+    parser.add_argument("--repeat", type=int, default=3, help="drags per light")
+    parser.add_argument(
+        "--commands", type=int, default=100, help="scene or reload commands"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=0.02, help="seconds between commands"
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=30, help="seconds to wait for acks"
+    )
+    args = parser.parse_args()
+
+    logging.getLogger("server").setLevel(logging.WARNING)
+    logging.getLogger("casambi_server").setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
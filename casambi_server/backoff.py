@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import random
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter for reconnecting.
+
+    Most outages are short, so the first retry comes within `first` seconds.
+    After that the bound doubles from `initial` up to `maximum` seconds, and
+    every delay is drawn at random below it, so clients that lost a broker at
+    the same time do not all reconnect at once.
+    """
+
+    def __init__(
+        self, initial: float = 1.0, maximum: float = 60.0, first: float = 0.5
+    ) -> None:
+        self._initial = initial
+        self._maximum = maximum
+        self._first = first
+        self.attempts = 0
+
+    def next(self) -> float:
+        """Get the delay before the next attempt."""
+        if self.attempts == 0:
+            bound = min(self._first, self._maximum)
+        else:
+            bound = min(self._maximum, self._initial * 2 ** (self.attempts - 1))
+        self.attempts += 1
+        return random.uniform(0, bound)  # noqa: S311
+
+    def reset(self) -> None:
+        self.attempts = 0
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from custom_components.casambi_mqtt.entities.results import BatchResult
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+
+class BatchTracker:
+    """
+    Collects the per-unit outcome of the jobs a batch command was split into.
+
+    `on_done` is called with the result once every unit succeeded or failed.
+    """
+
+    # Reason recorded for units whose job was dropped before it ran.
+    DROPPED = "dropped"
+
+    def __init__(
+        self,
+        action: str,
+        addresses: list[str],
+        on_done: Callable[[BatchResult], None],
+    ) -> None:
+        self._remaining = set(addresses)
+        self._on_done = on_done
+        self.result = BatchResult(action)
+        if not self._remaining:
+            on_done(self.result)
+
+    def wrap(
+        self, addresses: list[str], run: Callable[[], Awaitable[None]]
+    ) -> Callable[[], Awaitable[None]]:
+        async def tracked() -> None:
+            try:
+                await run()
+            except Exception as e:
+                self.fail(addresses, str(e) or type(e).__name__)
+                raise
+            self.result.succeeded.extend(addresses)
+            self._finish(addresses)
+
+        return tracked
+
+    def fail(self, addresses: list[str], reason: str) -> None:
+        self.result.failed.update(dict.fromkeys(addresses, reason))
+        self._finish(addresses)
+
+    def on_dropped(self, addresses: list[str]) -> Callable[[], None]:
+        return lambda: self.fail(addresses, self.DROPPED)
+
+    def _finish(self, addresses: list[str]) -> None:
+        if not self._remaining:
+            return
+        self._remaining.difference_update(addresses)
+        if not self._remaining:
+            self._on_done(self.result)
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from custom_components.casambi_mqtt.entities.codec import unit_from_dict, unit_to_dict
+from custom_components.casambi_mqtt.entities.entities import Scene
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from custom_components.casambi_mqtt.entities.entities import Unit
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedNetwork:
+    address: str
+    units: list[Unit]
+    scenes: list[Scene]
+    saved_at: float
+
+
+class NetworkCache:
+    """
+    The address, units and scenes of a network as last seen, in a JSON file.
+
+    With it the server connects to the network by address instead of scanning
+    for it, and serves the units and scenes while it is still connecting.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def load(self) -> CachedNetwork | None:
+        """Read the cached network, None if there is none or it is unreadable."""
+        try:
+            data = json.loads(self.path.read_text())
+            if data["version"] != self.VERSION:
+                return None
+            return CachedNetwork(
+                data["address"],
+                [unit_from_dict(u) for u in data["units"]],
+                [Scene(s["scene_id"], s["name"]) for s in data["scenes"]],
+                data["saved_at"],
+            )
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            LOGGER.warning("Ignoring unreadable cache %s: %s", self.path, e)
+            return None
+
+    def save(self, address: str, units: list[Unit], scenes: list[Scene]) -> None:
+        data = {
+            "version": self.VERSION,
+            "address": address,
+            "saved_at": time.time(),
+            "units": [unit_to_dict(u) for u in units],
+            "scenes": [{"scene_id": s.scene_id, "name": s.name} for s in scenes],
+        }
+        # Written next to the cache and renamed, so a crash never leaves half a file.
+        temporary = self.path.with_suffix(".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temporary.write_text(json.dumps(data))
+            temporary.replace(self.path)
+        except OSError as e:
+            LOGGER.warning("Failed to save cache %s: %s", self.path, e)
@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Iterable
+
+LOGGER = logging.getLogger(__name__)
+
+
+class OverflowPolicy(StrEnum):
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    BLOCK = "block"
+
+
+@dataclass
+class _Job:
+    seq: int
+    key: str
+    run: Callable[[], Awaitable[None]]
+    coalesce: bool = False
+    on_dropped: Callable[[], None] | None = None
+    priority: int = 0
+    # Seconds since the epoch after which the job is dropped instead of run.
+    deadline: float | None = None
+    # The units the job writes to.
+    targets: frozenset[str] = frozenset()
+    tag: str | None = None
+    dropped: bool = field(default=False, compare=False)
+    # Set once the job ran or was dropped.
+    finished: asyncio.Event = field(default_factory=asyncio.Event, compare=False)
+
+    def drop(self) -> None:
+        self.dropped = True
+        self.finished.set()
+        if self.on_dropped is not None:
+            self.on_dropped()
+
+
+class _Slots:
+    """A semaphore that lets the waiter with the lowest priority number in first."""
+
+    def __init__(self, value: int) -> None:
+        self._free = value
+        self._waiters: list[tuple[int, int, asyncio.Future[None]]] = []
+
+    async def acquire(self, priority: int, seq: int) -> None:
+        if self._free and not self._waiters:
+            self._free -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, seq, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Got the slot just before being cancelled.
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._free += 1
+
+
+class CommandDispatcher:
+    """
+    Runs commands for different targets concurrently, up to `concurrency`.
+
+    Commands are queued in a lane per target key and a lane runs its commands
+    one at a time, so commands for the same unit keep their order. A job
+    submitted with `coalesce=True` replaces a coalescable job still waiting at
+    the tail of its lane (latest wins). At most `max_pending` jobs wait for a
+    slot; what happens beyond that is decided by the overflow policy.
+
+    A free slot goes to the lane whose next job has the lowest priority number,
+    in order of submission among equal priorities. `drop_oldest` evicts the
+    oldest job of the lowest priority. A job still waiting at its deadline is
+    dropped instead of run.
+
+    Priorities never reorder writes to a unit: a job that writes to units
+    that an earlier job also writes to, e.g. a group and one of its units,
+    waits until the earlier job ran or was dropped. A job submitted with
+    `supersede=True` drops the waiting jobs that only write to its units.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        max_pending: int,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+    ) -> None:
+        self._slots = _Slots(concurrency)
+        self._max_pending = max_pending
+        self._policy = policy
+        self._lanes: dict[str, deque[_Job]] = {}
+        self._runners: dict[str, asyncio.Task[None]] = {}
+        # Waiting jobs in arrival order, used to find the oldest one to evict.
+        self._pending: dict[int, _Job] = {}
+        # Jobs that did not run or were dropped yet, in order of submission.
+        self._unfinished: dict[int, _Job] = {}
+        # Set whenever a waiting job leaves the queue, wakes blocked submitters.
+        self._room = asyncio.Event()
+        self._seq = itertools.count()
+        self.submitted = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.superseded = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> int:
+        return len(self._runners)
+
+    async def submit(  # noqa: PLR0913
+        self,
+        key: str,
+        run: Callable[[], Awaitable[None]],
+        *,
+        coalesce: bool = False,
+        on_dropped: Callable[[], None] | None = None,
+        priority: int = 0,
+        deadline: float | None = None,
+        targets: Iterable[str] | None = None,
+        supersede: bool = False,
+        tag: str | None = None,
+    ) -> bool:
+        """
+        Queue `run` on the lane for `key`, returns False if it was dropped.
+
+        `targets` are the units the job writes to, by default the unit `key`.
+        `on_dropped` is called if the job is dropped, replaced, superseded or
+        expired before it runs. `tag` marks the job for `drop_waiting`.
+        """
+        self.submitted += 1
+        job = _Job(
+            next(self._seq),
+            key,
+            run,
+            coalesce,
+            on_dropped,
+            priority,
+            deadline,
+            frozenset((key,) if targets is None else targets),
+            tag,
+        )
+        if supersede:
+            self._drop_waiting(
+                lambda waiting: bool(waiting.targets) and waiting.targets <= job.targets
+            )
+        lane = self._lanes.get(key)
+        if coalesce and lane and lane[-1].coalesce and not lane[-1].dropped:
+            replaced = lane.pop()
+            self._unqueue(replaced)
+            del self._unfinished[replaced.seq]
+            replaced.drop()
+            self.coalesced += 1
+        elif not await self._make_room():
+            self.dropped += 1
+            LOGGER.warning("Command queue full, dropping new command for %s", key)
+            job.drop()
+            return False
+
+        self._lanes.setdefault(key, deque()).append(job)
+        self._pending[job.seq] = job
+        self._unfinished[job.seq] = job
+        if key not in self._runners:
+            self._runners[key] = asyncio.create_task(self._run_lane(key))
+        return True
+
+    def drop_waiting(self, targets: Iterable[str], tag: str) -> None:
+        """Drop the waiting jobs with `tag` that write to any of `targets`."""
+        targets = frozenset(targets)
+        self._drop_waiting(
+            lambda waiting: waiting.tag == tag and bool(waiting.targets & targets)
+        )
+
+    def _drop_waiting(self, match: Callable[[_Job], bool]) -> None:
+        for waiting in [job for job in self._pending.values() if match(job)]:
+            self._unqueue(waiting)
+            waiting.drop()
+            self.superseded += 1
+            LOGGER.debug("Dropping superseded command for %s", waiting.key)
+
+    async def _make_room(self) -> bool:
+        if len(self._pending) < self._max_pending:
+            return True
+        match self._policy:
+            case OverflowPolicy.DROP_NEWEST:
+                return False
+            case OverflowPolicy.DROP_OLDEST:
+                lowest = max(job.priority for job in self._pending.values())
+                oldest = next(
+                    job for job in self._pending.values() if job.priority == lowest
+                )
+                self._unqueue(oldest)
+                oldest.drop()
+                self.dropped += 1
+                LOGGER.warning(
+                    "Command queue full, dropping oldest command for %s", oldest.key
+                )
+                return True
+            case OverflowPolicy.BLOCK:
+                while len(self._pending) >= self._max_pending:
+                    self._room.clear()
+                    await self._room.wait()
+                return True
+
+    def _unqueue(self, job: _Job) -> None:
+        """Take a job off the queue of waiting jobs, making room for another."""
+        del self._pending[job.seq]
+        self._room.set()
+
+    async def _run_lane(self, key: str) -> None:
+        lane = self._lanes[key]
+        try:
+            while lane:
+                job = lane[0]
+                if job.dropped:
+                    self._unfinished.pop(lane.popleft().seq, None)
+                    continue
+                await self._wait_for_earlier(job)
+                if lane[0] is not job or job.dropped:
+                    # Replaced or dropped in the meantime.
+                    continue
+                await self._slots.acquire(job.priority, job.seq)
+                if lane[0] is not job or job.dropped:
+                    self._slots.release()
+                    continue
+                try:
+                    await self._run_job(lane.popleft())
+                finally:
+                    self._slots.release()
+        finally:
+            del self._runners[key]
+            del self._lanes[key]
+
+    async def _wait_for_earlier(self, job: _Job) -> None:
+        """Wait for the earlier jobs that write to any of the units of `job`."""
+        for earlier in list(self._unfinished.values()):
+            if earlier.seq >= job.seq:
+                break
+            if earlier.targets & job.targets:
+                await earlier.finished.wait()
+
+    async def _run_job(self, job: _Job) -> None:
+        try:
+            await self._run_pending(job)
+        finally:
+            job.finished.set()
+            self._unfinished.pop(job.seq, None)
+
+    async def _run_pending(self, job: _Job) -> None:
+        if job.dropped:
+            return
+        self._unqueue(job)
+        if job.deadline is not None and time.time() > job.deadline:
+            self.expired += 1
+            LOGGER.warning("Dropping command for %s after its deadline", job.key)
+            job.drop()
+            return
+        try:
+            await job.run()
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            LOGGER.exception("Command for %s failed", job.key)
+
+    async def close(self) -> None:
+        for task in self._runners.values():
+            task.cancel()
+        await asyncio.gather(*self._runners.values(), return_exceptions=True)
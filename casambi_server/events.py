@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from custom_components.casambi_mqtt.entities.codec import (
+    encode_unit,
+    encode_unit_metadata,
+    encode_unit_status,
+    encode_unit_type,
+    pack_unit_metadata,
+    pack_unit_status,
+    pack_unit_type,
+)
+from custom_components.casambi_mqtt.entities.encoding import (
+    ENCODING_JSON,
+    ENCODING_MSGPACK,
+)
+
+if TYPE_CHECKING:
+    from custom_components.casambi_mqtt.entities.entities import (
+        Unit,
+        UnitMetadata,
+        UnitType,
+    )
+
+    from .publisher import Delivery, Publisher
+
+# Encoders of the unit type, metadata and status, per encoding.
+_ENCODERS = {
+    ENCODING_JSON: (encode_unit_type, encode_unit_metadata, encode_unit_status),
+    ENCODING_MSGPACK: (pack_unit_type, pack_unit_metadata, pack_unit_status),
+}
+
+
+class UnitEventPublisher:
+    """
+    Publishes unit changes split over three retained topics.
+
+    - `<base>/state/<address>`: dimmer, on/off and online, on every change
+    - `<base>/units/<address>`: unit metadata, only when it changed
+    - `<base>/types/<unit type id>`: unit types, shared by all units of a type
+
+    With `legacy_events` the full unit is also published on
+    `<base>/events/<address>` for integrations that predate the split.
+
+    State and events are published with the `state` delivery, metadata and
+    types with the `metadata` delivery. Payloads are JSON. With `packed` the
+    state, unit and type topics are also published as MessagePack arrays
+    under `<base>/msgpack/`, so clients of the JSON topics are not affected by
+    another client selecting MessagePack. Legacy events are always JSON, the
+    integrations that read them predate MessagePack.
+    """
+
+    def __init__(
+        self,
+        publisher: Publisher,
+        base_topic: str,
+        *,
+        legacy_events: bool,
+        state: Delivery,
+        metadata: Delivery,
+    ) -> None:
+        self._publisher = publisher
+        self._state_delivery = state
+        self._metadata_delivery = metadata
+        self._base_topic = base_topic
+        self._legacy_events = legacy_events
+        self._metadata: dict[str, UnitMetadata] = {}
+        self._types: dict[int, UnitType] = {}
+        self.packed = False
+
+    def reset(self) -> None:
+        """Publish metadata and types again on the next change of each unit."""
+        self._metadata.clear()
+        self._types.clear()
+
+    def publish(self, unit: Unit, *, force: bool = False) -> None:
+        new_type = self._types.get(unit.unit_type.id) != unit.unit_type
+        self._types[unit.unit_type.id] = unit.unit_type
+        metadata = unit.metadata()
+        new_metadata = self._metadata.get(unit.address) != metadata
+        self._metadata[unit.address] = metadata
+        for base_topic, encoding in self._topics():
+            encode_type, encode_metadata, encode_status = _ENCODERS[encoding]
+            if force or new_type:
+                self._publisher.publish(
+                    f"{base_topic}/types/{unit.unit_type.id}",
+                    encode_type(unit.unit_type),
+                    self._metadata_delivery,
+                    force=force,
+                )
+            if force or new_metadata:
+                self._publisher.publish(
+                    f"{base_topic}/units/{unit.address}",
+                    encode_metadata(metadata),
+                    self._metadata_delivery,
+                    force=force,
+                )
+            self._publisher.publish(
+                f"{base_topic}/state/{unit.address}",
+                encode_status(unit.status()),
+                self._state_delivery,
+                force=force,
+            )
+        if self._legacy_events:
+            self._publisher.publish(
+                f"{self._base_topic}/events/{unit.address}",
+                encode_unit(unit),
+                self._state_delivery,
+                force=force,
+            )
+
+    def _topics(self) -> list[tuple[str, str]]:
+        """Get the base topics with the encoding of their payloads."""
+        topics = [(self._base_topic, ENCODING_JSON)]
+        if self.packed:
+            topics.append((f"{self._base_topic}/msgpack", ENCODING_MSGPACK))
+        return topics
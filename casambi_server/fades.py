@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class Fade:
+    """
+    A unit ramping linearly from `start` to `target` in `duration` seconds.
+
+    `step` writes a level to the unit, with `final` set for the target level.
+    `last` is the last level written, None when the unit may not be at `start`.
+    """
+
+    network: str
+    address: str
+    start: int
+    target: int
+    duration: float
+    step: Callable[[int, bool], Awaitable[None]]
+    on_cancelled: Callable[[], None] | None = None
+    last: int | None = None
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.network, self.address
+
+    def level(self, now: float) -> int:
+        if now >= self.started_at + self.duration:
+            return self.target
+        progress = (now - self.started_at) / self.duration
+        return round(self.start + (self.target - self.start) * progress)
+
+    def lag(self, now: float) -> float:
+        """How far the unit is behind, infinite when it is time for the target."""
+        if self.last is None or now >= self.started_at + self.duration:
+            return math.inf
+        return abs(self.level(now) - self.last)
+
+
+class FadeEngine:
+    """
+    Runs the fades of all networks, with at most `rate` level writes a second.
+
+    Every tick the level is written of the fade that is furthest behind its
+    ramp, so concurrent fades share the writes and a fade whose level did not
+    change yet gets none. A fade always ends with a write of its target level.
+    Starting a fade for a unit cancels the one it had, and any other command
+    for the unit should cancel it with `cancel`.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self._interval = 1 / rate
+        self._fades: dict[tuple[str, str], Fade] = {}
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+        self.started = 0
+        self.steps = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    @property
+    def active(self) -> int:
+        return len(self._fades)
+
+    def start(self, fade: Fade) -> None:
+        self._cancel(fade.key)
+        self._fades[fade.key] = fade
+        self.started += 1
+        self._wake.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def cancel(self, network: str, address: str | None = None) -> None:
+        """Cancel the fade of a unit, or of every unit in the network."""
+        if address is not None:
+            self._cancel((network, address))
+            return
+        for key in [key for key in self._fades if key[0] == network]:
+            self._cancel(key)
+
+    def _cancel(self, key: tuple[str, str]) -> None:
+        fade = self._fades.pop(key, None)
+        if fade is None:
+            return
+        self.cancelled += 1
+        LOGGER.debug("Cancelled fade of %s", fade.address)
+        if fade.on_cancelled is not None:
+            fade.on_cancelled()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                while not self._fades:
+                    self._wake.clear()
+                    await self._wake.wait()
+                now = time.monotonic()
+                fade = self._furthest_behind(now)
+                if fade is not None:
+                    try:
+                        await self._write(fade, now)
+                    except Exception:
+                        LOGGER.exception("Fade of %s failed", fade.address)
+                        self._fades.pop(fade.key, None)
+                await asyncio.sleep(self._interval)
+        finally:
+            # Started again by the next fade.
+            self._task = None
+
+    def _furthest_behind(self, now: float) -> Fade | None:
+        """Get the fade that is furthest behind, None if all are up to date."""
+        furthest, furthest_lag = None, 0.0
+        for fade in list(self._fades.values()):
+            try:
+                lag = fade.lag(now)
+            except Exception:
+                LOGGER.exception("Fade of %s failed", fade.address)
+                self._cancel(fade.key)
+                continue
+            if lag > furthest_lag:
+                furthest, furthest_lag = fade, lag
+        return furthest
+
+    async def _write(self, fade: Fade, now: float) -> None:
+        level = fade.level(now)
+        final = now >= fade.started_at + fade.duration
+        fade.last = level
+        if final:
+            del self._fades[fade.key]
+            self.completed += 1
+        self.steps += 1
+        try:
+            await fade.step(level, final)
+        except Exception:
+            LOGGER.exception("Fade step of %s failed", fade.address)
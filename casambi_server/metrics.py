@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Iterable, Iterator
+
+LOGGER = logging.getLogger(__name__)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+# Seconds a client gets to send its request, before the connection is closed.
+REQUEST_TIMEOUT = 5
+
+
+class Histogram:
+    """Counts observed durations, in seconds, per bucket like Prometheus does."""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        # Per bucket, not cumulative; the last one counts values above all bounds.
+        self._counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """Count of values up to each bound, ending with "+Inf"."""
+        bounds = [str(b) for b in self.buckets] + ["+Inf"]
+        total = 0
+        result = []
+        for bound, count in zip(bounds, self._counts, strict=True):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class _Family:
+    def __init__(self, kind: str, description: str, label: str | None) -> None:
+        self.kind = kind
+        self.description = description
+        self.label = label
+        # Label value (None without a label) -> number, or function reading it.
+        self.values: dict[str | None, float | Callable[[], float]] = {}
+        self.histograms: dict[str | None, Histogram] = {}
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms of the server, by name and optional label.
+
+    Components that keep their own counters are read when the metrics are
+    exported, through functions registered with `collect`. The metrics can be
+    exported as a dict, for the stats topic, or in the Prometheus text format
+    where every sample gets `labels`, e.g. the network it belongs to.
+    """
+
+    def __init__(
+        self, namespace: str = "casambi", labels: dict[str, str] | None = None
+    ) -> None:
+        self.namespace = namespace
+        self.labels = labels or {}
+        self._families: dict[str, _Family] = {}
+        self.define(
+            HISTOGRAM, "ble_call_seconds", "Duration of Casambi calls.", label="call"
+        )
+        self.define(
+            COUNTER, "ble_call_failures_total", "Failed Casambi calls.", label="call"
+        )
+
+    def inc(self, name: str, label: str | None = None, value: float = 1) -> None:
+        values = self._families[name].values
+        values[label] = values.get(label, 0) + value
+
+    def histogram(self, name: str, label: str | None = None) -> Histogram:
+        histograms = self._families[name].histograms
+        histogram = histograms.get(label)
+        if histogram is None:
+            histogram = histograms[label] = Histogram()
+        return histogram
+
+    def define(
+        self, kind: str, name: str, description: str, *, label: str | None = None
+    ) -> None:
+        self._families[name] = _Family(kind, description, label)
+
+    def collect(
+        self,
+        kind: str,
+        name: str,
+        description: str,
+        read: Callable[[], float],
+    ) -> None:
+        self._families[name] = _Family(kind, description, None)
+        self._families[name].values[None] = read
+
+    async def ble(self, func: Callable[..., Awaitable[None]], *args: Any) -> None:
+        """Call a Casambi method, timing it and counting failures."""
+        with self.histogram("ble_call_seconds", func.__name__).time():
+            try:
+                await func(*args)
+            except Exception:
+                self.inc("ble_call_failures_total", func.__name__)
+                raise
+
+    def to_dict(self) -> dict[str, Any]:
+        result: dict[str, Any] = {}
+        for name, family in self._families.items():
+            values: dict[str | None, Any] = {
+                label: h.to_dict() for label, h in family.histograms.items()
+            }
+            values.update(
+                (label, value() if callable(value) else value)
+                for label, value in family.values.items()
+            )
+            result[name] = values.get(None) if family.label is None else values
+        return result
+
+    def to_prometheus(self) -> str:
+        return render_prometheus([self])
+
+    def samples(self, name: str) -> Iterator[tuple[str, str, float]]:
+        """Suffix, labels and value of each sample of the family `name`."""
+        family = self._families[name]
+        for label, value in family.values.items():
+            number = value() if callable(value) else value
+            yield "", self._labels(family, label), number
+        for label, histogram in family.histograms.items():
+            for bound, count in histogram.cumulative():
+                yield "_bucket", self._labels(family, label, f'le="{bound}"'), count
+            yield "_sum", self._labels(family, label), histogram.sum
+            yield "_count", self._labels(family, label), histogram.count
+
+    def families(self) -> Iterator[tuple[str, str, str]]:
+        """Name, kind and description of each family."""
+        for name, family in self._families.items():
+            yield name, family.kind, family.description
+
+    def _labels(self, family: _Family, label: str | None, *extra: str) -> str:
+        pairs = [f'{key}="{value}"' for key, value in self.labels.items()]
+        if family.label is not None:
+            pairs.append(f'{family.label}="{label}"')
+        pairs.extend(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_prometheus(metrics: Iterable[Metrics]) -> str:
+    """Render metrics in the Prometheus text format, a family of all at once."""
+    families: dict[str, tuple[str, str, list[tuple[Metrics, str]]]] = {}
+    for m in metrics:
+        for name, kind, description in m.families():
+            full_name = f"{m.namespace}_{name}"
+            families.setdefault(full_name, (kind, description, []))[2].append((m, name))
+    lines = []
+    for full_name, (kind, description, members) in families.items():
+        lines.append(f"# HELP {full_name} {description}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        for m, name in members:
+            lines.extend(
+                f"{full_name}{suffix}{labels} {value}"
+                for suffix, labels, value in m.samples(name)
+            )
+    return "\n".join(lines) + "\n"
+
+
+async def serve_metrics(
+    metrics: Iterable[Metrics], port: int, host: str = "127.0.0.1"
+) -> asyncio.Server:
+    """Serve the metrics in the Prometheus text format on `GET /metrics`."""
+
+    async def read_request(reader: asyncio.StreamReader) -> bytes:
+        request = await reader.readline()
+        while (await reader.readline()).strip():
+            pass  # Headers are not needed.
+        return request
+
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request = await asyncio.wait_for(read_request(reader), REQUEST_TIMEOUT)
+            parts = request.decode(errors="replace").split()
+            if parts[:2] == ["GET", "/metrics"]:
+                status = "200 OK"
+                body = render_prometheus(metrics).encode()
+            else:
+                status = "404 Not Found"
+                body = b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode()
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, TimeoutError) as e:
+            LOGGER.debug("Metrics request failed: %r", e)
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    LOGGER.info("Serving metrics on %s:%d", host, port)
+    return server
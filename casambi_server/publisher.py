@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass
+from typing import Any
+
+import aiomqtt
+from paho.mqtt.client import MQTT_ERR_NO_CONN
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from .metrics import Histogram
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Delivery:
+    """How the messages of one class, e.g. unit state or acks, are published."""
+
+    qos: int = 1
+    retain: bool = True
+    # Only the latest message per topic waits to be published, else all are queued.
+    latest: bool = True
+    # MQTT 5: seconds after which the broker discards the message if undelivered.
+    expiry: int | None = None
+    # MQTT 5: publish with a topic alias, for topics that are published often.
+    alias: bool = False
+
+
+RETAINED = Delivery()
+
+
+class BrokerClient(aiomqtt.Client):
+    """An aiomqtt client that keeps the properties of the broker's CONNACK."""
+
+    connack_properties: Properties | None = None
+
+    @property
+    def topic_alias_maximum(self) -> int:
+        """MQTT 5: the number of topic aliases the broker accepts, 0 if none."""
+        return getattr(self.connack_properties, "TopicAliasMaximum", 0)
+
+    def _on_connect(
+        self,
+        client: Any,
+        userdata: Any,
+        flags: Any,
+        reason_code: Any,
+        properties: Properties | None = None,
+    ) -> None:
+        self.connack_properties = properties
+        super()._on_connect(client, userdata, flags, reason_code, properties)
+
+
+@dataclass
+class _Message:
+    topic: str
+    payload: bytes
+    delivery: Delivery
+    force: bool = False
+
+
+class Publisher:
+    """
+    Single outbound publish stage.
+
+    Messages delivered as `latest` get a latest-wins slot per topic and are
+    skipped when the payload is byte-identical to the last one published on
+    that topic. Other messages (errors, results) are queued as they come. At
+    most `max_pending` messages wait, beyond that the oldest queued message is
+    dropped, or the oldest latest-wins one if there are none. At most
+    `max_in_flight` publishes run at the same time. The duration of each
+    publish is observed in `latency`.
+
+    While the broker is unreachable the publisher is paused: messages keep
+    being queued, so the latest state of every unit is kept, and are all
+    published once it is resumed after reconnecting.
+
+    With `mqtt5` the message expiry of a delivery is sent along, and up to
+    `topic_alias_maximum` topics published with `alias` and QoS 0 get a topic
+    alias, the least recently used one is reassigned when they are all taken.
+    No more aliases are used than the broker accepts, as passed to `reset`.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        client: aiomqtt.Client,
+        max_in_flight: int,
+        max_pending: int,
+        latency: Histogram | None = None,
+        *,
+        mqtt5: bool = False,
+        topic_alias_maximum: int = 0,
+    ) -> None:
+        self._client = client
+        self._mqtt5 = mqtt5
+        self._topic_alias_maximum = topic_alias_maximum if mqtt5 else 0
+        # At most what the broker accepts, known once connected.
+        self._topic_alias_limit = 0
+        # Topic aliases in order of last use, valid for the current connection.
+        self._aliases: dict[str, int] = {}
+        self.latency = latency or Histogram()
+        self._max_in_flight = max_in_flight
+        self._max_pending = max_pending
+        self._pending: dict[str | int, _Message] = {}
+        # A new payload for a topic that is being published waits here, so
+        # publishes for the same topic never overtake each other.
+        self._deferred: dict[str, _Message] = {}
+        self._in_flight: set[str] = set()
+        self._last: dict[str, bytes] = {}
+        self._ready = asyncio.Event()
+        self._online = asyncio.Event()
+        self._online.set()
+        self._seq = itertools.count()
+        self._workers: list[asyncio.Task[None]] = []
+        self.published = 0
+        self.replaced = 0
+        self.suppressed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.requeued = 0
+        self.aliased = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending) + len(self._deferred)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @property
+    def online(self) -> bool:
+        return self._online.is_set()
+
+    def publish(
+        self,
+        topic: str,
+        payload: str | bytes,
+        delivery: Delivery = RETAINED,
+        *,
+        force: bool = False,
+    ) -> None:
+        """Queue a message, `force` republishes an unchanged latest-wins payload."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        message = _Message(topic, payload, delivery, force)
+        if delivery.latest and topic in self._in_flight:
+            if topic in self._deferred:
+                self.replaced += 1
+            self._deferred[topic] = message
+            return
+        self._enqueue(message)
+
+    def _enqueue(self, message: _Message) -> None:
+        key = message.topic if message.delivery.latest else next(self._seq)
+        if key in self._pending:
+            self.replaced += 1
+            message.force |= self._pending[key].force
+        elif len(self._pending) >= self._max_pending:
+            # Prefer dropping an error or result over the state of a unit.
+            oldest = next(
+                (k for k in self._pending if isinstance(k, int)),
+                next(iter(self._pending)),
+            )
+            LOGGER.warning(
+                "Publish queue full, dropping message for %s",
+                self._pending[oldest].topic,
+            )
+            del self._pending[oldest]
+            self.dropped += 1
+        self._pending[key] = message
+        self._ready.set()
+
+    def reset(self, broker_topic_alias_maximum: int = 0) -> None:
+        """
+        Forget what was published, e.g. after connecting to a new broker.
+
+        `broker_topic_alias_maximum` is the Topic Alias Maximum of the broker's
+        CONNACK, aliases are not used without it.
+        """
+        self._last.clear()
+        self._aliases.clear()
+        self._topic_alias_limit = min(
+            self._topic_alias_maximum, broker_topic_alias_maximum
+        )
+
+    def pause(self) -> None:
+        """Queue messages without publishing them, until `resume`."""
+        self._online.clear()
+
+    def resume(self) -> None:
+        if not self._online.is_set() and self._pending:
+            LOGGER.info("Publishing %d buffered messages", self.pending)
+        self._online.set()
+
+    def start(self) -> None:
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self._max_in_flight)
+        ]
+
+    async def close(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+
+    async def _work(self) -> None:
+        while True:
+            while not self._pending:
+                self._ready.clear()
+                await self._ready.wait()
+            await self._online.wait()
+            if not self._pending:
+                continue
+            message = self._pending.pop(next(iter(self._pending)))
+            latest = message.delivery.latest
+            if latest:
+                if (
+                    not message.force
+                    and self._last.get(message.topic) == message.payload
+                ):
+                    self.suppressed += 1
+                    continue
+                self._in_flight.add(message.topic)
+            try:
+                await self._send(message)
+            finally:
+                if latest:
+                    self._in_flight.discard(message.topic)
+                    deferred = self._deferred.pop(message.topic, None)
+                    if deferred is not None:
+                        self._enqueue(deferred)
+
+    async def _send(self, message: _Message) -> None:
+        try:
+            # Nothing is awaited before the client sends the message, so
+            # messages go out in the order their aliases were assigned.
+            topic, properties = self._properties(message)
+            with self.latency.time():
+                await self._client.publish(
+                    topic,
+                    payload=message.payload,
+                    qos=message.delivery.qos,
+                    retain=message.delivery.retain,
+                    properties=properties,
+                )
+            self.published += 1
+            if message.delivery.latest:
+                self._last[message.topic] = message.payload
+        except aiomqtt.MqttError as e:
+            if self._connection_lost(e):
+                self._requeue(message)
+            else:
+                self.failed += 1
+                LOGGER.warning("Failed to publish to %s: %s", message.topic, e)
+        except Exception:
+            # E.g. an invalid payload, which must not stop the worker.
+            self.failed += 1
+            LOGGER.exception("Failed to publish to %s", message.topic)
+
+    def _requeue(self, message: _Message) -> None:
+        """Publish a message again after reconnecting, unless replaced by then."""
+        self.pause()
+        self.requeued += 1
+        if message.delivery.latest:
+            self._deferred.setdefault(message.topic, message)
+        else:
+            self._enqueue(message)
+
+    def _properties(self, message: _Message) -> tuple[str, Properties | None]:
+        """Get the topic to publish to and the MQTT 5 properties of a message."""
+        delivery = message.delivery
+        if not self._mqtt5 or (delivery.expiry is None and not self._aliased(message)):
+            return message.topic, None
+        topic = message.topic
+        properties = Properties(PacketTypes.PUBLISH)
+        if delivery.expiry is not None:
+            properties.MessageExpiryInterval = delivery.expiry
+        if self._aliased(message):
+            alias = self._aliases.pop(topic, None)
+            if alias is not None:
+                # Known to the broker, the topic itself can be left out.
+                topic = ""
+                self.aliased += 1
+            elif len(self._aliases) < self._topic_alias_limit:
+                alias = len(self._aliases) + 1
+            else:
+                alias = self._aliases.pop(next(iter(self._aliases)))
+            self._aliases[message.topic] = alias
+            properties.TopicAlias = alias
+        return topic, properties
+
+    def _aliased(self, message: _Message) -> bool:
+        # A QoS 1 or 2 publish is sent again by the client after reconnecting,
+        # when its alias is no longer known to the broker.
+        return (
+            bool(self._topic_alias_limit)
+            and message.delivery.alias
+            and message.delivery.qos == 0
+        )
+
+    def _connection_lost(self, error: aiomqtt.MqttError) -> bool:
+        # Paused already when the connection was lost during the publish.
+        return not self.online or (
+            isinstance(error, aiomqtt.MqttCodeError) and error.rc == MQTT_ERR_NO_CONN
+        )
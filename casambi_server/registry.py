@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Collection
+
+    from CasambiBt import Casambi, Group, Scene, Unit
+
+
+class UnknownTargetError(LookupError):
+    KIND_UNIT = "unit"
+    KIND_SCENE = "scene"
+    KIND_GROUP = "group"
+
+    def __init__(self, kind: str, target: str | int) -> None:
+        super().__init__(f"Unknown {kind}: {target}")
+        self.kind = kind
+        self.target = target
+
+
+class EntityRegistry:
+    """Units indexed by address, scenes and groups indexed by id."""
+
+    def __init__(self) -> None:
+        self._units: dict[str, Unit] = {}
+        self._scenes: dict[int, Scene] = {}
+        self._groups: dict[int, Group] = {}
+        self._group_members: dict[frozenset[str], Group] = {}
+
+    def load(self, casa: Casambi) -> None:
+        """(Re)build the indexes from the connected network."""
+        self._units = {u.address: u for u in casa.units}
+        self._scenes = {s.sceneId: s for s in casa.scenes}
+        # `groudId` is how the library spells it.
+        self._groups = {g.groudId: g for g in casa.groups}
+        self._group_members = {
+            frozenset(u.address for u in g.units): g for g in casa.groups
+        }
+
+    def update_unit(self, unit: Unit) -> None:
+        self._units[unit.address] = unit
+
+    @property
+    def units(self) -> list[Unit]:
+        return list(self._units.values())
+
+    @property
+    def scenes(self) -> list[Scene]:
+        return list(self._scenes.values())
+
+    @property
+    def groups(self) -> list[Group]:
+        return list(self._groups.values())
+
+    def unit(self, address: str) -> Unit:
+        try:
+            return self._units[address]
+        except KeyError:
+            raise UnknownTargetError(UnknownTargetError.KIND_UNIT, address) from None
+
+    def scene(self, scene_id: int) -> Scene:
+        try:
+            return self._scenes[scene_id]
+        except KeyError:
+            raise UnknownTargetError(UnknownTargetError.KIND_SCENE, scene_id) from None
+
+    def group(self, group_id: int) -> Group:
+        try:
+            return self._groups[group_id]
+        except KeyError:
+            raise UnknownTargetError(UnknownTargetError.KIND_GROUP, group_id) from None
+
+    def group_of(self, addresses: Collection[str]) -> Group | None:
+        """Get the group with exactly these units, if there is one."""
+        return self._group_members.get(frozenset(addresses))
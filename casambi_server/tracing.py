@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING
+
+from custom_components.casambi_mqtt.entities.results import BatchResult, CommandAck
+
+from .batch import BatchTracker
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable, Callable, Iterable
+
+
+class CommandTrace(BatchTracker):
+    """
+    Times one command, from MQTT receipt to the unit changes it caused.
+
+    The jobs a command was split into are tracked like a batch. Once they all
+    ran, the trace waits for a unit changed callback from each unit in
+    `confirm` that was written successfully, then completes the ack.
+    """
+
+    def __init__(
+        self,
+        tracer: CommandTracer,
+        ack: CommandAck,
+        addresses: list[str],
+        confirm: Iterable[str],
+        on_done: Callable[[BatchResult], None] | None = None,
+    ) -> None:
+        self.ack = ack
+        self.confirm = frozenset(confirm)
+        self.done = False
+        self._tracer = tracer
+        self._unconfirmed = set(self.confirm)
+        self._on_written = on_done
+        self._timeout: asyncio.TimerHandle | None = None
+        super().__init__(ack.action or "", addresses, self._written)
+
+    def wrap(
+        self, addresses: list[str], run: Callable[[], Awaitable[None]]
+    ) -> Callable[[], Awaitable[None]]:
+        tracked = super().wrap(addresses, run)
+
+        async def timed() -> None:
+            if self.ack.started_at is None:
+                self.ack.started_at = time.time()
+            await tracked()
+
+        return timed
+
+    def unit_changed(self, address: str) -> None:
+        # Changes from before the first write are not caused by this command.
+        if self.ack.started_at is None or address not in self._unconfirmed:
+            return
+        self._unconfirmed.discard(address)
+        if not self._unconfirmed:
+            self.ack.confirmed_at = time.time()
+            if self.ack.written_at is not None:
+                self._tracer.finish(self)
+
+    def cancel_timeout(self) -> None:
+        if self._timeout is not None:
+            self._timeout.cancel()
+            self._timeout = None
+
+    def _written(self, result: BatchResult) -> None:
+        self.ack.written_at = time.time()
+        if result.failed:
+            reasons = set(result.failed.values())
+            if not result.succeeded and reasons == {BatchTracker.DROPPED}:
+                self.ack.status = CommandAck.STATUS_DROPPED
+            else:
+                self.ack.status = CommandAck.STATUS_FAILED
+            self.ack.error = "; ".join(
+                f"{target}: {reason}" for target, reason in result.failed.items()
+            )
+        if self._on_written is not None:
+            self._on_written(result)
+
+        self._unconfirmed.difference_update(result.failed)
+        if not self._unconfirmed or self.ack.confirmed_at is not None:
+            self._tracer.finish(self)
+        else:
+            self._timeout = asyncio.get_running_loop().call_later(
+                self._tracer.confirm_timeout, self._tracer.finish, self
+            )
+
+
+class CommandTracer:
+    """
+    Keeps the traces of commands in flight and publishes their acks.
+
+    Unit changed callbacks are matched to the traces waiting for that unit.
+    A trace whose units did not all report a change within `confirm_timeout`
+    seconds is acked without `confirmed_at`.
+    """
+
+    def __init__(
+        self, on_ack: Callable[[CommandAck], None], confirm_timeout: float
+    ) -> None:
+        self._on_ack = on_ack
+        self.confirm_timeout = confirm_timeout
+        self._waiting: dict[str, set[CommandTrace]] = {}
+        self._traces: set[CommandTrace] = set()
+        self.acked = 0
+        self.unconfirmed = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._traces)
+
+    def start(  # noqa: PLR0913
+        self,
+        correlation_id: str,
+        action: str,
+        received_at: float,
+        targets: list[str],
+        *,
+        confirm: Iterable[str] = (),
+        on_done: Callable[[BatchResult], None] | None = None,
+    ) -> CommandTrace:
+        """
+        Trace a command whose jobs run for `targets`.
+
+        `confirm` are the addresses of the units expected to report a change.
+        """
+        ack = CommandAck(correlation_id, action, received_at=received_at)
+        trace = CommandTrace(self, ack, targets, confirm, on_done)
+        if not trace.done:
+            self._traces.add(trace)
+            for address in trace.confirm:
+                self._waiting.setdefault(address, set()).add(trace)
+        return trace
+
+    def reply(self, ack: CommandAck) -> None:
+        """Ack a command that completed, or was rejected, without being traced."""
+        self.acked += 1
+        self._on_ack(ack)
+
+    def unit_changed(self, address: str) -> None:
+        for trace in list(self._waiting.get(address, ())):
+            trace.unit_changed(address)
+
+    def finish(self, trace: CommandTrace) -> None:
+        if trace.done:
+            return
+        trace.done = True
+        trace.cancel_timeout()
+        self._traces.discard(trace)
+        for address in trace.confirm:
+            traces = self._waiting.get(address)
+            if traces is not None:
+                traces.discard(trace)
+                if not traces:
+                    del self._waiting[address]
+        if trace.ack.confirmed_at is None and trace.ack.status == CommandAck.STATUS_OK:
+            self.unconfirmed += 1
+        self.reply(trace.ack)
+
+    def close(self) -> None:
+        for trace in self._traces:
+            trace.cancel_timeout()
+        self._traces.clear()
+        self._waiting.clear()
@@ -1,21 +1,51 @@
-from homeassistant.components.mqtt import ReceiveMessage, async_subscribe
-from homeassistant.config_entries import ConfigEntry
+import json
+from collections.abc import Iterable
+
+from homeassistant.components.mqtt import ReceiveMessage, async_publish, async_subscribe
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.typing import ConfigType
 
+from .assembler import UnitAssembler
+from .batcher import CommandBatcher
 from .const import (
+    AVAILABILITY_OFFLINE,
+    CONF_COMMAND_QOS,
+    CONF_COMMAND_TTL,
     CONF_NETWORK_NAME,
+    CONF_OPTIMISTIC,
+    CONF_OPTIMISTIC_TIMEOUT,
+    CONF_PAYLOAD_ENCODING,
+    CONF_STATE_WRITE_INTERVAL,
+    DEFAULT_COMMAND_QOS,
+    DEFAULT_COMMAND_TTL,
     DEFAULT_NETWORK_NAME,
-    DOMAIN,
-    LIGHT_ADD_ENTITIES,
+    DEFAULT_OPTIMISTIC,
+    DEFAULT_OPTIMISTIC_TIMEOUT,
+    DEFAULT_PAYLOAD_ENCODING,
+    DEFAULT_STATE_WRITE_INTERVAL,
     LOGGER,
     MQTT_TOPIC_PREFIX,
-    SCENE_ADD_ENTITIES,
 )
-from .entities.entities import Scene, Unit
-from .light import CasambiMqttLight
+from .data import CasambiMqttConfigEntry, CasambiMqttData
+from .discovery import DiscoveryBuffer
+from .entities.codec import (
+    decode_group,
+    decode_scene,
+    decode_snapshot,
+    decode_unit,
+    decode_unit_metadata,
+    decode_unit_status,
+    decode_unit_type,
+)
+from .entities.commands import PublishEntities
+from .entities.encoding import ENCODING_JSON, ENCODING_MSGPACK
+from .entities.entities import Group, Scene, Unit
+from .entities.results import CommandAck
+from .light import CasambiMqttGroupLight, CasambiMqttLight
+from .router import Handler, TopicRouter
 from .scene import CasambiMqttScene
+from .sender import async_send_command
 
 PLATFORMS: list[Platform] = [Platform.LIGHT, Platform.BUTTON, Platform.SCENE]
 
@@ -25,60 +55,254 @@ async def async_setup(hass: HomeAssistant, config: ConfigType) -> bool:
     return True
 
 
-async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][LIGHT_ADD_ENTITIES] = None
-    hass.data[DOMAIN][SCENE_ADD_ENTITIES] = None
+async def async_setup_entry(hass: HomeAssistant, entry: CasambiMqttConfigEntry) -> bool:
+    data = entry.runtime_data = CasambiMqttData(
+        network_name=entry.options.get(
+            CONF_NETWORK_NAME, entry.data.get(CONF_NETWORK_NAME, DEFAULT_NETWORK_NAME)
+        ),
+        discovery=DiscoveryBuffer(hass),
+        state_write_interval=entry.options.get(
+            CONF_STATE_WRITE_INTERVAL, DEFAULT_STATE_WRITE_INTERVAL
+        ),
+        optimistic=entry.options.get(CONF_OPTIMISTIC, DEFAULT_OPTIMISTIC),
+        optimistic_timeout=entry.options.get(
+            CONF_OPTIMISTIC_TIMEOUT, DEFAULT_OPTIMISTIC_TIMEOUT
+        ),
+        command_qos=entry.options.get(CONF_COMMAND_QOS, DEFAULT_COMMAND_QOS),
+        command_ttl=entry.options.get(CONF_COMMAND_TTL, DEFAULT_COMMAND_TTL),
+        payload_encoding=entry.options.get(
+            CONF_PAYLOAD_ENCODING, DEFAULT_PAYLOAD_ENCODING
+        ),
+    )
+    data.batcher = CommandBatcher(hass, data)
+
+    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+
+    data.index.network = CasambiMqttGroupLight(hass, data, None)
+    data.discovery.add(Platform.LIGHT, data.index.network)
 
-    network_name = entry.options.get(
-        CONF_NETWORK_NAME, entry.data.get(CONF_NETWORK_NAME, DEFAULT_NETWORK_NAME)
+    assembler = UnitAssembler()
+    router = TopicRouter(data.network_name)
+    _route_units(router, hass, data, assembler)
+    _route_scenes(router, hass, data)
+    _route_groups(router, hass, data)
+    _route_snapshot(router, hass, data, assembler)
+    _route_acks(router, data)
+    _route_availability(router, data)
+    _route_capabilities(router, hass, data)
+    # Payloads are passed on as bytes, they may be MessagePack.
+    entry.async_on_unload(
+        await async_subscribe(hass, router.topic, router.handle, 1, encoding=None)
     )
+    LOGGER.debug(f"Casambi MQTT subscribed to {router.topic}")
 
-    hass.data[DOMAIN][CONF_NETWORK_NAME] = network_name
+    # Ask the server for all units and scenes at once, instead of waiting for
+    # the retained messages to trickle in.
+    await async_send_command(hass, data, PublishEntities(snapshot=True))
 
-    await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    return True
+
+
+async def async_unload_entry(
+    hass: HomeAssistant, entry: CasambiMqttConfigEntry
+) -> bool:
+    unloaded = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unloaded:
+        entry.runtime_data.discovery.cancel()
+        entry.runtime_data.index.clear()
+    return unloaded
+
+
+def _process_units(
+    hass: HomeAssistant, data: CasambiMqttData, units: Iterable[Unit]
+) -> None:
+    index = data.index
+    changed: set[str] = set()
+    for unit in units:
+        unit_type = data.event_cache.classify(unit)
+        if unit_type != Unit.TYPE_LIGHT:
+            LOGGER.debug(
+                f"Received msg from {unit.name} which is not a light "
+                f"(it is {unit_type}). Ignoring.."
+            )
+            continue
+        if unit.state.dimmer is None:
+            LOGGER.debug(f"Light {unit.name} did not report its state yet. Ignoring..")
+            continue
+
+        light_entity = index.lights.get(unit.address)
+        if light_entity is None:
+            LOGGER.debug(
+                f"New Casambi light detected with address {unit.address}, "
+                f"creating light {unit.name} with state {unit.state.dimmer}"
+            )
+            topic = f"{MQTT_TOPIC_PREFIX}/{data.network_name}/events/{unit.address}"
+            light_entity = CasambiMqttLight(hass, topic, data, unit)
+            index.lights[unit.address] = light_entity
+            data.discovery.add(Platform.LIGHT, light_entity)
+        else:
+            LOGGER.debug(
+                f"Updating existing light with address {unit.address}, "
+                f"updating light {unit.name} with state {unit.state.dimmer}"
+            )
+            light_entity.update_entity(unit)
+        changed.add(unit.address)
+    for group_entity in index.groups_with(changed):
+        group_entity.update_members(index.lights)
+
+
+def _process_groups(
+    hass: HomeAssistant, data: CasambiMqttData, groups: Iterable[Group]
+) -> None:
+    index = data.index
+    for group in groups:
+        group_entity = index.groups.get(group.group_id)
+        if group_entity is None:
+            LOGGER.debug(
+                f"New Casambi group detected: {group.group_id}, creating {group.name}"
+            )
+            group_entity = CasambiMqttGroupLight(hass, data, group)
+            index.groups[group.group_id] = group_entity
+            data.discovery.add(Platform.LIGHT, group_entity)
+        else:
+            group_entity.update_entity(group)
+        group_entity.update_members(index.lights)
+
+
+def _process_scenes(
+    hass: HomeAssistant, data: CasambiMqttData, scenes: Iterable[Scene]
+) -> None:
+    index = data.index
+    for scene in scenes:
+        scene_entity = index.scenes.get(scene.scene_id)
+        if scene_entity is None:
+            LOGGER.debug(
+                f"New MQTT Scene detected: {scene.scene_id}, "
+                f"creating scene {scene.name}"
+            )
+            scene_entity = CasambiMqttScene(hass, data, scene)
+            index.scenes[scene.scene_id] = scene_entity
+            data.discovery.add(Platform.SCENE, scene_entity)
+        else:
+            LOGGER.debug(f"Updating existing scene {scene.name} (id {scene.scene_id})")
+            scene_entity.update_entity(scene)
 
-    async def event_processor(msg: ReceiveMessage) -> None:
+
+def _route_units(
+    router: TopicRouter,
+    hass: HomeAssistant,
+    data: CasambiMqttData,
+    assembler: UnitAssembler,
+) -> None:
+    event_cache = data.event_cache
+
+    async def event_processor(msg: ReceiveMessage, key: str | None) -> None:
+        """Handle a full unit, published by servers without split topics."""
+        if event_cache.unchanged(msg.topic, msg.payload):
+            return
         try:
-            unit = Unit.from_json(msg.payload)
+            unit = decode_unit(msg.payload)
         except ValueError:
             LOGGER.warning(
                 f"Invalid payload received for event, payload: {msg.payload}, "
                 f"topic: {msg.topic}"
             )
             return
+        event_cache.store(msg.topic, msg.payload)
+        _process_units(hass, data, [unit])
 
-        if unit.type() != Unit.TYPE_LIGHT:
-            LOGGER.debug(
-                f"Received msg from {unit.name} which is not a light "
-                f"(it is {unit.type()}). Ignoring.."
+    async def state_processor(msg: ReceiveMessage, key: str | None) -> None:
+        if event_cache.unchanged(msg.topic, msg.payload):
+            return
+        try:
+            status = decode_unit_status(msg.payload)
+        except ValueError:
+            LOGGER.warning(
+                f"Invalid payload received for unit state, payload: {msg.payload}, "
+                f"topic: {msg.topic}"
             )
             return
+        event_cache.store(msg.topic, msg.payload)
+        unit = assembler.set_status(key, status)
+        if unit is not None:
+            _process_units(hass, data, [unit])
 
-        async_add_entities = hass.data[DOMAIN][LIGHT_ADD_ENTITIES]
-        if async_add_entities is None:
-            LOGGER.warning("Light platform not ready yet. Message ignored..")
+    async def metadata_processor(msg: ReceiveMessage, key: str | None) -> None:
+        if event_cache.unchanged(msg.topic, msg.payload):
             return
-
-        if msg.topic not in hass.data[DOMAIN]:
-            LOGGER.debug(
-                f"New Casambi light detected on topic {msg.topic}, "
-                f"creating light {unit.name} with state {unit.state.dimmer}"
+        try:
+            metadata = decode_unit_metadata(msg.payload)
+        except ValueError:
+            LOGGER.warning(
+                f"Invalid payload received for unit, payload: {msg.payload}, "
+                f"topic: {msg.topic}"
             )
-            light_entity = CasambiMqttLight(hass, msg.topic, network_name, unit)
-            hass.data[DOMAIN][msg.topic] = light_entity
-            async_add_entities([light_entity])
-        else:
-            LOGGER.debug(
-                f"Updating existing light for topic {msg.topic}, "
-                f"updating light {unit.name} with state {unit.state.dimmer}"
+            return
+        event_cache.store(msg.topic, msg.payload)
+        unit = assembler.set_metadata(metadata)
+        if unit is not None:
+            _process_units(hass, data, [unit])
+
+    async def type_processor(msg: ReceiveMessage, key: str | None) -> None:
+        if event_cache.unchanged(msg.topic, msg.payload):
+            return
+        try:
+            unit_type = decode_unit_type(msg.payload)
+        except ValueError:
+            LOGGER.warning(
+                f"Invalid payload received for unit type, payload: {msg.payload}, "
+                f"topic: {msg.topic}"
             )
-            light_entity: CasambiMqttLight = hass.data[DOMAIN][msg.topic]
-            light_entity.update_entity(unit)
+            return
+        event_cache.store(msg.topic, msg.payload)
+        event_cache.forget_classification(unit_type.id)
+        _process_units(hass, data, assembler.set_type(unit_type))
+
+    router.route("events", event_processor)
+    router.route("types", type_processor)
+    router.route("units", metadata_processor)
+    router.route("state", state_processor)
+    _route_msgpack(router, data)
+
+
+def _route_msgpack(router: TopicRouter, data: CasambiMqttData) -> None:
+    """
+    Read the unit topics as JSON or, once selected, their MessagePack copies.
+
+    The server publishes both, so only one of them is handled.
+    """
+    processors = {kind: router.handler(kind) for kind in ("types", "units", "state")}
+
+    def json_processor(processor: Handler) -> Handler:
+        async def process(msg: ReceiveMessage, key: str | None) -> None:
+            if data.encoding == ENCODING_JSON:
+                await processor(msg, key)
+
+        return process
 
-    async def scene_processor(msg: ReceiveMessage) -> None:
+    async def msgpack_processor(msg: ReceiveMessage, key: str | None) -> None:
+        if data.encoding != ENCODING_MSGPACK or key is None:
+            return
+        kind, _, address = key.partition("/")
+        processor = processors.get(kind)
+        if processor is not None:
+            await processor(msg, address or None)
+
+    for kind, processor in processors.items():
+        router.route(kind, json_processor(processor))
+    router.route("msgpack", msgpack_processor)
+
+
+def _route_scenes(
+    router: TopicRouter, hass: HomeAssistant, data: CasambiMqttData
+) -> None:
+    event_cache = data.event_cache
+
+    async def scene_processor(msg: ReceiveMessage, key: str | None) -> None:
+        if event_cache.unchanged(msg.topic, msg.payload):
+            return
         try:
-            scene = Scene.from_json(msg.payload)
+            scene = decode_scene(msg.payload)
         except ValueError:
             LOGGER.warning(
                 f"Invalid payload received for scene, payload: {msg.payload}, "
@@ -86,32 +310,136 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             )
             return
 
-        async_add_entities = hass.data[DOMAIN][SCENE_ADD_ENTITIES]
-        if async_add_entities is None:
-            LOGGER.warning("Scene platform not ready yet. Message ignored..")
-            return
+        event_cache.store(msg.topic, msg.payload)
+        _process_scenes(hass, data, [scene])
 
-        if msg.topic not in hass.data[DOMAIN]:
-            LOGGER.debug(
-                f"New MQTT Scene detected: {msg.topic}, creating scene {scene.name}"
+    router.route("scenes", scene_processor)
+
+
+def _route_groups(
+    router: TopicRouter, hass: HomeAssistant, data: CasambiMqttData
+) -> None:
+    event_cache = data.event_cache
+
+    async def group_processor(msg: ReceiveMessage, key: str | None) -> None:
+        if event_cache.unchanged(msg.topic, msg.payload):
+            return
+        try:
+            group = decode_group(msg.payload)
+        except ValueError:
+            LOGGER.warning(
+                f"Invalid payload received for group, payload: {msg.payload}, "
+                f"topic: {msg.topic}"
             )
-            scene_entity = CasambiMqttScene(hass, network_name, scene)
-            hass.data[DOMAIN][msg.topic] = scene_entity
-            async_add_entities([scene_entity])
-        else:
-            LOGGER.debug(
-                f"Updating existing scene for topic: {msg.topic}, "
-                f"Updating scene {scene.name} (id {scene.scene_id})"
+            return
+
+        event_cache.store(msg.topic, msg.payload)
+        _process_groups(hass, data, [group])
+
+    router.route("groups", group_processor)
+
+
+def _route_snapshot(
+    router: TopicRouter,
+    hass: HomeAssistant,
+    data: CasambiMqttData,
+    assembler: UnitAssembler,
+) -> None:
+    async def snapshot_processor(msg: ReceiveMessage, key: str | None) -> None:
+        try:
+            snapshot = decode_snapshot(msg.payload)
+        except ValueError:
+            LOGGER.warning(f"Invalid payload received for snapshot, topic: {msg.topic}")
+            return
+
+        LOGGER.debug(
+            f"Received snapshot {snapshot.snapshot_id} chunk "
+            f"{snapshot.chunk + 1}/{snapshot.chunks} with {len(snapshot.units)} "
+            f"units and {len(snapshot.scenes)} scenes"
+        )
+        units: dict[str, Unit] = {}
+        for unit_type in snapshot.types:
+            units.update((u.address, u) for u in assembler.set_type(unit_type))
+        for metadata, status in snapshot.units:
+            assembler.set_status(metadata.address, status)
+            unit = assembler.set_metadata(metadata)
+            if unit is not None:
+                units[unit.address] = unit
+        _process_units(hass, data, units.values())
+        _process_scenes(hass, data, snapshot.scenes)
+
+    router.route("snapshot", snapshot_processor)
+
+
+def _route_acks(router: TopicRouter, data: CasambiMqttData) -> None:
+    async def ack_processor(msg: ReceiveMessage, key: str | None) -> None:
+        try:
+            ack = CommandAck.from_json(msg.payload)
+        except (ValueError, KeyError, TypeError):
+            LOGGER.warning(
+                f"Invalid payload received for ack, payload: {msg.payload}, "
+                f"topic: {msg.topic}"
             )
-            scene_entity: CasambiMqttScene = hass.data[DOMAIN][msg.topic]
-            scene_entity.update_entity(scene)
+            return
+        data.latency.ack_received(ack)
 
-    await async_subscribe(
-        hass, f"{MQTT_TOPIC_PREFIX}/{network_name}/events/#", event_processor, 1
-    )
-    await async_subscribe(
-        hass, f"{MQTT_TOPIC_PREFIX}/{network_name}/scenes/#", scene_processor, 1
-    )
-    LOGGER.debug("Casambi MQTT subscriptions set up for events and scenes")
+    router.route("acks", ack_processor)
 
-    return True
+
+def _route_availability(router: TopicRouter, data: CasambiMqttData) -> None:
+    async def availability_processor(msg: ReceiveMessage, key: str | None) -> None:
+        available = msg.payload != AVAILABILITY_OFFLINE.encode()
+        if data.network_available == available:
+            return
+        LOGGER.info(
+            f"Casambi network {data.network_name} is "
+            f"{'available' if available else 'unavailable'}"
+        )
+        data.network_available = available
+        for entity in data.index:
+            entity.set_available(available=available)
+
+    router.route("availability", availability_processor)
+
+
+def _route_capabilities(
+    router: TopicRouter, hass: HomeAssistant, data: CasambiMqttData
+) -> None:
+    """
+    Select the payload encoding from the options, if the server supports it.
+
+    Servers that advertise their encodings publish MessagePack copies of the
+    unit topics under `msgpack/` once a client selected it on the retained
+    encoding topic, next to the JSON ones. Older servers get JSON.
+    """
+
+    async def capabilities_processor(msg: ReceiveMessage, key: str | None) -> None:
+        try:
+            encodings = json.loads(msg.payload)["encodings"]
+        except (ValueError, KeyError, TypeError):
+            LOGGER.warning(
+                f"Invalid payload received for capabilities, payload: {msg.payload}, "
+                f"topic: {msg.topic}"
+            )
+            return
+        encoding = data.payload_encoding
+        if encoding not in encodings:
+            LOGGER.info(
+                f"Casambi network {data.network_name} does not support {encoding} "
+                "payloads, using JSON"
+            )
+            encoding = ENCODING_JSON
+        data.encoding = encoding
+        # JSON is never written, it would stop the MessagePack topics other
+        # clients may read.
+        if encoding == ENCODING_MSGPACK:
+            await async_publish(
+                hass,
+                f"{MQTT_TOPIC_PREFIX}/{data.network_name}/encoding",
+                encoding,
+                1,
+                retain=True,
+            )
+        LOGGER.debug(f"Using {encoding} payloads for {data.network_name}")
+
+    router.route("capabilities", capabilities_processor)
@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+from .entities.entities import Unit, UnitMetadata, UnitStatus, UnitType
+
+
+class UnitAssembler:
+    """
+    Merges the split unit topics back into units.
+
+    The server publishes a unit's status, metadata and type on separate
+    retained topics, which can arrive in any order. A unit is returned once all
+    three are known, and again whenever one of them changes.
+    """
+
+    def __init__(self) -> None:
+        self._types: dict[int, UnitType] = {}
+        self._metadata: dict[str, UnitMetadata] = {}
+        self._status: dict[str, UnitStatus] = {}
+        self._addresses_by_type: dict[int, set[str]] = defaultdict(set)
+
+    def set_type(self, unit_type: UnitType) -> list[Unit]:
+        self._types[unit_type.id] = unit_type
+        units = (
+            self._assemble(address) for address in self._addresses_by_type[unit_type.id]
+        )
+        return [unit for unit in units if unit is not None]
+
+    def set_metadata(self, metadata: UnitMetadata) -> Unit | None:
+        previous = self._metadata.get(metadata.address)
+        if previous is not None:
+            self._addresses_by_type[previous.unit_type_id].discard(metadata.address)
+        self._metadata[metadata.address] = metadata
+        self._addresses_by_type[metadata.unit_type_id].add(metadata.address)
+        return self._assemble(metadata.address)
+
+    def set_status(self, address: str, status: UnitStatus) -> Unit | None:
+        self._status[address] = status
+        return self._assemble(address)
+
+    def _assemble(self, address: str) -> Unit | None:
+        metadata = self._metadata.get(address)
+        status = self._status.get(address)
+        if metadata is None or status is None:
+            return None
+        unit_type = self._types.get(metadata.unit_type_id)
+        if unit_type is None:
+            return None
+        return Unit.from_parts(metadata, status, unit_type)
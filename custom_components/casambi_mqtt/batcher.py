@@ -0,0 +1,77 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+from homeassistant.core import HomeAssistant
+
+from .const import COMMAND_BATCH_WINDOW
+from .entities.commands import BaseCommand, Batch, SetLevel, TurnOn
+from .sender import async_send_command
+
+if TYPE_CHECKING:
+    from .data import CasambiMqttData
+
+
+class CommandBatcher:
+    """
+    Aggregates light commands into a single MQTT message.
+
+    A service call over many lights calls `async_turn_on` on each entity
+    concurrently; the levels set within `window` seconds are sent as one
+    `Batch` command. A single command is sent as a plain SetLevel/TurnOn.
+    """
+
+    def __init__(
+        self,
+        hass: HomeAssistant,
+        data: "CasambiMqttData",
+        window: float = COMMAND_BATCH_WINDOW,
+    ) -> None:
+        self.hass = hass
+        self._data = data
+        self._window = window
+        self._levels: dict[str, int | None] = {}
+        self._flushed: asyncio.Future[None] | None = None
+
+    async def set_level(self, address: str, level: int | None) -> None:
+        """Queue a level for a unit, None turns it on at its last level."""
+        self._levels[address] = level
+        if self._flushed is None:
+            flushed = self._flushed = self.hass.loop.create_future()
+            flush = self.hass.async_create_task(self._flush_later(flushed))
+            flush.add_done_callback(lambda _: self._flush_done(flushed))
+        await asyncio.shield(self._flushed)
+
+    async def _flush_later(self, flushed: asyncio.Future[None]) -> None:
+        """Send the queued levels, every waiting caller gets the outcome."""
+        await asyncio.sleep(self._window)
+        levels = self._levels
+        self._levels, self._flushed = {}, None
+        try:
+            command = self._data.latency.track(self._command(levels), list(levels))
+            await async_send_command(self.hass, self._data, command)
+        except Exception as e:  # noqa: BLE001
+            flushed.set_exception(e)
+        else:
+            flushed.set_result(None)
+
+    def _flush_done(self, flushed: asyncio.Future[None]) -> None:
+        """Release the waiting callers of a cancelled flush, even one not started."""
+        if not flushed.done():
+            flushed.cancel()
+        if self._flushed is flushed:
+            # Cancelled before sending, the next level starts a new batch.
+            self._levels, self._flushed = {}, None
+
+    @staticmethod
+    def _command(levels: dict[str, int | None]) -> BaseCommand:
+        if len(levels) == 1:
+            ((address, level),) = levels.items()
+            return TurnOn(address) if level is None else SetLevel(address, level)
+        shared = set(levels.values())
+        if len(shared) == 1:
+            (value,) = shared
+            return Batch(addresses=list(levels), value=value)
+        return Batch(
+            addresses=[a for a, level in levels.items() if level is None],
+            values={a: level for a, level in levels.items() if level is not None},
+        )
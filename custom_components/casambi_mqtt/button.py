@@ -1,36 +1,35 @@
-from homeassistant.components import mqtt
+from typing import TYPE_CHECKING
+
 from homeassistant.components.button import ButtonEntity
-from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
 from custom_components.casambi_mqtt.entities.commands import PublishEntities
 
-from .const import CONF_NETWORK_NAME, DOMAIN, LOGGER, MQTT_TOPIC_PREFIX
+from .const import LOGGER
+from .sender import async_send_command
+
+if TYPE_CHECKING:
+    from .data import CasambiMqttConfigEntry, CasambiMqttData
 
 
 async def async_setup_entry(
-    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+    hass: HomeAssistant,
+    entry: "CasambiMqttConfigEntry",
+    async_add_entities: AddEntitiesCallback,
 ) -> None:
-    network_name = hass.data[DOMAIN][CONF_NETWORK_NAME]
-    async_add_entities([CasambiMqttReloadButton(hass, network_name)])
+    async_add_entities([CasambiMqttReloadButton(hass, entry.runtime_data)])
 
 
 class CasambiMqttReloadButton(ButtonEntity):
-    _mqtt_network_name: str
-
-    def __init__(self, hass: HomeAssistant, network_name: str) -> None:
+    def __init__(self, hass: HomeAssistant, data: "CasambiMqttData") -> None:
         self.hass = hass
-        self._mqtt_network_name = network_name
+        self._data = data
         self._attr_name = "Reload Casambi entities"
         self._attr_unique_id = "casambi_mqtt_reload_entities"
         self._attr_icon = "mdi:cloud-download"
 
     async def async_press(self) -> None:
-        LOGGER.info("Triggering reload for %s", self._mqtt_network_name)
-        await mqtt.async_publish(
-            self.hass,
-            f"{MQTT_TOPIC_PREFIX}/{self._mqtt_network_name}/commands",
-            PublishEntities().to_json(),
-        )
+        LOGGER.info("Triggering reload for %s", self._data.network_name)
+        await async_send_command(self.hass, self._data, PublishEntities(snapshot=True))
         self.async_write_ha_state()
@@ -0,0 +1,53 @@
+from .entities.entities import Unit
+
+
+class EventCache:
+    """
+    Remembers the last payload on each topic.
+
+    A retained message that is delivered again, or a payload identical to the
+    previous one on the same topic, is recognized before it is parsed. Unit
+    classifications are cached per unit type, as all units of a type share it.
+    """
+
+    def __init__(self) -> None:
+        self._payloads: dict[str, str | bytes] = {}
+        self._classifications: dict[int, str] = {}
+        self.payload_hits = 0
+        self.payload_misses = 0
+        self.classification_hits = 0
+        self.classification_misses = 0
+
+    def unchanged(self, topic: str, payload: str | bytes) -> bool:
+        """Whether `payload` is the same as the last one stored for `topic`."""
+        if self._payloads.get(topic) == payload:
+            self.payload_hits += 1
+            return True
+        self.payload_misses += 1
+        return False
+
+    def store(self, topic: str, payload: str | bytes) -> None:
+        """Remember `payload` once it was parsed and handled."""
+        self._payloads[topic] = payload
+
+    def classify(self, unit: Unit) -> str:
+        classification = self._classifications.get(unit.unit_type.id)
+        if classification is not None:
+            self.classification_hits += 1
+            return classification
+        self.classification_misses += 1
+        classification = self._classifications[unit.unit_type.id] = unit.type()
+        return classification
+
+    def forget_classification(self, unit_type_id: int) -> None:
+        """Classify units of a type again, e.g. after their type changed."""
+        self._classifications.pop(unit_type_id, None)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "topics": len(self._payloads),
+            "payload_hits": self.payload_hits,
+            "payload_misses": self.payload_misses,
+            "classification_hits": self.classification_hits,
+            "classification_misses": self.classification_misses,
+        }
@@ -10,7 +10,24 @@ from homeassistant.core import callback
 
 from homeassistant import config_entries
 
-from .const import CONF_NETWORK_NAME, DEFAULT_NETWORK_NAME, DOMAIN
+from .const import (
+    CONF_COMMAND_QOS,
+    CONF_COMMAND_TTL,
+    CONF_NETWORK_NAME,
+    CONF_OPTIMISTIC,
+    CONF_OPTIMISTIC_TIMEOUT,
+    CONF_PAYLOAD_ENCODING,
+    CONF_STATE_WRITE_INTERVAL,
+    DEFAULT_COMMAND_QOS,
+    DEFAULT_COMMAND_TTL,
+    DEFAULT_NETWORK_NAME,
+    DEFAULT_OPTIMISTIC,
+    DEFAULT_OPTIMISTIC_TIMEOUT,
+    DEFAULT_PAYLOAD_ENCODING,
+    DEFAULT_STATE_WRITE_INTERVAL,
+    DOMAIN,
+)
+from .entities.encoding import ENCODINGS
 
 
 class CasambiMqttConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
@@ -65,7 +82,15 @@ class CasambiMqttOptionsFlow(config_entries.OptionsFlow):
             # Update the entry with the new network name
             return self.async_create_entry(
                 title="THISI STHE TITLE!",
-                data={CONF_NETWORK_NAME: user_input[CONF_NETWORK_NAME]},
+                data={
+                    CONF_NETWORK_NAME: user_input[CONF_NETWORK_NAME],
+                    CONF_STATE_WRITE_INTERVAL: user_input[CONF_STATE_WRITE_INTERVAL],
+                    CONF_OPTIMISTIC: user_input[CONF_OPTIMISTIC],
+                    CONF_OPTIMISTIC_TIMEOUT: user_input[CONF_OPTIMISTIC_TIMEOUT],
+                    CONF_COMMAND_QOS: user_input[CONF_COMMAND_QOS],
+                    CONF_COMMAND_TTL: user_input[CONF_COMMAND_TTL],
+                    CONF_PAYLOAD_ENCODING: user_input[CONF_PAYLOAD_ENCODING],
+                },
             )
 
         current_name: str = (
@@ -74,9 +99,44 @@ class CasambiMqttOptionsFlow(config_entries.OptionsFlow):
             or DEFAULT_NETWORK_NAME
         )
 
+        current_interval: float = self.entry.options.get(
+            CONF_STATE_WRITE_INTERVAL, DEFAULT_STATE_WRITE_INTERVAL
+        )
+        current_optimistic: bool = self.entry.options.get(
+            CONF_OPTIMISTIC, DEFAULT_OPTIMISTIC
+        )
+        current_optimistic_timeout: float = self.entry.options.get(
+            CONF_OPTIMISTIC_TIMEOUT, DEFAULT_OPTIMISTIC_TIMEOUT
+        )
+        current_command_qos: int = self.entry.options.get(
+            CONF_COMMAND_QOS, DEFAULT_COMMAND_QOS
+        )
+        current_command_ttl: float = self.entry.options.get(
+            CONF_COMMAND_TTL, DEFAULT_COMMAND_TTL
+        )
+        current_payload_encoding: str = self.entry.options.get(
+            CONF_PAYLOAD_ENCODING, DEFAULT_PAYLOAD_ENCODING
+        )
+
         data_schema = vol.Schema(
             {
                 vol.Required(CONF_NETWORK_NAME, default=current_name): str,
+                vol.Required(
+                    CONF_STATE_WRITE_INTERVAL, default=current_interval
+                ): vol.All(vol.Coerce(float), vol.Range(min=0, max=10)),
+                vol.Required(CONF_OPTIMISTIC, default=current_optimistic): bool,
+                vol.Required(
+                    CONF_OPTIMISTIC_TIMEOUT, default=current_optimistic_timeout
+                ): vol.All(vol.Coerce(float), vol.Range(min=0.5, max=60)),
+                vol.Required(CONF_COMMAND_QOS, default=current_command_qos): vol.In(
+                    [0, 1, 2]
+                ),
+                vol.Required(CONF_COMMAND_TTL, default=current_command_ttl): vol.All(
+                    vol.Coerce(float), vol.Range(min=0, max=3600)
+                ),
+                vol.Required(
+                    CONF_PAYLOAD_ENCODING, default=current_payload_encoding
+                ): vol.In(ENCODINGS),
             }
         )
 
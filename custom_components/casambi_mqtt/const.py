@@ -3,9 +3,32 @@ from logging import Logger, getLogger
 LOGGER: Logger = getLogger(__package__)
 
 DOMAIN = "casambi_mqtt"
-LIGHT_ADD_ENTITIES = "light_add_entities"
-SCENE_ADD_ENTITIES = "scene_add_entities"
+# New entities discovered within this many seconds are added in one batch.
+DISCOVERY_WINDOW = 0.5
 
 MQTT_TOPIC_PREFIX = "casambi"
 CONF_NETWORK_NAME = "mqtt_network_name"
 DEFAULT_NETWORK_NAME = "default"
+CONF_STATE_WRITE_INTERVAL = "state_write_interval"
+# Seconds between state writes of one entity, changes in between are coalesced.
+DEFAULT_STATE_WRITE_INTERVAL = 0.5
+CONF_OPTIMISTIC = "optimistic"
+DEFAULT_OPTIMISTIC = False
+CONF_OPTIMISTIC_TIMEOUT = "optimistic_timeout"
+# Seconds to wait for the server to confirm an optimistic state before reverting.
+DEFAULT_OPTIMISTIC_TIMEOUT = 5.0
+CONF_COMMAND_QOS = "command_qos"
+DEFAULT_COMMAND_QOS = 0
+CONF_COMMAND_TTL = "command_ttl"
+# Seconds after which the server drops a command it has not run, 0 for its default.
+DEFAULT_COMMAND_TTL = 0.0
+CONF_PAYLOAD_ENCODING = "payload_encoding"
+DEFAULT_PAYLOAD_ENCODING = "json"
+ATTR_LAST_COMMAND_FAILED = "last_command_failed"
+# Light commands issued within this many seconds are sent as one message.
+COMMAND_BATCH_WINDOW = 0.05
+AVAILABILITY_OFFLINE = "offline"
+# Commands not acked by the server within this many seconds count as unanswered.
+ACK_TIMEOUT = 30
+# Number of latencies kept per step and per unit for the statistics.
+LATENCY_SAMPLES = 100
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from homeassistant.config_entries import ConfigEntry
+
+from .cache import EventCache
+from .entities.encoding import ENCODING_JSON
+from .index import EntityIndex
+from .latency import LatencyTracker
+
+if TYPE_CHECKING:
+    from .batcher import CommandBatcher
+    from .discovery import DiscoveryBuffer
+
+
+@dataclass
+class CasambiMqttData:
+    """
+    The runtime state of one config entry, kept on `entry.runtime_data`.
+
+    Every entry has its own network, so nothing here is shared between them.
+    """
+
+    network_name: str
+    discovery: DiscoveryBuffer
+    # Options of the entry.
+    state_write_interval: float
+    optimistic: bool
+    optimistic_timeout: float
+    command_qos: int
+    command_ttl: float
+    payload_encoding: str
+    # The encoding of commands and of the unit topics read, msgpack once the
+    # server advertised that it supports it.
+    encoding: str = ENCODING_JSON
+    # Whether the server is connected to the network, from its availability topic.
+    # Servers without an availability topic are always available.
+    network_available: bool = True
+    latency: LatencyTracker = field(default_factory=LatencyTracker)
+    event_cache: EventCache = field(default_factory=EventCache)
+    index: EntityIndex = field(default_factory=EntityIndex)
+    batcher: CommandBatcher = field(init=False)
+
+
+CasambiMqttConfigEntry = ConfigEntry[CasambiMqttData]
@@ -0,0 +1,23 @@
+from typing import TYPE_CHECKING, Any
+
+from homeassistant.core import HomeAssistant
+
+if TYPE_CHECKING:
+    from .data import CasambiMqttConfigEntry
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: "CasambiMqttConfigEntry"
+) -> dict[str, Any]:
+    data = entry.runtime_data
+    return {
+        "network_name": data.network_name,
+        "encoding": data.encoding,
+        "entities": {
+            "lights": len(data.index.lights),
+            "scenes": len(data.index.scenes),
+            "groups": len(data.index.groups),
+        },
+        "event_cache": data.event_cache.stats(),
+        "command_latency": data.latency.stats(),
+    }
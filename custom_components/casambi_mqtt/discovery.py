@@ -0,0 +1,70 @@
+from collections import defaultdict
+from datetime import datetime
+
+from homeassistant.const import Platform
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.entity import Entity
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_call_later
+
+from .const import DISCOVERY_WINDOW, LOGGER
+
+
+class DiscoveryBuffer:
+    """
+    Adds newly discovered entities to their platform in batches.
+
+    On startup the broker delivers every retained message at once. New
+    entities are collected for `window` seconds and added with one call per
+    platform. Entities discovered before their platform is set up are kept
+    until it is, instead of being dropped.
+    """
+
+    def __init__(self, hass: HomeAssistant, window: float = DISCOVERY_WINDOW) -> None:
+        self.hass = hass
+        self._window = window
+        self._add_entities: dict[Platform, AddEntitiesCallback] = {}
+        self._pending: dict[Platform, list[Entity]] = defaultdict(list)
+        self._unsub_flush: CALLBACK_TYPE | None = None
+
+    @callback
+    def platform_ready(
+        self, platform: Platform, async_add_entities: AddEntitiesCallback
+    ) -> None:
+        self._add_entities[platform] = async_add_entities
+        self._flush_platform(platform)
+
+    @callback
+    def add(self, platform: Platform, entity: Entity) -> None:
+        self._pending[platform].append(entity)
+        if self._unsub_flush is None:
+            self._unsub_flush = async_call_later(self.hass, self._window, self._flush)
+
+    @callback
+    def cancel(self) -> None:
+        """Drop the entities not added yet, when the entry is unloaded."""
+        if self._unsub_flush is not None:
+            self._unsub_flush()
+            self._unsub_flush = None
+        self._pending.clear()
+        self._add_entities.clear()
+
+    @callback
+    def _flush(self, _now: datetime) -> None:
+        self._unsub_flush = None
+        for platform in list(self._pending):
+            self._flush_platform(platform)
+
+    def _flush_platform(self, platform: Platform) -> None:
+        async_add_entities = self._add_entities.get(platform)
+        if async_add_entities is None:
+            if self._pending.get(platform):
+                LOGGER.debug(
+                    f"{platform} platform not ready yet, "
+                    f"keeping {len(self._pending[platform])} new entities"
+                )
+            return
+        entities = self._pending.pop(platform, None)
+        if entities:
+            LOGGER.debug(f"Adding {len(entities)} new {platform} entities")
+            async_add_entities(entities)
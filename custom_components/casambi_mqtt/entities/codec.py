@@ -0,0 +1,381 @@
+"""
+Hand-written JSON encoders/decoders for the entities.
+
+They produce and accept the same wire format as the `dataclasses_json`
+methods on the entities, without the per-call reflection. The split topics
+(unit status, metadata and type) use compact separators.
+
+Units, unit status, metadata and types can also be packed as MessagePack
+arrays, with the fields in a fixed order instead of named. Their decoders
+accept both encodings.
+"""
+
+import json
+import secrets
+from typing import Any
+
+from .encoding import loads, packb
+from .entities import (
+    Group,
+    Scene,
+    Snapshot,
+    Unit,
+    UnitControl,
+    UnitControlType,
+    UnitMetadata,
+    UnitState,
+    UnitStatus,
+    UnitType,
+)
+
+_COMPACT = (",", ":")
+# Upper bound for the snapshot fields outside the types/units/scenes lists.
+_SNAPSHOT_OVERHEAD = 128
+# Field order of the MessagePack arrays.
+_STATUS_FIELDS = ("dimmer", "is_on", "online")
+_METADATA_FIELDS = ("address", "device_id", "name", "uuid", "unit_type_id")
+_TYPE_FIELDS = ("id", "manufacturer", "mode", "model", "state_length", "controls")
+_UNIT_FIELDS = (
+    "address",
+    "device_id",
+    "is_on",
+    "name",
+    "online",
+    "dimmer",
+    "uuid",
+    "unit_type",
+)
+
+
+def _fields(data: dict[str, Any] | list[Any], names: tuple[str, ...]) -> dict:
+    """Name the fields of a MessagePack array, a JSON object is returned as is."""
+    if isinstance(data, dict):
+        return data
+    return dict(zip(names, data, strict=True))
+
+
+def unit_type_to_dict(unit_type: UnitType) -> dict[str, Any]:
+    return {
+        "id": unit_type.id,
+        "manufacturer": unit_type.manufacturer,
+        "mode": unit_type.mode,
+        "model": unit_type.model,
+        "state_length": unit_type.state_length,
+        "controls": [
+            {
+                "default": c.default,
+                "length": c.length,
+                "offset": c.offset,
+                "readonly": c.readonly,
+                "type": {"name": c.type.name, "value": c.type.value},
+            }
+            for c in unit_type.controls
+        ],
+    }
+
+
+def unit_type_from_dict(data: dict[str, Any] | list[Any]) -> UnitType:
+    data = _fields(data, _TYPE_FIELDS)
+    return UnitType(
+        data["id"],
+        data["manufacturer"],
+        data["mode"],
+        data["model"],
+        data["state_length"],
+        [_unit_control(c) for c in data["controls"]],
+    )
+
+
+def _unit_control(data: dict[str, Any] | list[Any]) -> UnitControl:
+    if isinstance(data, list):
+        default, length, offset, readonly, name, value = data
+        return UnitControl(
+            default, length, offset, readonly, UnitControlType(name, value)
+        )
+    return UnitControl(
+        data["default"],
+        data["length"],
+        data["offset"],
+        data["readonly"],
+        UnitControlType(data["type"]["name"], data["type"]["value"]),
+    )
+
+
+def _unit_type_to_list(unit_type: UnitType) -> list[Any]:
+    return [
+        unit_type.id,
+        unit_type.manufacturer,
+        unit_type.mode,
+        unit_type.model,
+        unit_type.state_length,
+        [
+            [c.default, c.length, c.offset, c.readonly, c.type.name, c.type.value]
+            for c in unit_type.controls
+        ],
+    ]
+
+
+def unit_to_dict(unit: Unit) -> dict[str, Any]:
+    return {
+        "address": unit.address,
+        "device_id": unit.device_id,
+        "is_on": unit.is_on,
+        "name": unit.name,
+        "online": unit.online,
+        "state": {"dimmer": unit.state.dimmer},
+        "uuid": unit.uuid,
+        "unit_type": unit_type_to_dict(unit.unit_type),
+    }
+
+
+def unit_from_dict(data: dict[str, Any] | list[Any]) -> Unit:
+    if isinstance(data, list):
+        data = _fields(data, _UNIT_FIELDS)
+        data["state"] = {"dimmer": data["dimmer"]}
+    return Unit(
+        data["address"],
+        data["device_id"],
+        data["is_on"],
+        data["name"],
+        data["online"],
+        UnitState(data["state"]["dimmer"]),
+        data["uuid"],
+        unit_type_from_dict(data["unit_type"]),
+    )
+
+
+def encode_unit(unit: Unit) -> str:
+    return json.dumps(unit_to_dict(unit))
+
+
+def pack_unit(unit: Unit) -> bytes:
+    return packb(
+        [
+            unit.address,
+            unit.device_id,
+            unit.is_on,
+            unit.name,
+            unit.online,
+            unit.state.dimmer,
+            unit.uuid,
+            _unit_type_to_list(unit.unit_type),
+        ]
+    )
+
+
+def decode_unit(payload: str | bytes) -> Unit:
+    """Parse a unit, raises ValueError if the payload is not a valid unit."""
+    try:
+        return unit_from_dict(loads(payload))
+    except (KeyError, TypeError) as e:
+        msg = f"Invalid unit payload: {e!r}"
+        raise ValueError(msg) from e
+
+
+def encode_scene(scene: Scene) -> str:
+    return json.dumps({"scene_id": scene.scene_id, "name": scene.name})
+
+
+def decode_scene(payload: str | bytes) -> Scene:
+    """Parse a scene, raises ValueError if the payload is not a valid scene."""
+    try:
+        data = json.loads(payload)
+        return Scene(data["scene_id"], data["name"])
+    except (KeyError, TypeError) as e:
+        msg = f"Invalid scene payload: {e!r}"
+        raise ValueError(msg) from e
+
+
+def encode_group(group: Group) -> str:
+    return json.dumps(
+        {"group_id": group.group_id, "name": group.name, "units": group.units}
+    )
+
+
+def decode_group(payload: str | bytes) -> Group:
+    """Parse a group, raises ValueError if the payload is not a valid group."""
+    try:
+        data = json.loads(payload)
+        return Group(data["group_id"], data["name"], list(data["units"]))
+    except (KeyError, TypeError) as e:
+        msg = f"Invalid group payload: {e!r}"
+        raise ValueError(msg) from e
+
+
+def encode_unit_status(status: UnitStatus) -> str:
+    return json.dumps(
+        {"dimmer": status.dimmer, "is_on": status.is_on, "online": status.online},
+        separators=_COMPACT,
+    )
+
+
+def pack_unit_status(status: UnitStatus) -> bytes:
+    return packb([status.dimmer, status.is_on, status.online])
+
+
+def decode_unit_status(payload: str | bytes) -> UnitStatus:
+    """Parse a unit status, raises ValueError if the payload is not valid."""
+    try:
+        data = _fields(loads(payload), _STATUS_FIELDS)
+        return UnitStatus(data["dimmer"], data["is_on"], data["online"])
+    except (KeyError, TypeError) as e:
+        msg = f"Invalid unit status payload: {e!r}"
+        raise ValueError(msg) from e
+
+
+def encode_unit_metadata(metadata: UnitMetadata) -> str:
+    return json.dumps(
+        {
+            "address": metadata.address,
+            "device_id": metadata.device_id,
+            "name": metadata.name,
+            "uuid": metadata.uuid,
+            "unit_type_id": metadata.unit_type_id,
+        },
+        separators=_COMPACT,
+    )
+
+
+def pack_unit_metadata(metadata: UnitMetadata) -> bytes:
+    return packb(
+        [
+            metadata.address,
+            metadata.device_id,
+            metadata.name,
+            metadata.uuid,
+            metadata.unit_type_id,
+        ]
+    )
+
+
+def decode_unit_metadata(payload: str | bytes) -> UnitMetadata:
+    """Parse unit metadata, raises ValueError if the payload is not valid."""
+    try:
+        data = _fields(loads(payload), _METADATA_FIELDS)
+        return UnitMetadata(
+            data["address"],
+            data["device_id"],
+            data["name"],
+            data["uuid"],
+            data["unit_type_id"],
+        )
+    except (KeyError, TypeError) as e:
+        msg = f"Invalid unit metadata payload: {e!r}"
+        raise ValueError(msg) from e
+
+
+def encode_unit_type(unit_type: UnitType) -> str:
+    return json.dumps(unit_type_to_dict(unit_type), separators=_COMPACT)
+
+
+def pack_unit_type(unit_type: UnitType) -> bytes:
+    return packb(_unit_type_to_list(unit_type))
+
+
+def decode_unit_type(payload: str | bytes) -> UnitType:
+    """Parse a unit type, raises ValueError if the payload is not valid."""
+    try:
+        return unit_type_from_dict(loads(payload))
+    except (KeyError, TypeError) as e:
+        msg = f"Invalid unit type payload: {e!r}"
+        raise ValueError(msg) from e
+
+
+def encode_snapshot(
+    units: list[Unit], scenes: list[Scene], max_bytes: int = 0
+) -> list[str]:
+    """
+    Encode all units and scenes as snapshot chunks.
+
+    Each chunk is at most `max_bytes` long, unless a single unit with its type
+    or a single scene is larger than that. With `max_bytes` 0 the snapshot is
+    a single chunk. A chunk holds the types of its units, so it can be applied
+    without the other chunks.
+    """
+    unit_types = {
+        unit.unit_type.id: unit_type_to_dict(unit.unit_type) for unit in units
+    }
+    type_sizes = {
+        type_id: len(json.dumps(t, separators=_COMPACT)) + 1
+        for type_id, t in unit_types.items()
+    }
+    # Every item with the id of the type it needs, if any.
+    items: list[tuple[str, dict[str, Any], int | None]] = [
+        *(
+            (
+                "units",
+                {
+                    "address": unit.address,
+                    "device_id": unit.device_id,
+                    "name": unit.name,
+                    "uuid": unit.uuid,
+                    "unit_type_id": unit.unit_type.id,
+                    "dimmer": unit.state.dimmer,
+                    "is_on": unit.is_on,
+                    "online": unit.online,
+                },
+                unit.unit_type.id,
+            )
+            for unit in units
+        ),
+        *(("scenes", {"scene_id": s.scene_id, "name": s.name}, None) for s in scenes),
+    ]
+
+    chunks: list[dict[str, list[dict[str, Any]]]] = []
+    chunk: dict[str, list[dict[str, Any]]] = {"types": [], "units": [], "scenes": []}
+    chunk_types: set[int] = set()
+    size = _SNAPSHOT_OVERHEAD
+    for key, item, type_id in items:
+        item_size = len(json.dumps(item, separators=_COMPACT)) + 1
+        type_size = 0 if type_id is None else type_sizes[type_id]
+        needed = item_size + (0 if type_id in chunk_types else type_size)
+        if max_bytes and size + needed > max_bytes and any(chunk.values()):
+            chunks.append(chunk)
+            chunk = {"types": [], "units": [], "scenes": []}
+            chunk_types = set()
+            size = _SNAPSHOT_OVERHEAD
+            needed = item_size + type_size
+        if type_id is not None and type_id not in chunk_types:
+            chunk["types"].append(unit_types[type_id])
+            chunk_types.add(type_id)
+        chunk[key].append(item)
+        size += needed
+    chunks.append(chunk)
+
+    snapshot_id = secrets.token_hex(4)
+    return [
+        json.dumps(
+            {"snapshot_id": snapshot_id, "chunk": i, "chunks": len(chunks), **chunk},
+            separators=_COMPACT,
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def decode_snapshot(payload: str | bytes) -> Snapshot:
+    """Parse a snapshot chunk, raises ValueError if the payload is not valid."""
+    try:
+        data = json.loads(payload)
+        return Snapshot(
+            data["snapshot_id"],
+            data["chunk"],
+            data["chunks"],
+            [unit_type_from_dict(t) for t in data["types"]],
+            [
+                (
+                    UnitMetadata(
+                        u["address"],
+                        u["device_id"],
+                        u["name"],
+                        u["uuid"],
+                        u["unit_type_id"],
+                    ),
+                    UnitStatus(u["dimmer"], u["is_on"], u["online"]),
+                )
+                for u in data["units"]
+            ],
+            [Scene(s["scene_id"], s["name"]) for s in data["scenes"]],
+        )
+    except (KeyError, TypeError) as e:
+        msg = f"Invalid snapshot payload: {e!r}"
+        raise ValueError(msg) from e
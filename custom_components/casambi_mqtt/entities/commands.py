@@ -1,26 +1,85 @@
 import abc
 import json
-from dataclasses import asdict, dataclass
-from typing import ClassVar, Self
+from dataclasses import dataclass, field, fields
+from typing import Any, ClassVar, Self
+
+from .encoding import loads, packb
+
+# Field names per command class, looked up once instead of on every (de)serialize.
+_FIELD_NAMES: dict[type, tuple[str, ...]] = {}
+# Optional fields of every command, left out of the payload when not set.
+_OPTIONAL_FIELDS = ("correlation_id", "priority", "ttl")
+
+
+def _check_type(
+    name: str, value: Any, types: type | tuple[type, ...], *, optional: bool = True
+) -> None:
+    """Raise TypeError if `value` is not of `types`, a bool is not a number."""
+    if value is None and optional:
+        return
+    if isinstance(value, bool) or not isinstance(value, types):
+        msg = f"Invalid {name}: {value!r}"
+        raise TypeError(msg)
+
+
+def _field_names(cls: type) -> tuple[str, ...]:
+    names = _FIELD_NAMES.get(cls)
+    if names is None:
+        names = _FIELD_NAMES[cls] = tuple(f.name for f in fields(cls))
+    return names
 
 
 @dataclass
 class BaseCommand(abc.ABC):
+    # Echoed in the server's ack on the acks topic, to match it to this command.
+    correlation_id: str | None = field(default=None, kw_only=True)
+    # Commands with a lower number run first; by default scenes and switching
+    # on or off come before dimming.
+    priority: int | None = field(default=None, kw_only=True)
+    # Seconds after which the server drops the command if it has not run yet.
+    ttl: float | None = field(default=None, kw_only=True)
+
+    PRIORITY_HIGH: ClassVar[int] = 0
+    PRIORITY_NORMAL: ClassVar[int] = 1
+    PRIORITY_LOW: ClassVar[int] = 2
+
+    def __post_init__(self) -> None:
+        """Check the types of the scheduling fields, raises TypeError."""
+        _check_type("priority", self.priority, int)
+        _check_type("ttl", self.ttl, (int, float))
+
     @abc.abstractmethod
     def _action(self) -> str:
         pass
 
+    def _default_priority(self) -> int:
+        return self.PRIORITY_NORMAL
+
+    def effective_priority(self) -> int:
+        return self._default_priority() if self.priority is None else self.priority
+
+    def to_dict(self) -> dict[str, Any]:
+        data = {name: getattr(self, name) for name in _field_names(type(self))}
+        for name in _OPTIONAL_FIELDS:
+            if data[name] is None:
+                del data[name]
+        data["action"] = self._action()
+        return data
+
     def to_json(self) -> str:
-        data = asdict(self)
-        data.update({"action": self._action()})
-        return json.dumps(data)
+        return json.dumps(self.to_dict())
+
+    def to_msgpack(self) -> bytes:
+        return packb(self.to_dict())
 
     @classmethod
-    def from_json(cls, json_str: str) -> Self:
-        data = json.loads(json_str)
-        fields = {f.name for f in cls.__dataclass_fields__.values()}
-        filtered_data = {key: value for key, value in data.items() if key in fields}
-        return cls(**filtered_data)
+    def from_dict(cls, data: dict[str, Any]) -> Self:
+        return cls(**{name: data[name] for name in _field_names(cls) if name in data})
+
+    @classmethod
+    def from_json(cls, json_str: str | bytes) -> Self:
+        """Parse a command, encoded as JSON or as a MessagePack map."""
+        return cls.from_dict(loads(json_str))
 
 
 @dataclass
@@ -32,6 +91,9 @@ class SetLevel(BaseCommand):
     def _action(self) -> str:
         return self.ACTION
 
+    def _default_priority(self) -> int:
+        return self.PRIORITY_HIGH if self.value == 0 else self.PRIORITY_LOW
+
 
 @dataclass
 class TurnOn(BaseCommand):
@@ -41,9 +103,46 @@ class TurnOn(BaseCommand):
     def _action(self) -> str:
         return self.ACTION
 
+    def _default_priority(self) -> int:
+        return self.PRIORITY_HIGH
+
+
+@dataclass
+class Transition(BaseCommand):
+    """
+    Fade a unit to `value` in `duration` seconds.
+
+    The fade starts at `start`, or at the current level of the unit when None.
+    Any newer command for the unit cancels it.
+    """
+
+    address: str
+    value: int
+    duration: float
+    start: int | None = None
+    ACTION: ClassVar[str] = "TRANSITION"
+
+    def __post_init__(self) -> None:
+        """Check the types of the fields, raises TypeError or ValueError."""
+        super().__post_init__()
+        _check_type("value", self.value, int, optional=False)
+        _check_type("duration", self.duration, (int, float), optional=False)
+        _check_type("start", self.start, int)
+        if self.duration < 0:
+            msg = f"Invalid duration: {self.duration!r}"
+            raise ValueError(msg)
+
+    def _action(self) -> str:
+        return self.ACTION
+
+    def _default_priority(self) -> int:
+        return self.PRIORITY_HIGH if self.value == 0 else self.PRIORITY_LOW
+
 
 @dataclass
 class PublishEntities(BaseCommand):
+    # Publish all units and scenes as one snapshot instead of one scene at a time.
+    snapshot: bool = False
     ACTION: ClassVar[str] = "PUBLISH_ENTITIES"
 
     def _action(self) -> str:
@@ -57,3 +156,54 @@ class SetScene(BaseCommand):
 
     def _action(self) -> str:
         return self.ACTION
+
+    def _default_priority(self) -> int:
+        return self.PRIORITY_HIGH
+
+
+@dataclass
+class SetGroupLevel(BaseCommand):
+    """
+    Set the level of a group of units, or of all units, in one operation.
+
+    Targets the whole network when `group_id` is None. A `value` of None turns
+    the units on at their last level.
+    """
+
+    group_id: int | None
+    value: int | None = None
+    ACTION: ClassVar[str] = "SET_GROUP_LEVEL"
+
+    def _action(self) -> str:
+        return self.ACTION
+
+    def _default_priority(self) -> int:
+        return self.PRIORITY_HIGH if self.value in (None, 0) else self.PRIORITY_LOW
+
+
+@dataclass
+class Batch(BaseCommand):
+    """
+    Set the level of many units in one command.
+
+    Units in `addresses` all get `value`, or are turned on at their last level
+    when `value` is None. Units in `values` get their own level.
+    """
+
+    addresses: list[str] = field(default_factory=list)
+    value: int | None = None
+    values: dict[str, int] = field(default_factory=dict)
+    ACTION: ClassVar[str] = "BATCH"
+
+    def _action(self) -> str:
+        return self.ACTION
+
+    def _default_priority(self) -> int:
+        if all(level in (None, 0) for level in self.levels().values()):
+            return self.PRIORITY_HIGH
+        return self.PRIORITY_LOW
+
+    def levels(self) -> dict[str, int | None]:
+        levels: dict[str, int | None] = dict.fromkeys(self.addresses, self.value)
+        levels.update(self.values)
+        return levels
@@ -0,0 +1,41 @@
+"""
+Payload encodings: JSON, and MessagePack as a compact binary alternative.
+
+MessagePack is packed and parsed by the `msgpack` package.
+
+Decoders tell the encodings apart by the first byte: JSON text starts with
+an ASCII character, a MessagePack array or map with a byte of 0x80 or more.
+"""
+
+import json
+from typing import Any
+
+import msgpack
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+ENCODINGS = (ENCODING_JSON, ENCODING_MSGPACK)
+
+
+def is_msgpack(payload: str | bytes) -> bool:
+    return isinstance(payload, bytes | bytearray) and payload[:1] >= b"\x80"
+
+
+def loads(payload: str | bytes) -> Any:
+    """Parse a JSON or MessagePack payload, raises ValueError if it is neither."""
+    if is_msgpack(payload):
+        return unpackb(payload)
+    return json.loads(payload)
+
+
+def packb(value: Any) -> bytes:
+    return msgpack.packb(value)
+
+
+def unpackb(payload: bytes) -> Any:
+    """Parse a MessagePack payload, raises ValueError if it is invalid."""
+    try:
+        return msgpack.unpackb(payload)
+    except (msgpack.UnpackException, ValueError, TypeError) as e:
+        msg = f"Invalid MessagePack payload: {e!r}"
+        raise ValueError(msg) from e
@@ -39,6 +39,28 @@ class UnitState:
     # more states...
 
 
+@dataclass_json
+@dataclass
+class UnitStatus:
+    """The part of a unit that changes at runtime."""
+
+    dimmer: int | None
+    is_on: bool
+    online: bool
+
+
+@dataclass_json
+@dataclass
+class UnitMetadata:
+    """The static part of a unit, its type is published separately."""
+
+    address: str
+    device_id: int
+    name: str
+    uuid: str
+    unit_type_id: int
+
+
 @dataclass_json
 @dataclass
 class Unit:
@@ -55,6 +77,29 @@ class Unit:
     TYPE_SWITCH: ClassVar[str] = "SWITCH"
     TYPE_UNKNOWN: ClassVar[str] = "UNKNOWN"
 
+    @classmethod
+    def from_parts(
+        cls, metadata: UnitMetadata, status: UnitStatus, unit_type: UnitType
+    ) -> "Unit":
+        return cls(
+            metadata.address,
+            metadata.device_id,
+            status.is_on,
+            metadata.name,
+            status.online,
+            UnitState(status.dimmer),
+            metadata.uuid,
+            unit_type,
+        )
+
+    def status(self) -> UnitStatus:
+        return UnitStatus(self.state.dimmer, self.is_on, self.online)
+
+    def metadata(self) -> UnitMetadata:
+        return UnitMetadata(
+            self.address, self.device_id, self.name, self.uuid, self.unit_type.id
+        )
+
     def type(self) -> str:
         if len([u for u in self.unit_type.controls if u.type.name == "DIMMER"]) > 0:
             return self.TYPE_LIGHT
@@ -68,3 +113,29 @@ class Unit:
 class Scene:
     scene_id: int
     name: str
+
+
+@dataclass_json
+@dataclass
+class Group:
+    """Units that the network can set in one operation, by address."""
+
+    group_id: int
+    name: str
+    units: list[str]
+
+
+@dataclass
+class Snapshot:
+    """
+    One chunk of a snapshot of the whole network.
+
+    Snapshots are (de)serialized with `encode_snapshot`/`decode_snapshot`.
+    """
+
+    snapshot_id: str
+    chunk: int
+    chunks: int
+    types: list[UnitType]
+    units: list[tuple[UnitMetadata, UnitStatus]]
+    scenes: list[Scene]
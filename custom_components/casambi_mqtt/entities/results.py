@@ -0,0 +1,73 @@
+from dataclasses import dataclass, field
+from typing import ClassVar
+
+from dataclasses_json import dataclass_json
+
+
+@dataclass_json
+@dataclass
+class CommandError:
+    action: str | None
+    code: str
+    message: str
+    target: str | int | None = None
+    correlation_id: str | None = None
+
+    CODE_INVALID_COMMAND: ClassVar[str] = "INVALID_COMMAND"
+    CODE_UNKNOWN_TARGET: ClassVar[str] = "UNKNOWN_TARGET"
+    CODE_EXPIRED: ClassVar[str] = "EXPIRED"
+
+
+@dataclass_json
+@dataclass
+class BatchResult:
+    action: str
+    succeeded: list[str] = field(default_factory=list)
+    failed: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass_json
+@dataclass
+class CommandAck:
+    """
+    Reply to a command that carried a correlation id.
+
+    Timestamps are seconds since the epoch on the server's clock: when the
+    command was received over MQTT, when its first Bluetooth write started and
+    completed, and when the last unit it targets reported its change. A
+    timestamp is None when that step did not happen, e.g. no unit reported a
+    change before the server stopped waiting.
+    """
+
+    correlation_id: str
+    action: str | None
+    status: str = "OK"
+    error: str | None = None
+    received_at: float | None = None
+    started_at: float | None = None
+    written_at: float | None = None
+    confirmed_at: float | None = None
+
+    STATUS_OK: ClassVar[str] = "OK"
+    STATUS_FAILED: ClassVar[str] = "FAILED"
+    STATUS_DROPPED: ClassVar[str] = "DROPPED"
+    STATUS_REJECTED: ClassVar[str] = "REJECTED"
+
+    def latencies(self) -> dict[str, float]:
+        """
+        Duration of each step that happened, in milliseconds.
+
+        A unit often reports its change before the write call returns, so the
+        confirmation is measured from the start of the write.
+        """
+        steps = {
+            "queue": (self.received_at, self.started_at),
+            "write": (self.started_at, self.written_at),
+            "confirm": (self.started_at, self.confirmed_at),
+            "total": (self.received_at, self.confirmed_at or self.written_at),
+        }
+        return {
+            step: (end - start) * 1000
+            for step, (start, end) in steps.items()
+            if start is not None and end is not None
+        }
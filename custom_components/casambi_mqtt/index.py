@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+    from .light import CasambiMqttGroupLight, CasambiMqttLight
+    from .scene import CasambiMqttScene
+
+
+@dataclass
+class EntityIndex:
+    """
+    The entities of the network: lights by unit address, scenes and groups by id.
+
+    Part of the runtime state of the entry, cleared on unload.
+    """
+
+    lights: dict[str, CasambiMqttLight] = field(default_factory=dict)
+    scenes: dict[int, CasambiMqttScene] = field(default_factory=dict)
+    groups: dict[int, CasambiMqttGroupLight] = field(default_factory=dict)
+    # The light for all units of the network.
+    network: CasambiMqttGroupLight | None = None
+
+    def __iter__(
+        self,
+    ) -> Iterator[CasambiMqttLight | CasambiMqttGroupLight | CasambiMqttScene]:
+        """Iterate over all entities."""
+        yield from self.lights.values()
+        yield from self.scenes.values()
+        yield from self.groups.values()
+        if self.network is not None:
+            yield self.network
+
+    def groups_with(self, addresses: set[str]) -> Iterator[CasambiMqttGroupLight]:
+        """Get the group lights, including the network, with any of these units."""
+        for group in self.groups.values():
+            if any(group.has_member(address) for address in addresses):
+                yield group
+        if self.network is not None and addresses:
+            yield self.network
+
+    def clear(self) -> None:
+        self.lights.clear()
+        self.scenes.clear()
+        self.groups.clear()
+        self.network = None
@@ -0,0 +1,103 @@
+import secrets
+import time
+from collections import deque
+from typing import Any
+
+from .const import ACK_TIMEOUT, LATENCY_SAMPLES, LOGGER
+from .entities.commands import BaseCommand
+from .entities.results import CommandAck
+
+# Number of targets listed as the slowest in the statistics.
+_SLOWEST = 10
+
+
+def _summary(samples: deque[float]) -> dict[str, float | int]:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50_ms": round(ordered[len(ordered) // 2], 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)], 1),
+        "max_ms": round(ordered[-1], 1),
+    }
+
+
+class LatencyTracker:
+    """
+    Matches the server's acks to the commands they reply to.
+
+    Every command sent gets a correlation id. When its ack arrives the round
+    trip, measured on this side, and the steps the server timed are recorded.
+    The last `samples` latencies are kept per step, and the round trips per
+    target (unit address or scene) to find slow units. A command that is not
+    acked within `timeout` seconds is counted as unanswered.
+    """
+
+    def __init__(
+        self, samples: int = LATENCY_SAMPLES, timeout: float = ACK_TIMEOUT
+    ) -> None:
+        self._samples = samples
+        self._timeout = timeout
+        # Correlation id -> (monotonic time sent, targets), in the order sent.
+        self._sent: dict[str, tuple[float, list[str]]] = {}
+        self._steps: dict[str, deque[float]] = {}
+        self._targets: dict[str, deque[float]] = {}
+        self.statuses: dict[str, int] = {}
+        self.unanswered = 0
+        self.unmatched = 0
+
+    def track(self, command: BaseCommand, targets: list[str]) -> BaseCommand:
+        """Give `command` a correlation id and remember when it was sent."""
+        now = time.monotonic()
+        self._expire(now)
+        command.correlation_id = secrets.token_hex(6)
+        self._sent[command.correlation_id] = (now, targets)
+        return command
+
+    def ack_received(self, ack: CommandAck) -> None:
+        sent = self._sent.pop(ack.correlation_id, None)
+        if sent is None:
+            # Sent by another Home Assistant instance, or acked after timing out.
+            self.unmatched += 1
+            return
+        sent_at, targets = sent
+        round_trip = (time.monotonic() - sent_at) * 1000
+        self.statuses[ack.status] = self.statuses.get(ack.status, 0) + 1
+        if ack.status != CommandAck.STATUS_OK:
+            LOGGER.warning(
+                f"{ack.action} command for {targets} {ack.status}: {ack.error}"
+            )
+            return
+
+        self._record(self._steps, "round_trip", round_trip)
+        for step, duration in ack.latencies().items():
+            self._record(self._steps, step, duration)
+        for target in targets:
+            self._record(self._targets, target, round_trip)
+
+    def stats(self) -> dict[str, Any]:
+        targets = {
+            target: _summary(samples) for target, samples in self._targets.items()
+        }
+        slowest = sorted(targets, key=lambda t: targets[t]["p95_ms"], reverse=True)
+        return {
+            "pending": len(self._sent),
+            "unanswered": self.unanswered,
+            "unmatched": self.unmatched,
+            "statuses": dict(self.statuses),
+            "steps": {step: _summary(s) for step, s in self._steps.items()},
+            "slowest_targets": {t: targets[t] for t in slowest[:_SLOWEST]},
+        }
+
+    def _record(self, series: dict[str, deque[float]], key: str, value: float) -> None:
+        samples = series.get(key)
+        if samples is None:
+            samples = series[key] = deque(maxlen=self._samples)
+        samples.append(value)
+
+    def _expire(self, now: float) -> None:
+        while self._sent:
+            correlation_id, (sent_at, _) = next(iter(self._sent.items()))
+            if now - sent_at < self._timeout:
+                return
+            del self._sent[correlation_id]
+            self.unanswered += 1
@@ -1,61 +1,264 @@
-from typing import Any
+from collections.abc import Mapping
+from datetime import datetime
+from typing import TYPE_CHECKING, Any
 
-from homeassistant.components import mqtt
-from homeassistant.components.light import ATTR_BRIGHTNESS, ColorMode, LightEntity
-from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.components.light import (
+    ATTR_BRIGHTNESS,
+    ATTR_TRANSITION,
+    ColorMode,
+    LightEntity,
+    LightEntityFeature,
+)
+from homeassistant.const import Platform
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_call_later
 
-from custom_components.casambi_mqtt.entities.commands import SetLevel, TurnOn
+from .const import ATTR_LAST_COMMAND_FAILED, LOGGER
+from .entities.commands import SetGroupLevel, Transition
+from .entities.entities import Group, Unit
+from .sender import async_send_command
+from .throttle import StateWriteThrottle
 
-from .const import DOMAIN, LIGHT_ADD_ENTITIES, MQTT_TOPIC_PREFIX
-from .entities.entities import Unit
+if TYPE_CHECKING:
+    from .data import CasambiMqttConfigEntry, CasambiMqttData
 
 
 async def async_setup_entry(
-    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+    hass: HomeAssistant,
+    entry: "CasambiMqttConfigEntry",
+    async_add_entities: AddEntitiesCallback,
 ) -> None:
-    hass.data[DOMAIN][LIGHT_ADD_ENTITIES] = async_add_entities
+    entry.runtime_data.discovery.platform_ready(Platform.LIGHT, async_add_entities)
 
 
 class CasambiMqttLight(LightEntity):
+    """
+    A dimmable Casambi unit.
+
+    In optimistic mode the entity shows the requested state as soon as a
+    command is sent. The next event from the server confirms or corrects it;
+    without an event before the timeout the entity reverts to the last
+    reported state and flags the command as failed. A command for the level
+    the light already reports needs no event, it is confirmed right away.
+
+    Transitions are faded by the server, the entity follows the levels it
+    reports along the way.
+    """
+
     _attr_bt_address: str
-    _mqtt_network_name: str
 
     def __init__(
-        self, hass: HomeAssistant, topic: str, network_name: str, unit: Unit
+        self, hass: HomeAssistant, topic: str, data: "CasambiMqttData", unit: Unit
     ) -> None:
         self.hass = hass
-        self._mqtt_network_name = network_name
+        self._data = data
         self._attr_name = unit.name
         self._attr_unique_id = f"casambi_mqtt_light_{unit.address}"
         self._attr_is_on = unit.state.dimmer > 0
         self._attr_brightness = unit.state.dimmer
         self._attr_color_mode = ColorMode.BRIGHTNESS
         self._attr_supported_color_modes = {ColorMode.BRIGHTNESS}
+        self._attr_supported_features = LightEntityFeature.TRANSITION
         self._topic = topic
         self._attr_bt_address = unit.address
+        self._attr_available = data.network_available
+        self._state_writes = StateWriteThrottle(
+            hass, self.async_write_ha_state, data.state_write_interval
+        )
+        self._optimistic = data.optimistic
+        self._optimistic_timeout = data.optimistic_timeout
+        # The last level reported by the server, to revert to.
+        self._reported_level: int = unit.state.dimmer
+        # Level of the pending optimistic command, None when turning on.
+        self._expected_level: int | None = None
+        self._unsub_revert: CALLBACK_TYPE | None = None
+        self._attr_extra_state_attributes = {ATTR_LAST_COMMAND_FAILED: False}
+
+    @property
+    def bt_address(self) -> str:
+        return self._attr_bt_address
+
+    async def async_will_remove_from_hass(self) -> None:
+        self._state_writes.cancel()
+        self._cancel_revert()
 
     def update_entity(self, unit: Unit) -> None:
-        self._attr_is_on = unit.state.dimmer > 0
+        self._reported_level = unit.state.dimmer
+        if self._unsub_revert is not None:
+            self._cancel_revert()
+            if not self._is_expected(unit.state.dimmer):
+                LOGGER.debug(
+                    f"Light {self._attr_name} reported level {unit.state.dimmer}, "
+                    f"correcting optimistic state"
+                )
+        failed_cleared = self._attr_extra_state_attributes[ATTR_LAST_COMMAND_FAILED]
+        self._attr_extra_state_attributes = {ATTR_LAST_COMMAND_FAILED: False}
+
+        is_on = unit.state.dimmer > 0
+        if (
+            not failed_cleared
+            and is_on == self._attr_is_on
+            and unit.state.dimmer == self._attr_brightness
+        ):
+            return
+        self._attr_is_on = is_on
         self._attr_brightness = unit.state.dimmer
-        self.async_write_ha_state()
+        # Lights still waiting in the discovery buffer get this state when added.
+        if self.entity_id is not None:
+            self._state_writes.request()
+
+    def set_available(self, *, available: bool) -> None:
+        self._attr_available = available
+        if self.entity_id is not None:
+            self._state_writes.request()
 
     async def async_turn_on(self, **kwargs: Any) -> None:
-        if ATTR_BRIGHTNESS in kwargs:
-            command = SetLevel(self._attr_bt_address, kwargs[ATTR_BRIGHTNESS])
+        level = kwargs.get(ATTR_BRIGHTNESS)
+        if kwargs.get(ATTR_TRANSITION):
+            # Fading to the last level needs it up front, which is unknown when off.
+            await self._fade(
+                level or self._attr_brightness or 255, kwargs[ATTR_TRANSITION]
+            )
+        else:
+            await self._set_level(level)
+
+    async def async_turn_off(self, **kwargs: Any) -> None:
+        if kwargs.get(ATTR_TRANSITION):
+            await self._fade(0, kwargs[ATTR_TRANSITION])
         else:
-            command = TurnOn(self._attr_bt_address)
-        await mqtt.async_publish(
-            self.hass,
-            f"{MQTT_TOPIC_PREFIX}/{self._mqtt_network_name}/commands",
-            command.to_json(),
+            await self._set_level(0)
+
+    async def _fade(self, level: int, duration: float) -> None:
+        command = self._data.latency.track(
+            Transition(self._attr_bt_address, level, duration),
+            [self._attr_bt_address],
         )
+        await async_send_command(self.hass, self._data, command)
+
+    async def _set_level(self, level: int | None) -> None:
+        """Send a level to the unit, None turns it on at its last level."""
+        if self._optimistic:
+            self._apply_optimistic(level)
+        try:
+            await self._data.batcher.set_level(self._attr_bt_address, level)
+        except Exception:
+            if self._unsub_revert is not None:
+                self._revert(None)
+            raise
+
+    def _apply_optimistic(self, level: int | None) -> None:
+        self._cancel_revert()
+        self._expected_level = level
+        self._attr_is_on = level is None or level > 0
+        if level is not None:
+            self._attr_brightness = level
+        elif not self._attr_brightness:
+            # Turning on restores the last level, which is unknown when off.
+            self._attr_brightness = 255
+        if self._is_expected(self._reported_level):
+            # Already at the requested level, the server reports no change.
+            self._attr_brightness = self._reported_level
+            self._attr_extra_state_attributes = {ATTR_LAST_COMMAND_FAILED: False}
+        else:
+            self._unsub_revert = async_call_later(
+                self.hass, self._optimistic_timeout, self._revert
+            )
+        self.async_write_ha_state()
+
+    def _is_expected(self, level: int) -> bool:
+        if self._expected_level is None:
+            return level > 0
+        return level == self._expected_level
+
+    @callback
+    def _revert(self, _now: datetime | None) -> None:
+        self._cancel_revert()
+        LOGGER.warning(
+            f"Light {self._attr_name} did not confirm the requested state, "
+            f"reverting to level {self._reported_level}"
+        )
+        self._attr_is_on = self._reported_level > 0
+        self._attr_brightness = self._reported_level
+        self._attr_extra_state_attributes = {ATTR_LAST_COMMAND_FAILED: True}
+        self.async_write_ha_state()
+
+    def _cancel_revert(self) -> None:
+        if self._unsub_revert is not None:
+            self._unsub_revert()
+            self._unsub_revert = None
+
+
+class CasambiMqttGroupLight(LightEntity):
+    """
+    A Casambi group, or the whole network when `group` is None, as one light.
+
+    The server sets all units of the group in a single operation. The group
+    is on when any of its lights is, at the highest level among them.
+    """
+
+    def __init__(
+        self, hass: HomeAssistant, data: "CasambiMqttData", group: Group | None
+    ) -> None:
+        self.hass = hass
+        self._data = data
+        self._group_id = None if group is None else group.group_id
+        self._members: frozenset[str] | None = None
+        if group is None:
+            self._attr_name = "All Casambi lights"
+            self._attr_unique_id = f"casambi_mqtt_network_{data.network_name}"
+        else:
+            self._attr_unique_id = f"casambi_mqtt_group_{group.group_id}"
+            self.update_entity(group)
+        self._attr_is_on = False
+        self._attr_brightness = 0
+        self._attr_color_mode = ColorMode.BRIGHTNESS
+        self._attr_supported_color_modes = {ColorMode.BRIGHTNESS}
+        self._attr_available = data.network_available
+        self._state_writes = StateWriteThrottle(
+            hass, self.async_write_ha_state, data.state_write_interval
+        )
+
+    async def async_will_remove_from_hass(self) -> None:
+        self._state_writes.cancel()
+
+    def update_entity(self, group: Group) -> None:
+        self._attr_name = group.name
+        self._members = frozenset(group.units)
+
+    def has_member(self, address: str) -> bool:
+        return self._members is None or address in self._members
+
+    def update_members(self, lights: Mapping[str, CasambiMqttLight]) -> None:
+        """Take the state of the group from the lights of the network, by address."""
+        members = (
+            lights.values()
+            if self._members is None
+            else (lights[a] for a in self._members if a in lights)
+        )
+        levels = [light.brightness or 0 for light in members if light.is_on]
+        brightness = max(levels, default=0)
+        if bool(levels) == self._attr_is_on and brightness == self._attr_brightness:
+            return
+        self._attr_is_on = bool(levels)
+        self._attr_brightness = brightness
+        if self.entity_id is not None:
+            self._state_writes.request()
+
+    def set_available(self, *, available: bool) -> None:
+        self._attr_available = available
+        if self.entity_id is not None:
+            self._state_writes.request()
+
+    async def async_turn_on(self, **kwargs: Any) -> None:
+        await self._set_level(kwargs.get(ATTR_BRIGHTNESS))
 
     async def async_turn_off(self, **kwargs: Any) -> None:
-        command = SetLevel(self._attr_bt_address, 0)
-        await mqtt.async_publish(
-            self.hass,
-            f"{MQTT_TOPIC_PREFIX}/{self._mqtt_network_name}/commands",
-            command.to_json(),
+        await self._set_level(0)
+
+    async def _set_level(self, level: int | None) -> None:
+        target = "network" if self._group_id is None else f"group/{self._group_id}"
+        command = self._data.latency.track(
+            SetGroupLevel(self._group_id, level), [target]
         )
+        await async_send_command(self.hass, self._data, command)
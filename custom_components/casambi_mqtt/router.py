@@ -0,0 +1,44 @@
+from collections.abc import Awaitable, Callable
+
+from homeassistant.components.mqtt import ReceiveMessage
+
+from .const import LOGGER, MQTT_TOPIC_PREFIX
+
+# Gets the message and the rest of its topic after the kind, None if there is none.
+Handler = Callable[[ReceiveMessage, str | None], Awaitable[None]]
+
+
+class TopicRouter:
+    """
+    Dispatches the messages of a single `casambi/<network>/#` subscription.
+
+    A handler is registered per kind of topic, the segment after the network
+    name, and gets the rest of the topic as key: the address for
+    `casambi/<network>/state/<address>`, None for `casambi/<network>/acks`.
+    Topics of other kinds, like the commands this integration sends, are
+    ignored.
+    """
+
+    def __init__(self, network_name: str) -> None:
+        self._prefix = f"{MQTT_TOPIC_PREFIX}/{network_name}/"
+        self._handlers: dict[str, Handler] = {}
+
+    @property
+    def topic(self) -> str:
+        return f"{self._prefix}#"
+
+    def route(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    def handler(self, kind: str) -> Handler:
+        return self._handlers[kind]
+
+    async def handle(self, msg: ReceiveMessage) -> None:
+        if not msg.topic.startswith(self._prefix):
+            return
+        kind, _, key = msg.topic[len(self._prefix) :].partition("/")
+        handler = self._handlers.get(kind)
+        if handler is None:
+            LOGGER.debug(f"Ignoring message on {msg.topic}")
+            return
+        await handler(msg, key or None)
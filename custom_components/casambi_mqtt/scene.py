@@ -1,47 +1,66 @@
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from homeassistant.components import mqtt
 from homeassistant.components.scene import Scene as HAScene
-from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 
 from custom_components.casambi_mqtt.entities.commands import SetScene
 
-from .const import DOMAIN, MQTT_TOPIC_PREFIX, SCENE_ADD_ENTITIES
 from .entities.entities import Scene
+from .sender import async_send_command
+from .throttle import StateWriteThrottle
+
+if TYPE_CHECKING:
+    from .data import CasambiMqttConfigEntry, CasambiMqttData
 
 
 async def async_setup_entry(
-    hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
+    hass: HomeAssistant,
+    entry: "CasambiMqttConfigEntry",
+    async_add_entities: AddEntitiesCallback,
 ) -> None:
-    hass.data[DOMAIN][SCENE_ADD_ENTITIES] = async_add_entities
+    entry.runtime_data.discovery.platform_ready(Platform.SCENE, async_add_entities)
 
 
 class CasambiMqttScene(HAScene):
     _attr_casambi_id: int
-    _mqtt_network_name: str
 
-    def __init__(self, hass: HomeAssistant, network_name: str, scene: Scene) -> None:
+    def __init__(
+        self, hass: HomeAssistant, data: "CasambiMqttData", scene: Scene
+    ) -> None:
         self.hass = hass
-        self._mqtt_network_name = network_name
+        self._data = data
         self._attr_casambi_id = scene.scene_id
         self._attr_unique_id = f"casambi_mqtt_scene_{scene.scene_id}"
         self._attr_name = scene.name
         self._attr_icon = "mdi:lamps"
+        self._attr_available = data.network_available
+        self._state_writes = StateWriteThrottle(
+            hass, self.async_write_ha_state, data.state_write_interval
+        )
 
     @property
     def name(self) -> str:
         return self._attr_name
 
+    async def async_will_remove_from_hass(self) -> None:
+        self._state_writes.cancel()
+
     def update_entity(self, scene: Scene) -> None:
+        if scene.name == self._attr_name:
+            return
         self._attr_name = scene.name
-        self.async_write_ha_state()
+        if self.entity_id is not None:
+            self._state_writes.request()
+
+    def set_available(self, *, available: bool) -> None:
+        self._attr_available = available
+        if self.entity_id is not None:
+            self._state_writes.request()
 
     async def async_activate(self, **kwargs: Any) -> None:
-        command = SetScene(self._attr_casambi_id)
-        await mqtt.async_publish(
-            self.hass,
-            f"{MQTT_TOPIC_PREFIX}/{self._mqtt_network_name}/commands",
-            command.to_json(),
+        command = self._data.latency.track(
+            SetScene(self._attr_casambi_id), [f"scene/{self._attr_casambi_id}"]
         )
+        await async_send_command(self.hass, self._data, command)
@@ -0,0 +1,33 @@
+from typing import TYPE_CHECKING
+
+from homeassistant.components import mqtt
+from homeassistant.core import HomeAssistant
+
+from .const import MQTT_TOPIC_PREFIX
+from .entities.commands import BaseCommand
+from .entities.encoding import ENCODING_MSGPACK
+
+if TYPE_CHECKING:
+    from .data import CasambiMqttData
+
+
+async def async_send_command(
+    hass: HomeAssistant, data: "CasambiMqttData", command: BaseCommand
+) -> None:
+    """
+    Publish a command to the server, with the QoS and TTL from the options.
+
+    Commands are never retained, a retained command would run again whenever
+    the server reconnects. They are packed as MessagePack once the server
+    advertised that it supports it, if that encoding is selected.
+    """
+    if command.ttl is None and data.command_ttl:
+        command.ttl = data.command_ttl
+    packed = data.encoding == ENCODING_MSGPACK
+    await mqtt.async_publish(
+        hass,
+        f"{MQTT_TOPIC_PREFIX}/{data.network_name}/commands",
+        command.to_msgpack() if packed else command.to_json(),
+        data.command_qos,
+        retain=False,
+    )
@@ -0,0 +1,50 @@
+from collections.abc import Callable
+from datetime import datetime
+
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later
+
+
+class StateWriteThrottle:
+    """
+    Rate limits the state writes of one entity.
+
+    The first write is done immediately. Writes requested within `interval`
+    seconds after it are coalesced into one write at the end of the interval,
+    so the final state is always written. An interval of 0 disables throttling.
+    """
+
+    def __init__(
+        self, hass: HomeAssistant, write: Callable[[], None], interval: float
+    ) -> None:
+        self.hass = hass
+        self._write = write
+        self._interval = interval
+        self._pending = False
+        self._unsub: CALLBACK_TYPE | None = None
+
+    @callback
+    def request(self) -> None:
+        if self._interval <= 0:
+            self._write()
+        elif self._unsub is not None:
+            self._pending = True
+        else:
+            self._write()
+            self._unsub = async_call_later(
+                self.hass, self._interval, self._interval_end
+            )
+
+    @callback
+    def cancel(self) -> None:
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+        self._pending = False
+
+    @callback
+    def _interval_end(self, _now: datetime) -> None:
+        self._unsub = None
+        if self._pending:
+            self._pending = False
+            self.request()
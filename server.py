@@ -3,21 +3,59 @@ import json
 import logging
 import os
 import sys
-from collections.abc import Awaitable
-from typing import TYPE_CHECKING, Any
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Any
 
 import aiomqtt
 import CasambiBt
+from bleak import BleakScanner
+from bleak.exc import BleakError
 from CasambiBt import Casambi, discover
+from CasambiBt.errors import (
+    AuthenticationError,
+    BluetoothError,
+    CasambiBtError,
+    NetworkNotFoundError,
+)
 from dotenv import load_dotenv
 
+from casambi_server.backoff import Backoff
+from casambi_server.batch import BatchTracker
+from casambi_server.cache import CachedNetwork, NetworkCache
+from casambi_server.dispatcher import CommandDispatcher, OverflowPolicy
+from casambi_server.events import UnitEventPublisher
+from casambi_server.fades import Fade, FadeEngine
+from casambi_server.metrics import COUNTER, GAUGE, HISTOGRAM, Metrics, serve_metrics
+from casambi_server.publisher import BrokerClient, Delivery, Publisher
+from casambi_server.registry import EntityRegistry, UnknownTargetError
+from casambi_server.tracing import CommandTracer
+from custom_components.casambi_mqtt.entities.codec import (
+    encode_group,
+    encode_scene,
+    encode_snapshot,
+)
 from custom_components.casambi_mqtt.entities.commands import (
+    BaseCommand,
+    Batch,
     PublishEntities,
+    SetGroupLevel,
     SetLevel,
     SetScene,
+    Transition,
     TurnOn,
 )
+from custom_components.casambi_mqtt.entities.encoding import (
+    ENCODING_JSON,
+    ENCODING_MSGPACK,
+    ENCODINGS,
+    loads,
+)
 from custom_components.casambi_mqtt.entities.entities import (
+    Group,
     Scene,
     Unit,
     UnitControl,
@@ -25,9 +63,11 @@ from custom_components.casambi_mqtt.entities.entities import (
     UnitState,
     UnitType,
 )
-
-if TYPE_CHECKING:
-    from bleak import BLEDevice
+from custom_components.casambi_mqtt.entities.results import (
+    BatchResult,
+    CommandAck,
+    CommandError,
+)
 
 TOPIC_PREFIX = "casambi"
 
@@ -37,9 +77,53 @@ MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD")
+MQTT_PROTOCOL = os.getenv("MQTT_PROTOCOL", "3.1.1")
+MQTT_STATE_QOS = int(os.getenv("MQTT_STATE_QOS", "1"))
+MQTT_STATE_RETAIN = os.getenv("MQTT_STATE_RETAIN", "true").lower() == "true"
+MQTT_METADATA_QOS = int(os.getenv("MQTT_METADATA_QOS", "1"))
+MQTT_METADATA_RETAIN = os.getenv("MQTT_METADATA_RETAIN", "true").lower() == "true"
+MQTT_COMMAND_QOS = int(os.getenv("MQTT_COMMAND_QOS", "1"))
+MQTT_REPLY_EXPIRY = int(os.getenv("MQTT_REPLY_EXPIRY", "0"))
+MQTT_TOPIC_ALIAS_MAXIMUM = int(os.getenv("MQTT_TOPIC_ALIAS_MAXIMUM", "0"))
 NETWORK_ADDRESS = os.getenv("CASAMBI_NETWORK_ADDRESS")
 NETWORK_PASSWORD = os.getenv("CASAMBI_NETWORK_PASSWORD")
 NETWORK_NAME = os.getenv("CASAMBI_NETWORK_NAME", "default")
+# Several networks as `<name>=<address>,...`, instead of the three settings above.
+NETWORKS = os.getenv("CASAMBI_NETWORKS")
+COMMAND_CONCURRENCY = int(os.getenv("COMMAND_CONCURRENCY", "4"))
+COMMAND_QUEUE_SIZE = int(os.getenv("COMMAND_QUEUE_SIZE", "256"))
+COMMAND_OVERFLOW_POLICY = OverflowPolicy(
+    os.getenv("COMMAND_OVERFLOW_POLICY", OverflowPolicy.DROP_OLDEST)
+)
+PUBLISH_CONCURRENCY = int(os.getenv("PUBLISH_CONCURRENCY", "8"))
+PUBLISH_QUEUE_SIZE = int(os.getenv("PUBLISH_QUEUE_SIZE", "1024"))
+SNAPSHOT_CHUNK_SIZE = int(os.getenv("SNAPSHOT_CHUNK_SIZE", "0"))
+LEGACY_EVENTS = os.getenv("LEGACY_EVENTS", "false").lower() == "true"
+ACK_CONFIRM_TIMEOUT = float(os.getenv("ACK_CONFIRM_TIMEOUT", "5"))
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", "60"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+SCAN_TIMEOUT = float(os.getenv("SCAN_TIMEOUT", "5"))
+MQTT_RECONNECT_DELAY = float(os.getenv("MQTT_RECONNECT_DELAY", "1"))
+MQTT_RECONNECT_MAX_DELAY = float(os.getenv("MQTT_RECONNECT_MAX_DELAY", "60"))
+BLE_RECONNECT_DELAY = float(os.getenv("BLE_RECONNECT_DELAY", "1"))
+BLE_RECONNECT_MAX_DELAY = float(os.getenv("BLE_RECONNECT_MAX_DELAY", "60"))
+COMMAND_DEADLINE = float(os.getenv("COMMAND_DEADLINE", "30"))
+FADE_RATE = float(os.getenv("FADE_RATE", "20"))
+# Tags the dispatcher jobs of fade steps.
+FADE_STEP = "fade_step"
+AVAILABILITY_ONLINE = "online"
+AVAILABILITY_OFFLINE = "offline"
+MQTT5 = MQTT_PROTOCOL == "5"
+# Unit state, published on every change of a unit.
+STATE = Delivery(MQTT_STATE_QOS, MQTT_STATE_RETAIN, alias=True)
+# Units, unit types and scenes, published when they change.
+METADATA = Delivery(MQTT_METADATA_QOS, MQTT_METADATA_RETAIN)
+# Acks, errors, results and snapshots, in reply to commands.
+REPLIES = Delivery(
+    MQTT_COMMAND_QOS, retain=False, latest=False, expiry=MQTT_REPLY_EXPIRY or None
+)
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(LOG_LEVEL)
 handler = logging.StreamHandler()
@@ -47,15 +131,108 @@ handler.setFormatter(
     logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s")
 )
 LOGGER.addHandler(handler)
+logging.getLogger("casambi_server").setLevel(LOG_LEVEL)
+logging.getLogger("casambi_server").addHandler(handler)
 
-background_tasks = set()
 
+@dataclass
+class NetworkConfig:
+    name: str
+    address: str | None
+    password: str | None
 
-async def log_exceptions(awaitable: Awaitable[Any]) -> Any:
-    try:
-        return await awaitable
-    except aiomqtt.MqttError as e:
-        LOGGER.warning("Unhandled exception: %s", e)
+
+@dataclass
+class Context:
+    """
+    A Casambi network served by this process.
+
+    Every network has its own connection, command queue and inbox; only the
+    MQTT client and the publisher are shared. Commands are handled by a task
+    per network, so a slow or disconnected network does not hold up others.
+    """
+
+    name: str
+    casa: Casambi
+    publisher: Publisher
+    registry: EntityRegistry
+    dispatcher: CommandDispatcher
+    metrics: Metrics
+    address: str | None = None
+    password: str | None = field(default=None, repr=False)
+    cache: NetworkCache | None = None
+    # Shared by all networks, which share the Bluetooth adapter.
+    fades: FadeEngine = field(default_factory=lambda: FadeEngine(FADE_RATE))
+    tracer: CommandTracer = field(init=False)
+    unit_events: UnitEventPublisher = field(init=False)
+    # Commands with the time they were received, waiting to be handled.
+    inbox: asyncio.Queue[tuple[float, aiomqtt.Message]] = field(init=False)
+    # Until connected for the first time.
+    cached: CachedNetwork | None = field(init=False)
+    # Set while connected, once the registry is loaded.
+    ready: asyncio.Event = field(init=False)
+    link_lost: asyncio.Event = field(init=False)
+
+    def __post_init__(self) -> None:
+        """Create the parts that depend on the name of the network."""
+        self.tracer = CommandTracer(partial(publish_ack, self), ACK_CONFIRM_TIMEOUT)
+        self.unit_events = UnitEventPublisher(
+            self.publisher,
+            self.topic(),
+            legacy_events=LEGACY_EVENTS,
+            state=STATE,
+            metadata=METADATA,
+        )
+        self.inbox = asyncio.Queue(COMMAND_QUEUE_SIZE)
+        self.ready = asyncio.Event()
+        self.link_lost = asyncio.Event()
+        self.cached = self.cache.load() if self.cache is not None else None
+        if self.cached is not None and self.address in (None, self.cached.address):
+            self.address = self.cached.address
+        else:
+            # Nothing cached, or cached for a network at another address.
+            self.cached = None
+
+    def topic(self, *parts: str) -> str:
+        return "/".join((TOPIC_PREFIX, self.name, *parts))
+
+    def on_unit_changed(self, unit: CasambiBt.Unit) -> None:
+        self.registry.update_unit(unit)
+        self.tracer.unit_changed(unit.address)
+        self.unit_events.publish(to_entity(unit))
+
+    def entities(self) -> tuple[list[Unit], list[Scene]]:
+        """Get the units and scenes, as cached until the network is connected."""
+        if self.cached is not None:
+            return self.cached.units, self.cached.scenes
+        return (
+            [to_entity(u) for u in self.registry.units],
+            [to_scene(s) for s in self.registry.scenes],
+        )
+
+    def load(self) -> None:
+        """Load the registry from the connected network."""
+        self.registry.load(self.casa)
+        self.cached = None
+        self.ready.set()
+        self.save()
+
+    def save(self) -> None:
+        if self.cache is not None and self.address and self.cached is None:
+            units, scenes = self.entities()
+            if units or scenes:
+                self.cache.save(self.address, units, scenes)
+
+
+ACTIONS = (
+    SetLevel.ACTION,
+    TurnOn.ACTION,
+    Batch.ACTION,
+    PublishEntities.ACTION,
+    SetScene.ACTION,
+    Transition.ACTION,
+    SetGroupLevel.ACTION,
+)
 
 
 def to_unit_control_type(t: CasambiBt.UnitControlType) -> UnitControlType:
@@ -79,7 +256,10 @@ def to_unit_type(t: CasambiBt.UnitType) -> UnitType:
     )
 
 
-def to_unit_state(s: CasambiBt.UnitState) -> UnitState:
+def to_unit_state(s: CasambiBt.UnitState | None) -> UnitState:
+    # A unit has no state until the network sent its first notification.
+    if s is None:
+        return UnitState(None)
     return UnitState(s.dimmer)
 
 
@@ -100,111 +280,956 @@ def to_scene(scene: CasambiBt.Scene) -> Scene:
     return Scene(scene.sceneId, scene.name)
 
 
+def to_group(group: CasambiBt.Group) -> Group:
+    return Group(group.groudId, group.name, [u.address for u in group.units])
+
+
+def publish_error(ctx: Context, error: CommandError) -> None:
+    ctx.publisher.publish(ctx.topic("errors"), error.to_json(), REPLIES)
+
+
+def publish_ack(ctx: Context, ack: CommandAck) -> None:
+    ctx.publisher.publish(ctx.topic("acks"), ack.to_json(), REPLIES)
+
+
+def publish_availability(ctx: Context) -> None:
+    online = ctx.ready.is_set()
+    ctx.publisher.publish(
+        ctx.topic("availability"),
+        AVAILABILITY_ONLINE if online else AVAILABILITY_OFFLINE,
+    )
+
+
+def publish_capabilities(ctx: Context) -> None:
+    """Advertise the payload encodings clients may select on the encoding topic."""
+    ctx.publisher.publish(
+        ctx.topic("capabilities"), json.dumps({"encodings": list(ENCODINGS)})
+    )
+
+
+def set_encoding(ctx: Context, payload: bytes) -> None:
+    """
+    Start or stop the MessagePack copies of the unit topics.
+
+    MessagePack is selected on the encoding topic, an empty payload or `json`
+    stops them. The JSON unit topics are always published, so a client
+    selecting MessagePack does not affect the others.
+    """
+    encoding = payload.decode(errors="replace").strip() or ENCODING_JSON
+    if encoding not in ENCODINGS:
+        LOGGER.warning(
+            "Ignoring unknown payload encoding %r for %s", encoding, ctx.name
+        )
+        return
+    packed = encoding == ENCODING_MSGPACK
+    if packed == ctx.unit_events.packed:
+        return
+    LOGGER.info(
+        "%s MessagePack copies of the units of %s",
+        "Publishing" if packed else "No longer publishing",
+        ctx.name,
+    )
+    ctx.unit_events.packed = packed
+    if packed:
+        # The JSON topics are unchanged, the publisher suppresses them.
+        ctx.unit_events.reset()
+        for unit in ctx.entities()[0]:
+            ctx.unit_events.publish(unit)
+
+
+def publish_batch_result(ctx: Context, result: BatchResult) -> None:
+    if result.failed:
+        LOGGER.warning(
+            "Batch command failed for %d units in %s", len(result.failed), ctx.name
+        )
+    ctx.publisher.publish(ctx.topic("results"), result.to_json(), REPLIES)
+
+
+def publish_snapshot(ctx: Context) -> None:
+    units, scenes = ctx.entities()
+    chunks = encode_snapshot(units, scenes, SNAPSHOT_CHUNK_SIZE)
+    LOGGER.info(
+        "Publishing snapshot of %s with %d units and %d scenes in %d chunk(s)",
+        ctx.name,
+        len(units),
+        len(scenes),
+        len(chunks),
+    )
+    for chunk in chunks:
+        ctx.publisher.publish(ctx.topic("snapshot"), chunk, REPLIES)
+
+
+def message_expiry(message: aiomqtt.Message) -> int | None:
+    """Seconds left until an MQTT 5 message expires, None if it does not."""
+    if message.properties is None:
+        return None
+    return getattr(message.properties, "MessageExpiryInterval", None)
+
+
+def deadline(ttl: float | None, received_at: float) -> float:
+    """Time after which a command is dropped instead of run."""
+    return received_at + (COMMAND_DEADLINE if ttl is None else ttl)
+
+
+async def submit_command(  # noqa: PLR0913
+    ctx: Context,
+    cmd: BaseCommand,
+    received_at: float,
+    key: str,
+    run: Callable[[], Awaitable[None]],
+    *,
+    confirm: Iterable[str] = (),
+    coalesce: bool = False,
+    targets: Iterable[str] | None = None,
+    supersede: bool = False,
+) -> None:
+    """Queue a command, see `CommandDispatcher.submit` for the options."""
+    priority = cmd.effective_priority()
+    until = deadline(cmd.ttl, received_at)
+    if cmd.correlation_id is None:
+        await ctx.dispatcher.submit(
+            key,
+            run,
+            coalesce=coalesce,
+            priority=priority,
+            deadline=until,
+            targets=targets,
+            supersede=supersede,
+        )
+        return
+    trace = ctx.tracer.start(
+        cmd.correlation_id, cmd.ACTION, received_at, [key], confirm=confirm
+    )
+    await ctx.dispatcher.submit(
+        key,
+        trace.wrap([key], run),
+        coalesce=coalesce,
+        on_dropped=trace.on_dropped([key]),
+        priority=priority,
+        deadline=until,
+        targets=targets,
+        supersede=supersede,
+    )
+
+
+async def process_batch(cmd: Batch, ctx: Context, received_at: float) -> None:
+    levels = cmd.levels()
+    cancel_fades(ctx, levels)
+    priority = cmd.effective_priority()
+    until = deadline(cmd.ttl, received_at)
+    on_done = partial(publish_batch_result, ctx)
+    tracker = (
+        BatchTracker(Batch.ACTION, list(levels), on_done)
+        if cmd.correlation_id is None
+        else ctx.tracer.start(
+            cmd.correlation_id,
+            Batch.ACTION,
+            received_at,
+            list(levels),
+            confirm=levels,
+            on_done=on_done,
+        )
+    )
+
+    shared = set(levels.values())
+    all_units = {u.address for u in ctx.registry.units}
+    network = levels.keys() == all_units
+    group = None if network else ctx.registry.group_of(levels)
+    if len(shared) == 1 and (network or group is not None):
+        # Every unit of the network or of a group gets the same level, which is
+        # a single operation instead of one per unit.
+        (level,) = shared
+        addresses = list(levels)
+        run = (
+            partial(ctx.metrics.ble, ctx.casa.turnOn, group)
+            if level is None
+            else partial(ctx.metrics.ble, ctx.casa.setLevel, group, level)
+        )
+        await ctx.dispatcher.submit(
+            "network" if group is None else f"group/{group.groudId}",
+            tracker.wrap(addresses, run),
+            on_dropped=tracker.on_dropped(addresses),
+            priority=priority,
+            deadline=until,
+            targets=addresses,
+            supersede=True,
+        )
+    else:
+        for address, level in levels.items():
+            try:
+                unit = ctx.registry.unit(address)
+            except UnknownTargetError as e:
+                tracker.fail([address], str(e))
+                continue
+            run = (
+                partial(ctx.metrics.ble, ctx.casa.turnOn, unit)
+                if level is None
+                else partial(ctx.metrics.ble, ctx.casa.setLevel, unit, level)
+            )
+            await ctx.dispatcher.submit(
+                unit.address,
+                tracker.wrap([address], run),
+                on_dropped=tracker.on_dropped([address]),
+                priority=priority,
+                deadline=until,
+            )
+
+
+async def set_group_level(cmd: SetGroupLevel, ctx: Context, received_at: float) -> None:
+    if cmd.group_id is None:
+        group = None
+        key = "network"
+        addresses = [u.address for u in ctx.registry.units]
+        cancel_fades(ctx)
+    else:
+        group = ctx.registry.group(cmd.group_id)
+        key = f"group/{cmd.group_id}"
+        addresses = [u.address for u in group.units]
+        cancel_fades(ctx, addresses)
+    run = (
+        partial(ctx.metrics.ble, ctx.casa.turnOn, group)
+        if cmd.value is None
+        else partial(ctx.metrics.ble, ctx.casa.setLevel, group, cmd.value)
+    )
+    # Replaces the levels still waiting for its units, runs after the others.
+    await submit_command(
+        ctx,
+        cmd,
+        received_at,
+        key,
+        run,
+        confirm=addresses,
+        targets=addresses,
+        supersede=True,
+    )
+
+
+def cancel_fades(ctx: Context, addresses: Iterable[str] | None = None) -> None:
+    """Cancel the fades of units, or of all units, and drop their waiting steps."""
+    if addresses is None:
+        ctx.fades.cancel(ctx.name)
+        addresses = [u.address for u in ctx.registry.units]
+    else:
+        for address in addresses:
+            ctx.fades.cancel(ctx.name, address)
+    ctx.dispatcher.drop_waiting(addresses, FADE_STEP)
+
+
+def start_fade(cmd: Transition, ctx: Context, received_at: float) -> None:
+    """
+    Fade a unit in steps, of which only the last one is traced.
+
+    Steps are queued on the unit's lane like other commands and replace a step
+    still waiting there. Cancelling the fade drops its waiting step.
+    """
+    unit = ctx.registry.unit(cmd.address)
+    priority = cmd.effective_priority()
+    trace = (
+        None
+        if cmd.correlation_id is None
+        else ctx.tracer.start(
+            cmd.correlation_id,
+            cmd.ACTION,
+            received_at,
+            [unit.address],
+            confirm=[unit.address],
+        )
+    )
+
+    async def step(level: int, final: bool) -> None:  # noqa: FBT001
+        run = partial(ctx.metrics.ble, ctx.casa.setLevel, unit, level)
+        if not final or trace is None:
+            await ctx.dispatcher.submit(
+                unit.address, run, coalesce=True, priority=priority, tag=FADE_STEP
+            )
+            return
+        await ctx.dispatcher.submit(
+            unit.address,
+            trace.wrap([unit.address], run),
+            coalesce=True,
+            on_dropped=trace.on_dropped([unit.address]),
+            priority=priority,
+            deadline=time.time() + COMMAND_DEADLINE,
+            tag=FADE_STEP,
+        )
+
+    current = (unit.state.dimmer if unit.state is not None else None) or 0
+    ctx.fades.start(
+        Fade(
+            ctx.name,
+            unit.address,
+            current if cmd.start is None else cmd.start,
+            cmd.value,
+            cmd.duration,
+            step,
+            None if trace is None else trace.on_dropped([unit.address]),
+            last=current if cmd.start is None else None,
+        )
+    )
+
+
+def publish_entities(cmd: PublishEntities, ctx: Context, received_at: float) -> None:
+    if ctx.ready.is_set():
+        ctx.registry.load(ctx.casa)
+    for group in ctx.registry.groups:
+        ctx.publisher.publish(
+            ctx.topic("groups", str(group.groudId)),
+            encode_group(to_group(group)),
+            METADATA,
+            force=True,
+        )
+    if cmd.snapshot:
+        publish_snapshot(ctx)
+    else:
+        for scene in ctx.entities()[1]:
+            ctx.publisher.publish(
+                ctx.topic("scenes", str(scene.scene_id)),
+                encode_scene(scene),
+                METADATA,
+                force=True,
+            )
+    if cmd.correlation_id is not None:
+        ctx.tracer.reply(
+            CommandAck(cmd.correlation_id, cmd.ACTION, received_at=received_at)
+        )
+
+
+async def wait_until_ready(
+    ctx: Context, command: dict[str, Any], received_at: float
+) -> bool:
+    """Hold a command while the network is not connected, False if it expired."""
+    if command["action"] == PublishEntities.ACTION:
+        return True
+    await ctx.ready.wait()
+    if time.time() > deadline(command.get("ttl"), received_at):
+        expire(ctx, command["action"], command.get("correlation_id"), received_at)
+        return False
+    return True
+
+
 async def process_command(
-    message: aiomqtt.Message, casa: Casambi, client: aiomqtt.Client
+    message: aiomqtt.Message, ctx: Context, received_at: float
 ) -> None:
-    payload = message.payload.decode()
-    command = json.loads(payload)
-    match command["action"]:
-        case SetLevel.ACTION:
-            cmd = SetLevel.from_json(payload)
-            unit = next(u for u in casa.units if u.address == cmd.address)
-            await casa.setLevel(unit, cmd.value)
-        case TurnOn.ACTION:
-            cmd = TurnOn.from_json(payload)
-            unit = next(u for u in casa.units if u.address == cmd.address)
-            await casa.turnOn(unit)
-        case PublishEntities.ACTION:
-            for scene in casa.scenes:
-                scene_entity = to_scene(scene)
-                task = asyncio.create_task(
-                    log_exceptions(
-                        client.publish(
-                            f"{TOPIC_PREFIX}/{NETWORK_NAME}/scenes/{scene_entity.scene_id}",
-                            payload=scene_entity.to_json(),
-                            qos=1,
-                            retain=True,
-                        )
-                    )
+    payload = message.payload
+    action = None
+    correlation_id = None
+    try:
+        command = loads(payload)
+        if "ttl" not in command and (expiry := message_expiry(message)) is not None:
+            command["ttl"] = expiry
+        action = command["action"]
+        correlation_id = command.get("correlation_id")
+        if not await wait_until_ready(ctx, command, received_at):
+            return
+        match action:
+            case SetLevel.ACTION:
+                cmd = SetLevel.from_dict(command)
+                unit = ctx.registry.unit(cmd.address)
+                cancel_fades(ctx, [unit.address])
+                await submit_command(
+                    ctx,
+                    cmd,
+                    received_at,
+                    unit.address,
+                    partial(ctx.metrics.ble, ctx.casa.setLevel, unit, cmd.value),
+                    confirm=[unit.address],
+                    coalesce=True,
                 )
-                background_tasks.add(task)
-                task.add_done_callback(background_tasks.discard)
-        case SetScene.ACTION:
-            cmd = SetScene.from_json(payload)
-            scene = next(s for s in casa.scenes if s.sceneId == cmd.scene_id)
-            await casa.switchToScene(scene)
+            case TurnOn.ACTION:
+                cmd = TurnOn.from_dict(command)
+                unit = ctx.registry.unit(cmd.address)
+                cancel_fades(ctx, [unit.address])
+                await submit_command(
+                    ctx,
+                    cmd,
+                    received_at,
+                    unit.address,
+                    partial(ctx.metrics.ble, ctx.casa.turnOn, unit),
+                    confirm=[unit.address],
+                )
+            case Batch.ACTION:
+                await process_batch(Batch.from_dict(command), ctx, received_at)
+            case SetGroupLevel.ACTION:
+                await set_group_level(
+                    SetGroupLevel.from_dict(command), ctx, received_at
+                )
+            case Transition.ACTION:
+                start_fade(Transition.from_dict(command), ctx, received_at)
+            case PublishEntities.ACTION:
+                publish_entities(PublishEntities.from_dict(command), ctx, received_at)
+            case SetScene.ACTION:
+                cmd = SetScene.from_dict(command)
+                scene = ctx.registry.scene(cmd.scene_id)
+                # A scene may set any unit.
+                cancel_fades(ctx)
+                await submit_command(
+                    ctx,
+                    cmd,
+                    received_at,
+                    f"scene/{scene.sceneId}",
+                    partial(ctx.metrics.ble, ctx.casa.switchToScene, scene),
+                    # Ordered with the writes to any unit, which it may set.
+                    targets=[u.address for u in ctx.registry.units],
+                )
+    except UnknownTargetError as e:
+        LOGGER.warning("Ignoring %s command: %s", action, e)
+        reject(
+            ctx,
+            CommandError(
+                action,
+                CommandError.CODE_UNKNOWN_TARGET,
+                str(e),
+                e.target,
+                correlation_id,
+            ),
+            received_at,
+        )
+    except (ValueError, KeyError, TypeError) as e:
+        LOGGER.warning("Invalid command %s: %s", payload, e)
+        reject(
+            ctx,
+            CommandError(
+                action,
+                CommandError.CODE_INVALID_COMMAND,
+                str(e),
+                correlation_id=correlation_id,
+            ),
+            received_at,
+        )
+    finally:
+        ctx.metrics.inc("commands_total", action if action in ACTIONS else "INVALID")
 
 
-async def main() -> None:
-    devices = await discover()
-    device: BLEDevice | None = None
-    for d in devices:
-        if d.address == NETWORK_ADDRESS:
-            device = d
+def reject(
+    ctx: Context,
+    error: CommandError,
+    received_at: float,
+    status: str = CommandAck.STATUS_REJECTED,
+) -> None:
+    publish_error(ctx, error)
+    if error.correlation_id is not None:
+        ctx.tracer.reply(
+            CommandAck(
+                error.correlation_id, error.action, status, error.message, received_at
+            )
+        )
 
-    if device is None:
-        LOGGER.info(
-            "No casambi network specified, "
-            "store the address of your network in CASAMBI_NETWORK_ADDRESS:"
+
+def expire(
+    ctx: Context, action: str, correlation_id: str | None, received_at: float
+) -> None:
+    LOGGER.warning(
+        "Dropping %s command for %s, received %.1f seconds ago",
+        action,
+        ctx.name,
+        time.time() - received_at,
+    )
+    ctx.metrics.inc("commands_expired_total")
+    reject(
+        ctx,
+        CommandError(
+            action,
+            CommandError.CODE_EXPIRED,
+            "Network not connected before the command's deadline",
+            correlation_id=correlation_id,
+        ),
+        received_at,
+        CommandAck.STATUS_DROPPED,
+    )
+
+
+def create_process_metrics() -> Metrics:
+    """Metrics shared by all networks."""
+    metrics = Metrics()
+    metrics.define(HISTOGRAM, "publish_seconds", "Duration of MQTT publishes.")
+    metrics.define(COUNTER, "mqtt_reconnects_total", "Reconnects to the MQTT broker.")
+    return metrics
+
+
+def create_publisher(client: aiomqtt.Client, metrics: Metrics) -> Publisher:
+    if MQTT5 and MQTT_TOPIC_ALIAS_MAXIMUM and MQTT_STATE_QOS:
+        LOGGER.warning(
+            "Topic aliases are only used for QoS 0, set MQTT_STATE_QOS=0 to use them"
         )
-        for i, d in enumerate(devices):
-            LOGGER.info("[%d]\t%s", i, d.address)
-        sys.exit(0)
+    publisher = Publisher(
+        client,
+        PUBLISH_CONCURRENCY,
+        PUBLISH_QUEUE_SIZE,
+        metrics.histogram("publish_seconds"),
+        mqtt5=MQTT5,
+        topic_alias_maximum=MQTT_TOPIC_ALIAS_MAXIMUM,
+    )
+    publisher.start()
+    for kind, name, description, read in (
+        (
+            GAUGE,
+            "publish_pending",
+            "Messages waiting to be published.",
+            lambda: publisher.pending,
+        ),
+        (
+            GAUGE,
+            "publish_in_flight",
+            "Retained messages being published.",
+            lambda: publisher.in_flight,
+        ),
+        (COUNTER, "publish_total", "Messages published.", lambda: publisher.published),
+        (
+            COUNTER,
+            "publish_suppressed_total",
+            "Unchanged messages not published.",
+            lambda: publisher.suppressed,
+        ),
+        (
+            COUNTER,
+            "publish_replaced_total",
+            "Messages replaced by a newer one.",
+            lambda: publisher.replaced,
+        ),
+        (
+            COUNTER,
+            "publish_dropped_total",
+            "Messages dropped from a full queue.",
+            lambda: publisher.dropped,
+        ),
+        (
+            COUNTER,
+            "publish_failures_total",
+            "Failed publishes.",
+            lambda: publisher.failed,
+        ),
+        (
+            COUNTER,
+            "publish_requeued_total",
+            "Publishes retried after reconnecting.",
+            lambda: publisher.requeued,
+        ),
+        (
+            COUNTER,
+            "publish_aliased_total",
+            "Messages published with a topic alias instead of the topic.",
+            lambda: publisher.aliased,
+        ),
+        (
+            GAUGE,
+            "mqtt_connected",
+            "Whether connected to the MQTT broker.",
+            lambda: int(publisher.online),
+        ),
+    ):
+        metrics.collect(kind, name, description, read)
+    return publisher
+
 
-    casa = Casambi()
+def create_fades(metrics: Metrics) -> FadeEngine:
+    fades = FadeEngine(FADE_RATE)
+    for kind, name, description, read in (
+        (GAUGE, "fades_active", "Units fading.", lambda: fades.active),
+        (COUNTER, "fades_total", "Fades started.", lambda: fades.started),
+        (
+            COUNTER,
+            "fades_cancelled_total",
+            "Fades cancelled by a newer command.",
+            lambda: fades.cancelled,
+        ),
+        (
+            COUNTER,
+            "fade_steps_total",
+            "Levels written by fades.",
+            lambda: fades.steps,
+        ),
+    ):
+        metrics.collect(kind, name, description, read)
+    return fades
+
+
+def create_context(
+    config: NetworkConfig,
+    casa: Casambi,
+    publisher: Publisher,
+    cache: NetworkCache | None = None,
+    fades: FadeEngine | None = None,
+) -> Context:
+    metrics = Metrics(labels={"network": config.name})
+    metrics.define(
+        COUNTER, "commands_total", "Commands received, by action.", label="action"
+    )
+    metrics.define(
+        COUNTER, "commands_rejected_total", "Commands dropped from a full inbox."
+    )
+    metrics.define(
+        HISTOGRAM, "process_command_seconds", "Time to handle a received command."
+    )
+    metrics.define(HISTOGRAM, "connect_seconds", "Time to connect to the network.")
+    metrics.define(COUNTER, "link_lost_total", "Connections to the network lost.")
+    metrics.define(
+        COUNTER,
+        "commands_expired_total",
+        "Commands dropped after their deadline while waiting for the network.",
+    )
+    dispatcher = CommandDispatcher(
+        COMMAND_CONCURRENCY, COMMAND_QUEUE_SIZE, COMMAND_OVERFLOW_POLICY
+    )
+    ctx = Context(
+        config.name,
+        casa,
+        publisher,
+        EntityRegistry(),
+        dispatcher,
+        metrics,
+        config.address,
+        config.password,
+        cache,
+        fades or FadeEngine(FADE_RATE),
+    )
+    tracer = ctx.tracer
+    for kind, metric, description, read in (
+        (
+            GAUGE,
+            "commands_pending",
+            "Commands waiting to run.",
+            lambda: dispatcher.pending,
+        ),
+        (
+            GAUGE,
+            "commands_running",
+            "Targets with a running command.",
+            lambda: dispatcher.running,
+        ),
+        (
+            COUNTER,
+            "commands_coalesced_total",
+            "Commands replaced by a newer one.",
+            lambda: dispatcher.coalesced,
+        ),
+        (
+            COUNTER,
+            "commands_dropped_total",
+            "Commands dropped from a full queue.",
+            lambda: dispatcher.dropped,
+        ),
+        (
+            COUNTER,
+            "commands_completed_total",
+            "Commands that ran.",
+            lambda: dispatcher.completed,
+        ),
+        (
+            COUNTER,
+            "commands_failed_total",
+            "Commands that failed.",
+            lambda: dispatcher.failed,
+        ),
+        (
+            COUNTER,
+            "commands_expired_in_queue_total",
+            "Queued commands dropped after their deadline.",
+            lambda: dispatcher.expired,
+        ),
+        (
+            GAUGE,
+            "acks_in_flight",
+            "Traced commands not acked yet.",
+            lambda: tracer.in_flight,
+        ),
+        (COUNTER, "acks_total", "Acks sent.", lambda: tracer.acked),
+        (
+            COUNTER,
+            "acks_unconfirmed_total",
+            "Acks without a unit change.",
+            lambda: tracer.unconfirmed,
+        ),
+        (
+            GAUGE,
+            "link_up",
+            "Whether connected to the network.",
+            lambda: int(ctx.ready.is_set()),
+        ),
+    ):
+        metrics.collect(kind, metric, description, read)
+    return ctx
+
+
+def network_configs() -> list[NetworkConfig]:
+    if not NETWORKS:
+        return [NetworkConfig(NETWORK_NAME, NETWORK_ADDRESS, NETWORK_PASSWORD)]
+    configs = []
+    for network in NETWORKS.split(","):
+        name, _, address = network.strip().partition("=")
+        # E.g. the password of `first-floor` is in CASAMBI_NETWORK_PASSWORD_FIRST_FLOOR.
+        env_name = "".join(c if c.isalnum() else "_" for c in name.upper())
+        password = os.getenv(f"CASAMBI_NETWORK_PASSWORD_{env_name}", NETWORK_PASSWORD)
+        configs.append(NetworkConfig(name, address, password))
+    return configs
+
+
+def route_command(networks: dict[str, Context], message: aiomqtt.Message) -> None:
+    """Queue a command for the network named in its topic."""
+    _, name, kind = message.topic.value.split("/", 2)
+    ctx = networks.get(name)
+    if ctx is None:
+        return
+    if kind == "encoding":
+        set_encoding(ctx, message.payload)
+        return
+    LOGGER.debug("Received command: %r on topic: '%s'", message.payload, message.topic)
     try:
-        await casa.connect(device, NETWORK_PASSWORD)
-        LOGGER.info("Connected to Casambi network")
-        client = aiomqtt.Client(
-            MQTT_BROKER, port=MQTT_PORT, username=MQTT_USERNAME, password=MQTT_PASSWORD
-        )
-        interval = 5
-
-        def callback(unit: CasambiBt.Unit) -> None:
-            entity = to_entity(unit)
-            task = asyncio.create_task(
-                log_exceptions(
-                    client.publish(
-                        f"{TOPIC_PREFIX}/{NETWORK_NAME}/events/{unit.address}",
-                        payload=entity.to_json(),
-                        qos=1,
-                        retain=True,
-                    )
-                )
+        ctx.inbox.put_nowait((time.time(), message))
+    except asyncio.QueueFull:
+        LOGGER.warning("Inbox of %s is full, dropping command", ctx.name)
+        ctx.metrics.inc("commands_rejected_total")
+
+
+async def serve_commands(ctx: Context) -> None:
+    while True:
+        received_at, message = await ctx.inbox.get()
+        with ctx.metrics.histogram("process_command_seconds").time():
+            await process_command(message, ctx, received_at)
+
+
+async def connect(casa: Casambi, address: str, password: str | None) -> None:
+    """Connect by address if the Bluetooth adapter knows it, else after a scan."""
+    try:
+        await casa.connect(address, password)
+    except NetworkNotFoundError:
+        LOGGER.info("Scanning %d seconds for Casambi network %s", SCAN_TIMEOUT, address)
+        try:
+            device = await BleakScanner.find_device_by_address(address, SCAN_TIMEOUT)
+        except (BleakError, OSError) as e:
+            raise BluetoothError(str(e)) from e
+        if device is None:
+            raise
+        await casa.connect(device, password)
+
+
+async def reconnect(ctx: Context, address: str, backoff: Backoff) -> bool:
+    """Connect to the network, retrying until it succeeds; False if it never will."""
+    while True:
+        try:
+            await connect(ctx.casa, address, ctx.password)
+        except AuthenticationError:
+            LOGGER.exception("Wrong password for Casambi network %s", ctx.name)
+            return False
+        except CasambiBtError as e:
+            delay = backoff.next()
+            LOGGER.warning(
+                "Connecting to Casambi network %s failed (%s); retrying in %.1f s",
+                ctx.name,
+                e,
+                delay,
+            )
+            await asyncio.sleep(delay)
+        else:
+            backoff.reset()
+            return True
+
+
+async def supervise_link(ctx: Context, address: str, started: float) -> None:
+    """
+    Keep the network connected.
+
+    When the connection is lost the network is marked offline on its
+    availability topic, and commands wait in its inbox until it is reconnected.
+    """
+    backoff = Backoff(BLE_RECONNECT_DELAY, BLE_RECONNECT_MAX_DELAY)
+    ctx.casa.registerDisconnectCallback(ctx.link_lost.set)
+    warm = ctx.cached is not None
+    first = True
+    while True:
+        connect_started = time.monotonic()
+        if not await reconnect(ctx, address, backoff):
+            return
+        now = time.monotonic()
+        ctx.metrics.histogram("connect_seconds").observe(now - connect_started)
+        ctx.link_lost.clear()
+        ctx.load()
+        publish_availability(ctx)
+        LOGGER.info(
+            "%s to Casambi network %s in %.1f seconds (%d units, %d scenes)",
+            "Connected" if first else "Reconnected",
+            ctx.name,
+            now - connect_started,
+            len(ctx.registry.units),
+            len(ctx.registry.scenes),
+        )
+        if first:
+            LOGGER.info(
+                "Casambi network %s ready %.1f seconds after a %s start",
+                ctx.name,
+                now - started,
+                "warm" if warm else "cold",
             )
-            background_tasks.add(task)
-            task.add_done_callback(background_tasks.discard)
+            first = False
+
+        await ctx.link_lost.wait()
+        ctx.ready.clear()
+        publish_availability(ctx)
+        ctx.metrics.inc("link_lost_total")
+        LOGGER.warning("Lost the connection to Casambi network %s", ctx.name)
+        # Clean up what is left of the old connection before connecting again.
+        await ctx.casa.disconnect()
+
+
+def restore_cached(ctx: Context, started: float) -> None:
+    """Publish the cached unit states of a network that is not connected yet."""
+    if ctx.cached is None:
+        return
+    for unit in ctx.cached.units:
+        ctx.unit_events.publish(unit)
+    LOGGER.info(
+        "Restored %d units and %d scenes of %s from the cache of %s, "
+        "%.2f seconds after a warm start",
+        len(ctx.cached.units),
+        len(ctx.cached.scenes),
+        ctx.name,
+        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ctx.cached.saved_at)),
+        time.monotonic() - started,
+    )
+
 
+async def report_metrics(networks: dict[str, Context], shared: Metrics) -> None:
+    """Publish the metrics on the stats topics, and serve them over HTTP."""
+    all_metrics = [shared, *(ctx.metrics for ctx in networks.values())]
+    server = (
+        await serve_metrics(all_metrics, METRICS_PORT, METRICS_HOST)
+        if METRICS_PORT
+        else None
+    )
+    try:
+        if STATS_INTERVAL <= 0:
+            await asyncio.get_running_loop().create_future()
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            process = shared.to_dict()
+            for ctx in networks.values():
+                stats = {"timestamp": time.time(), **ctx.metrics.to_dict(), **process}
+                ctx.publisher.publish(ctx.topic("stats"), json.dumps(stats))
+    finally:
+        if server is not None:
+            server.close()
+
+
+async def shutdown(
+    networks: dict[str, Context],
+    publisher: Publisher,
+    fades: FadeEngine,
+    tasks: list[asyncio.Task],
+) -> None:
+    for ctx in networks.values():
+        LOGGER.info(
+            "Shutting down %s.. (%d commands completed, %d coalesced, %d dropped; "
+            "%d commands acked, %d without confirmation)",
+            ctx.name,
+            ctx.dispatcher.completed,
+            ctx.dispatcher.coalesced,
+            ctx.dispatcher.dropped,
+            ctx.tracer.acked,
+            ctx.tracer.unconfirmed,
+        )
+    LOGGER.info(
+        "%d messages published, %d suppressed as unchanged",
+        publisher.published,
+        publisher.suppressed,
+    )
+    await fades.close()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for ctx in networks.values():
+        ctx.tracer.close()
+        await ctx.dispatcher.close()
+        await ctx.casa.disconnect()
+        ctx.save()
+    await publisher.close()
+
+
+async def list_networks() -> None:
+    """Log the addresses of the Casambi networks nearby, and exit."""
+    devices = await discover()
+    LOGGER.info(
+        "No casambi network specified, store the address of your network "
+        "in CASAMBI_NETWORK_ADDRESS, or of several in CASAMBI_NETWORKS:"
+    )
+    for i, d in enumerate(devices):
+        LOGGER.info("[%d]\t%s", i, d.address)
+    sys.exit(0)
+
+
+async def main() -> None:
+    started = time.monotonic()
+    client = BrokerClient(
+        MQTT_BROKER,
+        port=MQTT_PORT,
+        username=MQTT_USERNAME,
+        password=MQTT_PASSWORD,
+        protocol=aiomqtt.ProtocolVersion.V5 if MQTT5 else aiomqtt.ProtocolVersion.V311,
+    )
+    shared = create_process_metrics()
+    publisher = create_publisher(client, shared)
+    fades = create_fades(shared)
+    networks: dict[str, Context] = {}
+    for config in network_configs():
+        cache = (
+            NetworkCache(Path(CACHE_DIR, f"{config.name}.json")) if CACHE_DIR else None
+        )
+        ctx = create_context(config, Casambi(), publisher, cache, fades)
+        if ctx.address is None:
+            LOGGER.warning("No address for Casambi network %s", config.name)
+        else:
+            networks[config.name] = ctx
+    if not networks:
+        await publisher.close()
+        await list_networks()
+
+    tasks = [asyncio.create_task(report_metrics(networks, shared))]
+    for ctx in networks.values():
+        tasks.append(asyncio.create_task(serve_commands(ctx)))
+        tasks.append(asyncio.create_task(supervise_link(ctx, ctx.address, started)))
+
+    # Unit changes keep being handled while the broker is unreachable, and are
+    # buffered by the paused publisher until it is reachable again.
+    for ctx in networks.values():
+        ctx.casa.registerUnitChangedHandler(ctx.on_unit_changed)
+    backoff = Backoff(MQTT_RECONNECT_DELAY, MQTT_RECONNECT_MAX_DELAY)
+    try:
         while True:
             try:
                 async with client:
-                    await client.subscribe(f"{TOPIC_PREFIX}/{NETWORK_NAME}/commands")
-
-                    casa.registerUnitChangedHandler(callback)
+                    # The broker may have lost its retained messages.
+                    publisher.reset(client.topic_alias_maximum)
+                    publisher.resume()
+                    backoff.reset()
+                    for ctx in networks.values():
+                        ctx.unit_events.reset()
+                        publish_availability(ctx)
+                        publish_capabilities(ctx)
+                        restore_cached(ctx, started)
+                        await client.subscribe(
+                            ctx.topic("commands"), qos=MQTT_COMMAND_QOS
+                        )
+                        await client.subscribe(
+                            ctx.topic("encoding"), qos=MQTT_COMMAND_QOS
+                        )
 
                     LOGGER.info(
-                        "Subscribed to commands topic and UnitChangedHandler registered"
+                        "Subscribed to commands topics of %s", ", ".join(networks)
                     )
                     async for message in client.messages:
-                        LOGGER.debug(
-                            "Received command: %s on topic: '%s'",
-                            message.payload.decode(),
-                            message.topic,
-                        )
-                        await process_command(message, casa, client)
+                        route_command(networks, message)
             except aiomqtt.MqttError as e:
+                publisher.pause()
+                delay = backoff.next()
                 LOGGER.warning(
-                    "Connection lost (%s); Reconnecting in %d seconds ...", e, interval
+                    "Connection lost (%s); Reconnecting in %.1f seconds ...", e, delay
                 )
-                casa.unregisterUnitChangedHandler(callback)
-                await asyncio.sleep(interval)
+                shared.inc("mqtt_reconnects_total")
+                await asyncio.sleep(delay)
             except asyncio.CancelledError:
                 LOGGER.info("Main task cancelled, waiting for cleanup")
                 break
 
     finally:
-        LOGGER.info("Shutting down..")
-        await casa.disconnect()
+        await shutdown(networks, publisher, fades, tasks)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,9 @@
+import pytest
+
+from benchmarks.bench_codec import sample_unit
+from custom_components.casambi_mqtt.entities.entities import Unit
+
+
+@pytest.fixture
+def unit() -> Unit:
+    return sample_unit()
@@ -0,0 +1,140 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.casambi_mqtt import batcher
+from custom_components.casambi_mqtt.batcher import CommandBatcher
+from custom_components.casambi_mqtt.entities.commands import (
+    BaseCommand,
+    Batch,
+    SetLevel,
+    TurnOn,
+)
+from custom_components.casambi_mqtt.latency import LatencyTracker
+
+
+@pytest.fixture
+def sent(monkeypatch: pytest.MonkeyPatch) -> list[BaseCommand]:
+    """Record the commands the batcher sends instead of publishing them."""
+    commands: list[BaseCommand] = []
+
+    async def send(hass: object, data: object, command: BaseCommand) -> None:
+        commands.append(command)
+
+    monkeypatch.setattr(batcher, "async_send_command", send)
+    return commands
+
+
+@pytest.fixture
+def tasks() -> list[asyncio.Task[None]]:
+    return []
+
+
+@pytest.fixture
+async def command_batcher(tasks: list[asyncio.Task[None]]) -> CommandBatcher:
+    def create_task(coro: object) -> asyncio.Task[None]:
+        tasks.append(asyncio.create_task(coro))
+        return tasks[-1]
+
+    hass = SimpleNamespace(
+        loop=asyncio.get_running_loop(), async_create_task=create_task
+    )
+    data = SimpleNamespace(latency=LatencyTracker())
+    return CommandBatcher(hass, data, window=0.01)
+
+
+async def test_a_single_level_is_sent_as_set_level(
+    command_batcher: CommandBatcher, sent: list[BaseCommand]
+) -> None:
+    await command_batcher.set_level("a", 10)
+
+    (command,) = sent
+    assert isinstance(command, SetLevel)
+    assert (command.address, command.value) == ("a", 10)
+    assert command.correlation_id is not None
+
+
+async def test_turning_on_is_sent_as_turn_on(
+    command_batcher: CommandBatcher, sent: list[BaseCommand]
+) -> None:
+    await command_batcher.set_level("a", None)
+
+    (command,) = sent
+    assert isinstance(command, TurnOn)
+    assert command.address == "a"
+
+
+async def test_levels_within_the_window_are_sent_as_one_batch(
+    command_batcher: CommandBatcher, sent: list[BaseCommand]
+) -> None:
+    await asyncio.gather(
+        command_batcher.set_level("a", 10),
+        command_batcher.set_level("b", None),
+        command_batcher.set_level("c", 30),
+    )
+
+    (command,) = sent
+    assert isinstance(command, Batch)
+    assert command.levels() == {"a": 10, "b": None, "c": 30}
+
+
+async def test_a_shared_level_is_sent_once(
+    command_batcher: CommandBatcher, sent: list[BaseCommand]
+) -> None:
+    await asyncio.gather(
+        command_batcher.set_level("a", 0), command_batcher.set_level("b", 0)
+    )
+
+    (command,) = sent
+    assert isinstance(command, Batch)
+    assert (command.addresses, command.value, command.values) == (["a", "b"], 0, {})
+
+
+async def test_the_latest_level_of_a_unit_wins(
+    command_batcher: CommandBatcher, sent: list[BaseCommand]
+) -> None:
+    await asyncio.gather(
+        command_batcher.set_level("a", 10), command_batcher.set_level("a", 20)
+    )
+
+    (command,) = sent
+    assert isinstance(command, SetLevel)
+    assert command.value == 20
+
+
+async def test_every_caller_gets_the_send_error(
+    command_batcher: CommandBatcher, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def send(hass: object, data: object, command: BaseCommand) -> None:
+        raise ConnectionError
+
+    monkeypatch.setattr(batcher, "async_send_command", send)
+    results = await asyncio.gather(
+        command_batcher.set_level("a", 10),
+        command_batcher.set_level("b", 20),
+        return_exceptions=True,
+    )
+
+    assert [type(result) for result in results] == [ConnectionError] * 2
+
+
+async def test_callers_are_released_when_the_flush_is_cancelled(
+    command_batcher: CommandBatcher,
+    sent: list[BaseCommand],
+    tasks: list[asyncio.Task[None]],
+) -> None:
+    waiting = asyncio.create_task(command_batcher.set_level("a", 10))
+    await asyncio.sleep(0)
+    (flush,) = tasks
+    flush.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    assert sent == []
+
+    # The next level starts a new batch.
+    await command_batcher.set_level("b", 20)
+    (command,) = sent
+    assert isinstance(command, SetLevel)
+    assert command.address == "b"
@@ -0,0 +1,107 @@
+from collections.abc import Callable
+from dataclasses import replace
+from typing import Any
+
+import pytest
+
+from custom_components.casambi_mqtt.entities.codec import (
+    decode_group,
+    decode_scene,
+    decode_snapshot,
+    decode_unit,
+    decode_unit_metadata,
+    decode_unit_status,
+    decode_unit_type,
+    encode_group,
+    encode_scene,
+    encode_snapshot,
+    encode_unit,
+    encode_unit_metadata,
+    encode_unit_status,
+    encode_unit_type,
+)
+from custom_components.casambi_mqtt.entities.entities import Group, Scene, Unit
+
+
+def test_unit_keeps_the_wire_format(unit: Unit) -> None:
+    assert encode_unit(unit) == unit.to_json()
+    assert decode_unit(unit.to_json()) == unit
+
+
+def test_unit_parts_round_trip(unit: Unit) -> None:
+    assert decode_unit_status(encode_unit_status(unit.status())) == unit.status()
+    assert decode_unit_metadata(encode_unit_metadata(unit.metadata())) == (
+        unit.metadata()
+    )
+    assert decode_unit_type(encode_unit_type(unit.unit_type)) == unit.unit_type
+
+
+def test_scene_and_group_round_trip() -> None:
+    scene = Scene(3, "Evening")
+    group = Group(1, "Kitchen", ["aa:bb:cc:dd:ee:01", "aa:bb:cc:dd:ee:02"])
+
+    assert encode_scene(scene) == scene.to_json()
+    assert decode_scene(encode_scene(scene)) == scene
+    assert decode_group(encode_group(group)) == group
+
+
+def test_snapshot_round_trip(unit: Unit) -> None:
+    (payload,) = encode_snapshot([unit], [Scene(3, "Evening")])
+    snapshot = decode_snapshot(payload)
+
+    assert (snapshot.chunk, snapshot.chunks) == (0, 1)
+    assert snapshot.types == [unit.unit_type]
+    assert snapshot.units == [(unit.metadata(), unit.status())]
+    assert snapshot.scenes == [Scene(3, "Evening")]
+
+
+def test_snapshot_is_split_in_chunks(unit: Unit) -> None:
+    units = [Unit.from_parts(unit.metadata(), unit.status(), unit.unit_type)] * 20
+    scenes = [Scene(i, f"Scene {i}") for i in range(20)]
+
+    payloads = encode_snapshot(units, scenes, max_bytes=1024)
+    chunks = [decode_snapshot(payload) for payload in payloads]
+
+    assert len(chunks) > 1
+    assert all(len(payload) <= 1024 for payload in payloads)
+    assert {chunk.snapshot_id for chunk in chunks} == {chunks[0].snapshot_id}
+    assert [chunk.chunk for chunk in chunks] == list(range(len(chunks)))
+    assert sum(len(chunk.units) for chunk in chunks) == 20
+    assert sum(len(chunk.scenes) for chunk in chunks) == 20
+
+
+def test_every_chunk_has_the_types_of_its_units(unit: Unit) -> None:
+    other_type = replace(unit.unit_type, id=unit.unit_type.id + 1)
+    units = [
+        Unit.from_parts(unit.metadata(), unit.status(), unit_type)
+        for unit_type in (unit.unit_type, other_type) * 10
+    ]
+
+    payloads = encode_snapshot(units, [], max_bytes=1024)
+    chunks = [decode_snapshot(payload) for payload in payloads]
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        type_ids = {unit_type.id for unit_type in chunk.types}
+        assert {metadata.unit_type_id for metadata, _ in chunk.units} == type_ids
+
+
+@pytest.mark.parametrize(
+    "decode",
+    [
+        decode_unit,
+        decode_unit_status,
+        decode_unit_metadata,
+        decode_unit_type,
+        decode_scene,
+        decode_group,
+        decode_snapshot,
+    ],
+)
+@pytest.mark.parametrize("payload", ["not json", "{}", "[]", "null"])
+def test_invalid_payloads_raise_value_error(
+    decode: Callable[[str], Any], payload: str
+) -> None:
+    # The subscribers only rely on the type, to log and skip the payload.
+    with pytest.raises(ValueError):  # noqa: PT011
+        decode(payload)
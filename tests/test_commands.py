@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from custom_components.casambi_mqtt.entities.commands import (
+    BaseCommand,
+    Batch,
+    PublishEntities,
+    SetGroupLevel,
+    SetLevel,
+    SetScene,
+    Transition,
+    TurnOn,
+)
+
+COMMANDS = [
+    SetLevel("aa:bb:cc:dd:ee:01", 128, correlation_id="c0ffee01"),
+    TurnOn("aa:bb:cc:dd:ee:01"),
+    SetScene(3),
+    SetGroupLevel(1, 0),
+    SetGroupLevel(None, 255),
+    PublishEntities(snapshot=True),
+    Batch(addresses=["aa:bb:cc:dd:ee:01"], values={"aa:bb:cc:dd:ee:02": 10}),
+]
+
+
+@pytest.mark.parametrize("command", COMMANDS, ids=lambda c: type(c).__name__)
+def test_json_round_trip(command: BaseCommand) -> None:
+    assert type(command).from_json(command.to_json()) == command
+
+
+def test_json_names_the_action() -> None:
+    data = json.loads(SetLevel("aa:bb:cc:dd:ee:01", 128).to_json())
+
+    assert data == {"address": "aa:bb:cc:dd:ee:01", "value": 128, "action": "SET_LEVEL"}
+
+
+def test_unknown_fields_are_ignored() -> None:
+    payload = json.dumps({"address": "a", "value": 1, "action": "SET_LEVEL", "x": 1})
+
+    assert SetLevel.from_json(payload) == SetLevel("a", 1)
+
+
+def test_batch_levels() -> None:
+    batch = Batch(addresses=["a", "b"], value=0, values={"b": 10, "c": 20})
+
+    assert batch.levels() == {"a": 0, "b": 10, "c": 20}
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [{"priority": "high"}, {"priority": 1.5}, {"priority": True}, {"ttl": "5"}],
+)
+def test_invalid_scheduling_fields_raise_type_error(fields: dict) -> None:
+    with pytest.raises(TypeError, match="Invalid"):
+        SetLevel("a", 1, **fields)
+
+
+def test_default_priorities() -> None:
+    assert SetScene(1).effective_priority() == BaseCommand.PRIORITY_HIGH
+    assert SetLevel("a", 0).effective_priority() == BaseCommand.PRIORITY_HIGH
+    assert SetLevel("a", 128).effective_priority() == BaseCommand.PRIORITY_LOW
+    assert SetLevel("a", 128, priority=0).effective_priority() == 0
+
+
+def test_transition_round_trip() -> None:
+    transition = Transition("a", 0, 1.5, start=200)
+
+    assert Transition.from_json(transition.to_json()) == transition
+
+
+@pytest.mark.parametrize(
+    ("fields", "error"),
+    [
+        ({"value": "100"}, TypeError),
+        ({"value": 1.5}, TypeError),
+        ({"duration": "1"}, TypeError),
+        ({"duration": None}, TypeError),
+        ({"duration": -1}, ValueError),
+        ({"start": 1.5}, TypeError),
+    ],
+)
+def test_invalid_transition_raises(fields: dict, error: type[Exception]) -> None:
+    with pytest.raises(error, match="Invalid"):
+        Transition(**{"address": "a", "value": 100, "duration": 1, **fields})
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+from homeassistant.const import Platform
+
+from custom_components.casambi_mqtt import discovery
+from custom_components.casambi_mqtt.discovery import DiscoveryBuffer
+
+
+class FakeTimer:
+    """Stands in for `async_call_later`, fired by hand."""
+
+    def __init__(self) -> None:
+        self.action = None
+        self.cancelled = False
+
+    def call_later(self, hass: object, delay: float, action: object) -> object:
+        self.action = action
+        return self.cancel
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+@pytest.fixture
+def timer(monkeypatch: pytest.MonkeyPatch) -> FakeTimer:
+    timer = FakeTimer()
+    monkeypatch.setattr(discovery, "async_call_later", timer.call_later)
+    return timer
+
+
+def test_entities_are_added_in_one_call(timer: FakeTimer) -> None:
+    added: list[list[str]] = []
+    buffer = DiscoveryBuffer(SimpleNamespace())
+    buffer.platform_ready(Platform.LIGHT, added.append)
+    buffer.add(Platform.LIGHT, "a")
+    buffer.add(Platform.LIGHT, "b")
+    assert added == []
+
+    timer.action(None)
+    assert added == [["a", "b"]]
+
+
+def test_entities_wait_for_their_platform(timer: FakeTimer) -> None:
+    added: list[list[str]] = []
+    buffer = DiscoveryBuffer(SimpleNamespace())
+    buffer.add(Platform.SCENE, "a")
+    timer.action(None)
+
+    buffer.platform_ready(Platform.SCENE, added.append)
+    assert added == [["a"]]
+
+
+def test_cancel_stops_the_pending_flush(timer: FakeTimer) -> None:
+    added: list[list[str]] = []
+    buffer = DiscoveryBuffer(SimpleNamespace())
+    buffer.platform_ready(Platform.LIGHT, added.append)
+    buffer.add(Platform.LIGHT, "a")
+
+    buffer.cancel()
+    assert timer.cancelled
+    buffer.platform_ready(Platform.LIGHT, added.append)
+    assert added == []
@@ -0,0 +1,310 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+
+from casambi_server.dispatcher import CommandDispatcher, OverflowPolicy
+
+
+def record(log: list[str], name: str) -> Callable[[], Awaitable[None]]:
+    async def run() -> None:
+        log.append(name)
+
+    return run
+
+
+async def block(dispatcher: CommandDispatcher, key: str = "blocker") -> asyncio.Event:
+    """Occupy a slot until the returned event is set."""
+    release = asyncio.Event()
+    await dispatcher.submit(key, release.wait)
+    await asyncio.sleep(0)
+    return release
+
+
+async def drain(dispatcher: CommandDispatcher) -> None:
+    """Wait until every lane ran out of commands."""
+    await asyncio.gather(*dispatcher._runners.values())
+
+
+async def test_commands_for_a_unit_run_in_order() -> None:
+    dispatcher = CommandDispatcher(concurrency=4, max_pending=16)
+    log: list[str] = []
+
+    async def slow() -> None:
+        await asyncio.sleep(0.01)
+        log.append("first")
+
+    await dispatcher.submit("a", slow)
+    await dispatcher.submit("a", record(log, "second"))
+    await dispatcher.submit("a", record(log, "third"))
+    await drain(dispatcher)
+
+    assert log == ["first", "second", "third"]
+    assert dispatcher.completed == 3
+
+
+async def test_concurrency_is_bounded() -> None:
+    dispatcher = CommandDispatcher(concurrency=2, max_pending=16)
+    running = peak = 0
+
+    async def run() -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    for key in "abcde":
+        await dispatcher.submit(key, run)
+    await drain(dispatcher)
+
+    assert peak == 2
+    assert dispatcher.completed == 5
+
+
+async def test_coalesce_keeps_the_latest_waiting_command() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=16)
+    release = await block(dispatcher)
+    log: list[str] = []
+    dropped: list[str] = []
+
+    for level in ("10", "20", "30"):
+        await dispatcher.submit(
+            "a",
+            record(log, level),
+            coalesce=True,
+            on_dropped=lambda level=level: dropped.append(level),
+        )
+    release.set()
+    await drain(dispatcher)
+
+    assert log == ["30"]
+    assert dropped == ["10", "20"]
+    assert dispatcher.coalesced == 2
+
+
+async def test_coalesce_does_not_replace_other_commands() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=16)
+    release = await block(dispatcher)
+    log: list[str] = []
+
+    await dispatcher.submit("a", record(log, "level"), coalesce=True)
+    await dispatcher.submit("a", record(log, "scene"))
+    await dispatcher.submit("a", record(log, "level again"), coalesce=True)
+    release.set()
+    await drain(dispatcher)
+
+    assert log == ["level", "scene", "level again"]
+    assert dispatcher.coalesced == 0
+
+
+async def test_drop_oldest_when_full() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=2)
+    release = await block(dispatcher)
+    log: list[str] = []
+
+    for key in "abc":
+        assert await dispatcher.submit(key, record(log, key))
+    release.set()
+    await drain(dispatcher)
+
+    assert log == ["b", "c"]
+    assert dispatcher.dropped == 1
+
+
+async def test_drop_newest_when_full() -> None:
+    dispatcher = CommandDispatcher(
+        concurrency=1, max_pending=2, policy=OverflowPolicy.DROP_NEWEST
+    )
+    release = await block(dispatcher)
+    log: list[str] = []
+    dropped: list[str] = []
+
+    submitted = [
+        await dispatcher.submit(
+            key, record(log, key), on_dropped=lambda key=key: dropped.append(key)
+        )
+        for key in "abc"
+    ]
+    release.set()
+    await drain(dispatcher)
+
+    assert submitted == [True, True, False]
+    assert log == ["a", "b"]
+    assert dropped == ["c"]
+
+
+async def test_block_waits_for_room() -> None:
+    dispatcher = CommandDispatcher(
+        concurrency=1, max_pending=1, policy=OverflowPolicy.BLOCK
+    )
+    release = await block(dispatcher)
+    log: list[str] = []
+    await dispatcher.submit("a", record(log, "a"))
+
+    second = asyncio.create_task(dispatcher.submit("b", record(log, "b")))
+    await asyncio.sleep(0.01)
+    assert not second.done()
+
+    release.set()
+    assert await second
+    await drain(dispatcher)
+    assert log == ["a", "b"]
+
+
+async def test_a_failing_command_does_not_stop_its_lane() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=16)
+    log: list[str] = []
+
+    async def fail() -> None:
+        raise RuntimeError
+
+    await dispatcher.submit("a", fail)
+    await dispatcher.submit("a", record(log, "next"))
+    await drain(dispatcher)
+
+    assert log == ["next"]
+    assert dispatcher.failed == 1
+    assert dispatcher.completed == 1
+
+
+async def test_the_lowest_priority_number_runs_first() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=16)
+    release = await block(dispatcher)
+    log: list[str] = []
+
+    await dispatcher.submit("a", record(log, "dim"), priority=2)
+    await dispatcher.submit("b", record(log, "scene"), priority=0)
+    await dispatcher.submit("c", record(log, "dim later"), priority=2)
+    await dispatcher.submit("d", record(log, "off"), priority=0)
+    release.set()
+    await drain(dispatcher)
+
+    assert log == ["scene", "off", "dim", "dim later"]
+
+
+async def test_drop_oldest_evicts_the_lowest_priority() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=2)
+    release = await block(dispatcher)
+    log: list[str] = []
+
+    await dispatcher.submit("a", record(log, "off"), priority=0)
+    await dispatcher.submit("b", record(log, "dim"), priority=2)
+    await dispatcher.submit("c", record(log, "scene"), priority=0)
+    release.set()
+    await drain(dispatcher)
+
+    assert log == ["off", "scene"]
+
+
+async def test_a_command_past_its_deadline_is_dropped() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=16)
+    release = await block(dispatcher)
+    log: list[str] = []
+    dropped: list[str] = []
+
+    await dispatcher.submit(
+        "a",
+        record(log, "expired"),
+        deadline=time.time() + 0.01,
+        on_dropped=lambda: dropped.append("expired"),
+    )
+    await dispatcher.submit("b", record(log, "in time"), deadline=time.time() + 60)
+    await asyncio.sleep(0.02)
+    release.set()
+    await drain(dispatcher)
+
+    assert log == ["in time"]
+    assert dropped == ["expired"]
+    assert dispatcher.expired == 1
+
+
+async def test_priority_does_not_reorder_writes_to_a_unit() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=16)
+    release = await block(dispatcher)
+    log: list[str] = []
+
+    await dispatcher.submit(
+        "group/1", record(log, "group dim"), priority=2, targets=["a", "b"]
+    )
+    await dispatcher.submit("a", record(log, "unit off"), priority=0)
+    await dispatcher.submit("c", record(log, "other unit off"), priority=0)
+    release.set()
+    await drain(dispatcher)
+
+    assert log == ["other unit off", "group dim", "unit off"]
+
+
+async def test_supersede_drops_waiting_writes_to_the_same_units() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=16)
+    release = await block(dispatcher)
+    log: list[str] = []
+    dropped: list[str] = []
+
+    await dispatcher.submit(
+        "a", record(log, "unit"), on_dropped=lambda: dropped.append("unit")
+    )
+    await dispatcher.submit("c", record(log, "other unit"))
+    await dispatcher.submit(
+        "network", record(log, "network"), targets=["a", "b"], supersede=True
+    )
+    release.set()
+    await drain(dispatcher)
+
+    assert log == ["other unit", "network"]
+    assert dropped == ["unit"]
+    assert dispatcher.superseded == 1
+
+
+async def test_drop_waiting_only_drops_tagged_commands() -> None:
+    dispatcher = CommandDispatcher(concurrency=1, max_pending=16)
+    release = await block(dispatcher)
+    log: list[str] = []
+
+    await dispatcher.submit("a", record(log, "step a"), tag="step")
+    await dispatcher.submit("b", record(log, "step b"), tag="step")
+    await dispatcher.submit("a", record(log, "level a"))
+    dispatcher.drop_waiting(["a"], "step")
+    release.set()
+    await drain(dispatcher)
+
+    assert sorted(log) == ["level a", "step b"]
+
+
+async def test_dropping_waiting_commands_unblocks_submitters() -> None:
+    dispatcher = CommandDispatcher(
+        concurrency=1, max_pending=2, policy=OverflowPolicy.BLOCK
+    )
+    release = await block(dispatcher)
+    log: list[str] = []
+    await dispatcher.submit("a", record(log, "step a"), tag="step")
+    await dispatcher.submit("b", record(log, "step b"), tag="step")
+
+    blocked = asyncio.create_task(dispatcher.submit("c", record(log, "c")))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    dispatcher.drop_waiting(["a"], "step")
+    assert await asyncio.wait_for(blocked, 1)
+    release.set()
+    await drain(dispatcher)
+    assert sorted(log) == ["c", "step b"]
+
+
+async def test_superseding_unblocks_submitters() -> None:
+    dispatcher = CommandDispatcher(
+        concurrency=1, max_pending=2, policy=OverflowPolicy.BLOCK
+    )
+    release = await block(dispatcher)
+    log: list[str] = []
+    await dispatcher.submit("a", record(log, "a"))
+    await dispatcher.submit("b", record(log, "b"))
+
+    blocked = asyncio.create_task(dispatcher.submit("c", record(log, "c")))
+    await asyncio.sleep(0.01)
+    await dispatcher.submit(
+        "network", record(log, "network"), targets=["a", "b"], supersede=True
+    )
+    assert await asyncio.wait_for(blocked, 1)
+    release.set()
+    await drain(dispatcher)
+    assert sorted(log) == ["c", "network"]
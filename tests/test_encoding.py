@@ -0,0 +1,133 @@
+import json
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+
+from casambi_server.events import UnitEventPublisher
+from casambi_server.publisher import RETAINED
+from custom_components.casambi_mqtt.entities.codec import (
+    decode_unit,
+    decode_unit_metadata,
+    decode_unit_status,
+    decode_unit_type,
+    pack_unit,
+    pack_unit_metadata,
+    pack_unit_status,
+    pack_unit_type,
+)
+from custom_components.casambi_mqtt.entities.commands import Batch, SetLevel
+from custom_components.casambi_mqtt.entities.encoding import (
+    is_msgpack,
+    loads,
+    packb,
+    unpackb,
+)
+from custom_components.casambi_mqtt.entities.entities import Unit
+
+
+def test_loads_tells_the_encodings_apart() -> None:
+    value = {"address": "a", "levels": [0, 255], "on": True, "ttl": 1.5}
+
+    assert loads(json.dumps(value)) == value
+    assert loads(json.dumps(value).encode()) == value
+    assert loads(packb(value)) == value
+    assert is_msgpack(packb(value))
+    assert not is_msgpack(json.dumps(value).encode())
+
+
+@pytest.mark.parametrize("payload", [b"\xc1", b"\x92\x01", b"\x91\x01\x02"])
+def test_invalid_msgpack_raises_value_error(payload: bytes) -> None:
+    with pytest.raises(ValueError, match="Invalid MessagePack payload"):
+        unpackb(payload)
+
+
+@pytest.mark.parametrize(
+    ("part", "pack", "decode"),
+    [
+        (Unit.status, pack_unit_status, decode_unit_status),
+        (Unit.metadata, pack_unit_metadata, decode_unit_metadata),
+        (lambda unit: unit.unit_type, pack_unit_type, decode_unit_type),
+        (lambda unit: unit, pack_unit, decode_unit),
+    ],
+    ids=["status", "metadata", "type", "unit"],
+)
+def test_msgpack_round_trip(
+    unit: Unit,
+    part: Callable[[Unit], Any],
+    pack: Callable[[Any], bytes],
+    decode: Callable[[bytes], Any],
+) -> None:
+    assert decode(pack(part(unit))) == part(unit)
+
+
+def test_msgpack_status_is_compact(unit: Unit) -> None:
+    assert len(pack_unit_status(unit.status())) == 5
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        SetLevel("aa:bb:cc:dd:ee:01", 128, correlation_id="c0ffee01", ttl=2.5),
+        Batch(values={f"aa:bb:cc:dd:ee:{i:02x}": i for i in range(20)}),
+    ],
+    ids=lambda c: type(c).__name__,
+)
+def test_commands_round_trip_as_msgpack(command: SetLevel | Batch) -> None:
+    assert type(command).from_json(command.to_msgpack()) == command
+
+
+class RecordingPublisher:
+    def __init__(self) -> None:
+        self.published: dict[str, str | bytes] = {}
+
+    def publish(
+        self, topic: str, payload: str | bytes, delivery: Any, *, force: bool = False
+    ) -> None:
+        self.published[topic] = payload
+
+
+@pytest.mark.parametrize("packed", [False, True])
+def test_legacy_events_and_unit_topics_stay_json(unit: Unit, *, packed: bool) -> None:
+    publisher = RecordingPublisher()
+    events = UnitEventPublisher(
+        publisher, "casambi/n", legacy_events=True, state=RETAINED, metadata=RETAINED
+    )
+    events.packed = packed
+    events.publish(unit)
+
+    legacy = publisher.published[f"casambi/n/events/{unit.address}"]
+    state = publisher.published[f"casambi/n/state/{unit.address}"]
+    assert Unit.from_json(legacy) == unit
+    assert isinstance(state, str)
+    assert decode_unit_status(state) == unit.status()
+
+
+def test_packed_copies_have_their_own_topics(unit: Unit) -> None:
+    publisher = RecordingPublisher()
+    events = UnitEventPublisher(
+        publisher, "casambi/n", legacy_events=False, state=RETAINED, metadata=RETAINED
+    )
+    events.publish(unit)
+    assert not any(
+        topic.startswith("casambi/n/msgpack/") for topic in publisher.published
+    )
+
+    events.packed = True
+    events.reset()
+    events.publish(unit)
+
+    packed = {
+        topic: payload
+        for topic, payload in publisher.published.items()
+        if topic.startswith("casambi/n/msgpack/")
+    }
+    assert set(packed) == {
+        f"casambi/n/msgpack/types/{unit.unit_type.id}",
+        f"casambi/n/msgpack/units/{unit.address}",
+        f"casambi/n/msgpack/state/{unit.address}",
+    }
+    assert all(is_msgpack(payload) for payload in packed.values())
+    assert decode_unit_status(packed[f"casambi/n/msgpack/state/{unit.address}"]) == (
+        unit.status()
+    )
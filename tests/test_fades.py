@@ -0,0 +1,127 @@
+import asyncio
+from collections.abc import AsyncIterator, Awaitable, Callable
+
+import pytest
+
+from casambi_server.fades import Fade, FadeEngine
+
+
+@pytest.fixture
+async def engine() -> AsyncIterator[FadeEngine]:
+    engine = FadeEngine(rate=200)
+    yield engine
+    await engine.close()
+
+
+def recorder(
+    steps: list[tuple[int, bool]],
+) -> Callable[[int, bool], Awaitable[None]]:
+    async def step(level: int, final: bool) -> None:  # noqa: FBT001
+        steps.append((level, final))
+
+    return step
+
+
+async def finished(engine: FadeEngine) -> None:
+    for _ in range(100):
+        if not engine.active:
+            return
+        await asyncio.sleep(0.01)
+    pytest.fail("Fades did not finish")
+
+
+async def test_a_fade_ramps_to_its_target(engine: FadeEngine) -> None:
+    steps: list[tuple[int, bool]] = []
+    engine.start(Fade("n", "a", 0, 100, 0.1, recorder(steps)))
+    await finished(engine)
+
+    levels = [level for level, _ in steps]
+    assert len(steps) > 2
+    assert levels == sorted(levels)
+    assert steps[-1] == (100, True)
+    assert not any(final for _, final in steps[:-1])
+    assert (engine.started, engine.completed) == (1, 1)
+
+
+async def test_a_fade_without_duration_writes_the_target(engine: FadeEngine) -> None:
+    steps: list[tuple[int, bool]] = []
+    engine.start(Fade("n", "a", 0, 100, 0, recorder(steps)))
+    await finished(engine)
+
+    assert steps == [(100, True)]
+
+
+async def test_a_new_fade_cancels_the_one_of_the_unit(engine: FadeEngine) -> None:
+    first: list[tuple[int, bool]] = []
+    second: list[tuple[int, bool]] = []
+    cancelled: list[str] = []
+    engine.start(
+        Fade("n", "a", 0, 100, 10, recorder(first), lambda: cancelled.append("a"))
+    )
+    engine.start(Fade("n", "a", 0, 50, 0.05, recorder(second)))
+    await finished(engine)
+
+    assert cancelled == ["a"]
+    assert engine.cancelled == 1
+    assert second[-1] == (50, True)
+    assert all(not final for _, final in first)
+
+
+async def test_cancel_a_network(engine: FadeEngine) -> None:
+    steps: list[tuple[int, bool]] = []
+    cancelled: list[str] = []
+    for network, address in (("n", "a"), ("n", "b"), ("other", "a")):
+        engine.start(
+            Fade(
+                network,
+                address,
+                0,
+                100,
+                0.05 if network == "other" else 10,
+                recorder(steps),
+                lambda address=address: cancelled.append(address),
+            )
+        )
+    engine.cancel("n")
+    await finished(engine)
+
+    assert sorted(cancelled) == ["a", "b"]
+    assert engine.completed == 1
+
+
+async def test_concurrent_fades_share_the_writes(engine: FadeEngine) -> None:
+    steps: dict[str, list[tuple[int, bool]]] = {address: [] for address in "abc"}
+    for address, writes in steps.items():
+        engine.start(Fade("n", address, 0, 255, 0.1, recorder(writes)))
+    await finished(engine)
+
+    assert all(writes[-1] == (255, True) for writes in steps.values())
+    assert engine.completed == 3
+
+
+async def test_a_broken_fade_does_not_stop_the_engine(engine: FadeEngine) -> None:
+    steps: list[tuple[int, bool]] = []
+
+    async def fail(level: int, final: bool) -> None:  # noqa: FBT001
+        raise RuntimeError
+
+    # A fade whose level cannot be computed, and one whose writes fail.
+    engine.start(Fade("n", "broken", None, 100, 1, recorder(steps)))
+    engine.start(Fade("n", "failing", 0, 100, 0.05, fail))
+    engine.start(Fade("n", "a", 0, 100, 0.05, recorder(steps)))
+    await finished(engine)
+
+    assert steps[-1] == (100, True)
+    assert engine.completed == 2
+    assert engine._task is not None
+
+
+async def test_the_engine_starts_again_after_closing(engine: FadeEngine) -> None:
+    steps: list[tuple[int, bool]] = []
+    engine.start(Fade("n", "a", 0, 100, 10, recorder(steps)))
+    await engine.close()
+
+    engine.start(Fade("n", "a", 0, 100, 0, recorder(steps)))
+    await finished(engine)
+
+    assert steps[-1] == (100, True)
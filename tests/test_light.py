@@ -0,0 +1,79 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from custom_components.casambi_mqtt import light
+from custom_components.casambi_mqtt.const import ATTR_LAST_COMMAND_FAILED
+from custom_components.casambi_mqtt.entities.entities import Unit
+from custom_components.casambi_mqtt.light import CasambiMqttLight
+
+
+class FakeBatcher:
+    """Records the levels sent, without an answer from the server."""
+
+    def __init__(self) -> None:
+        self.levels: list[int | None] = []
+
+    async def set_level(self, address: str, level: int | None) -> None:
+        await asyncio.sleep(0)
+        self.levels.append(level)
+
+
+@pytest.fixture
+def timers(monkeypatch: pytest.MonkeyPatch) -> list[object]:
+    """Record the revert timers instead of starting them."""
+    actions: list[object] = []
+
+    def call_later(hass: object, delay: float, action: object) -> object:
+        actions.append(action)
+        return lambda: actions.remove(action)
+
+    monkeypatch.setattr(light, "async_call_later", call_later)
+    return actions
+
+
+@pytest.fixture
+def entity(unit: Unit) -> CasambiMqttLight:
+    data = SimpleNamespace(
+        network_available=True,
+        state_write_interval=0,
+        optimistic=True,
+        optimistic_timeout=5,
+        batcher=FakeBatcher(),
+    )
+    entity = CasambiMqttLight(SimpleNamespace(), "events/a", data, unit)
+    entity.async_write_ha_state = lambda: None
+    return entity
+
+
+async def test_a_new_level_waits_for_the_server(
+    entity: CasambiMqttLight, timers: list[object]
+) -> None:
+    await entity.async_turn_on(brightness=100)
+
+    assert entity.brightness == 100
+    assert len(timers) == 1
+
+
+async def test_a_missing_confirmation_reverts(
+    entity: CasambiMqttLight, timers: list[object]
+) -> None:
+    await entity.async_turn_on(brightness=100)
+    (revert,) = timers
+    revert(None)
+
+    assert entity.brightness == 180
+    assert entity.extra_state_attributes[ATTR_LAST_COMMAND_FAILED]
+
+
+@pytest.mark.parametrize("kwargs", [{"brightness": 180}, {}])
+async def test_the_current_level_is_confirmed_right_away(
+    entity: CasambiMqttLight, timers: list[object], kwargs: dict
+) -> None:
+    await entity.async_turn_on(**kwargs)
+
+    assert entity.is_on
+    assert entity.brightness == 180
+    assert timers == []
+    assert not entity.extra_state_attributes[ATTR_LAST_COMMAND_FAILED]
@@ -0,0 +1,231 @@
+import asyncio
+from collections.abc import AsyncIterator
+from typing import Any
+
+import aiomqtt
+import pytest
+from paho.mqtt.client import MQTT_ERR_NO_CONN
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from casambi_server.publisher import BrokerClient, Delivery, Publisher
+
+QUEUED = Delivery(latest=False, retain=False)
+
+
+class FakeClient:
+    """Records what is published, raising the queued errors first."""
+
+    def __init__(self) -> None:
+        self.published: list[tuple[str, bytes, Any]] = []
+        self.errors: list[Exception] = []
+
+    async def publish(
+        self, topic: str, *, payload: bytes, qos: int, retain: bool, properties: Any
+    ) -> None:
+        await asyncio.sleep(0)
+        if self.errors:
+            raise self.errors.pop(0)
+        self.published.append((topic, payload, properties))
+
+    def payloads(self) -> list[bytes]:
+        return [payload for _, payload, _ in self.published]
+
+
+@pytest.fixture
+def client() -> FakeClient:
+    return FakeClient()
+
+
+@pytest.fixture
+async def publisher(client: FakeClient) -> AsyncIterator[Publisher]:
+    publisher = Publisher(client, max_in_flight=2, max_pending=4)
+    yield publisher
+    await publisher.close()
+
+
+async def settle() -> None:
+    """Let the workers publish what is queued."""
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+async def test_latest_payload_per_topic_wins(
+    publisher: Publisher, client: FakeClient
+) -> None:
+    for payload in ("1", "2", "3"):
+        publisher.publish("state/a", payload)
+    publisher.start()
+    await settle()
+
+    assert client.payloads() == [b"3"]
+    assert publisher.replaced == 2
+
+
+async def test_unchanged_payload_is_suppressed(
+    publisher: Publisher, client: FakeClient
+) -> None:
+    publisher.start()
+    publisher.publish("state/a", "1")
+    await settle()
+    publisher.publish("state/a", "1")
+    await settle()
+    publisher.publish("state/a", "1", force=True)
+    await settle()
+
+    assert client.payloads() == [b"1", b"1"]
+    assert publisher.suppressed == 1
+
+
+async def test_a_topic_being_published_is_not_overtaken(
+    publisher: Publisher, client: FakeClient
+) -> None:
+    publisher.start()
+    publisher.publish("state/a", "1")
+    await asyncio.sleep(0)
+    assert publisher.in_flight == 1
+    publisher.publish("state/a", "2")
+    publisher.publish("state/a", "3")
+    await settle()
+
+    assert client.payloads() == [b"1", b"3"]
+
+
+async def test_queued_messages_are_all_published_in_order(
+    publisher: Publisher, client: FakeClient
+) -> None:
+    for payload in ("1", "2", "3"):
+        publisher.publish("errors", payload, QUEUED)
+    publisher.start()
+    await settle()
+
+    assert client.payloads() == [b"1", b"2", b"3"]
+
+
+async def test_a_full_queue_drops_queued_messages_before_state(
+    publisher: Publisher, client: FakeClient
+) -> None:
+    publisher.publish("state/a", "a")
+    publisher.publish("errors", "1", QUEUED)
+    publisher.publish("state/b", "b")
+    publisher.publish("errors", "2", QUEUED)
+    publisher.publish("state/c", "c")
+    publisher.start()
+    await settle()
+
+    assert sorted(client.payloads()) == [b"2", b"a", b"b", b"c"]
+    assert publisher.dropped == 1
+
+
+async def test_a_message_is_requeued_when_the_connection_is_lost(
+    publisher: Publisher, client: FakeClient
+) -> None:
+    client.errors.append(aiomqtt.MqttCodeError(MQTT_ERR_NO_CONN))
+    publisher.start()
+    publisher.publish("state/a", "1")
+    publisher.publish("errors", "lost", QUEUED)
+    await settle()
+
+    assert not publisher.online
+    assert publisher.requeued == 1
+    # Replaced while offline, only the latest state is published.
+    publisher.publish("state/a", "2")
+    publisher.resume()
+    await settle()
+
+    assert sorted(client.payloads()) == [b"2", b"lost"]
+
+
+async def test_other_errors_do_not_stop_the_workers(
+    publisher: Publisher, client: FakeClient
+) -> None:
+    client.errors += [ValueError("invalid payload"), aiomqtt.MqttError("refused")]
+    publisher.start()
+    for topic in ("state/a", "state/b", "state/c"):
+        publisher.publish(topic, "1")
+    await settle()
+
+    assert client.payloads() == [b"1"]
+    assert publisher.failed == 2
+    assert publisher.online
+    publisher.publish("state/a", "2")
+    await settle()
+    assert client.payloads() == [b"1", b"2"]
+
+
+ALIASED = Delivery(qos=0, alias=True)
+
+
+async def publish_aliased(
+    topic_alias_maximum: int, broker_topic_alias_maximum: int, topics: list[str]
+) -> list[tuple[str, Any]]:
+    """Get the topics and topic aliases the given topics are published with."""
+    client = FakeClient()
+    publisher = Publisher(
+        client, 1, 16, mqtt5=True, topic_alias_maximum=topic_alias_maximum
+    )
+    publisher.reset(broker_topic_alias_maximum)
+    publisher.start()
+    for i, topic in enumerate(topics):
+        publisher.publish(topic, str(i), ALIASED)
+        await settle()
+    await publisher.close()
+    return [
+        (topic, None if properties is None else properties.TopicAlias)
+        for topic, _, properties in client.published
+    ]
+
+
+async def test_a_topic_is_sent_once_with_its_alias() -> None:
+    published = await publish_aliased(4, 4, ["state/a", "state/b", "state/a"])
+
+    assert published == [("state/a", 1), ("state/b", 2), ("", 1)]
+
+
+async def test_the_least_recently_used_alias_is_reassigned() -> None:
+    published = await publish_aliased(
+        2, 2, ["state/a", "state/b", "state/a", "state/c", "state/b"]
+    )
+
+    assert published == [
+        ("state/a", 1),
+        ("state/b", 2),
+        ("", 1),
+        ("state/c", 2),
+        ("state/b", 1),
+    ]
+
+
+async def test_aliases_are_capped_by_the_broker() -> None:
+    published = await publish_aliased(10, 1, ["state/a", "state/b", "state/a"])
+
+    assert published == [("state/a", 1), ("state/b", 1), ("state/a", 1)]
+
+
+async def test_no_aliases_without_broker_support() -> None:
+    published = await publish_aliased(10, 0, ["state/a", "state/a"])
+
+    assert published == [("state/a", None), ("state/a", None)]
+
+
+async def test_only_qos_0_messages_get_an_alias(client: FakeClient) -> None:
+    publisher = Publisher(client, 1, 16, mqtt5=True, topic_alias_maximum=4)
+    publisher.reset(4)
+    publisher.start()
+    publisher.publish("state/a", "1", Delivery(qos=1, alias=True, expiry=60))
+    await settle()
+    await publisher.close()
+
+    ((topic, _, properties),) = client.published
+    assert topic == "state/a"
+    assert properties.MessageExpiryInterval == 60
+    assert not hasattr(properties, "TopicAlias")
+
+
+async def test_broker_client_reads_the_topic_alias_maximum() -> None:
+    client = BrokerClient("localhost", protocol=aiomqtt.ProtocolVersion.V5)
+    assert client.topic_alias_maximum == 0
+
+    client.connack_properties = Properties(PacketTypes.CONNACK)
+    client.connack_properties.TopicAliasMaximum = 5
+    assert client.topic_alias_maximum == 5
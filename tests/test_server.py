@@ -0,0 +1,86 @@
+import asyncio
+from collections.abc import AsyncIterator
+
+import pytest
+
+import server
+from benchmarks.fake_casambi import FakeCasambi
+from casambi_server.publisher import Publisher
+from custom_components.casambi_mqtt.entities.codec import decode_snapshot
+from custom_components.casambi_mqtt.entities.encoding import is_msgpack
+from custom_components.casambi_mqtt.entities.entities import UnitState
+
+
+class FakeClient:
+    """Records what is published."""
+
+    def __init__(self) -> None:
+        self.published: list[tuple[str, bytes]] = []
+
+    async def publish(self, topic: str, *, payload: bytes, **kwargs: object) -> None:
+        self.published.append((topic, payload))
+
+
+@pytest.fixture
+def client() -> FakeClient:
+    return FakeClient()
+
+
+@pytest.fixture
+async def ctx(client: FakeClient) -> AsyncIterator[server.Context]:
+    publisher = Publisher(client, max_in_flight=1, max_pending=64)
+    config = server.NetworkConfig("test", None, None)
+    yield server.create_context(config, FakeCasambi(units=2, scenes=1), publisher)
+    await publisher.close()
+
+
+async def publish(ctx: server.Context) -> None:
+    """Let the publisher send what is queued."""
+    ctx.publisher.start()
+    for _ in range(50):
+        await asyncio.sleep(0)
+
+
+async def test_a_unit_without_state_is_served(
+    ctx: server.Context, client: FakeClient
+) -> None:
+    assert ctx.casa.units[0].state is None
+
+    ctx.load()
+    server.publish_snapshot(ctx)
+    await publish(ctx)
+
+    units, _ = ctx.entities()
+    assert [unit.state for unit in units] == [UnitState(None)] * 2
+    ((topic, payload),) = client.published
+    assert topic == ctx.topic("snapshot")
+    snapshot = decode_snapshot(payload)
+    assert [status.dimmer for _, status in snapshot.units] == [None, None]
+
+
+async def test_msgpack_is_published_next_to_json(
+    ctx: server.Context, client: FakeClient
+) -> None:
+    ctx.load()
+    for unit in ctx.casa.units:
+        ctx.on_unit_changed(unit)
+    await publish(ctx)
+    json_topics = {topic for topic, _ in client.published}
+    client.published.clear()
+
+    server.set_encoding(ctx, b"msgpack")
+    await publish(ctx)
+
+    base = ctx.topic("msgpack")
+    assert {topic for topic, _ in client.published} == {
+        topic.replace(ctx.topic(), base, 1) for topic in json_topics
+    }
+    assert all(is_msgpack(payload) for _, payload in client.published)
+
+    # Another client selecting JSON stops the copies, not the JSON topics.
+    server.set_encoding(ctx, b"json")
+    client.published.clear()
+    ctx.unit_events.publish(ctx.entities()[0][0], force=True)
+    await publish(ctx)
+    assert client.published
+    assert not any(topic.startswith(base) for topic, _ in client.published)